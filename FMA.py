@@ -25,7 +25,7 @@ import xlsxwriter
 import PySimpleGUI as sg
 import traceback
 
-from utils import draggable_lines
+from utils import review_plot
 
 
 
@@ -142,12 +142,10 @@ def draw_plot(i, samples, FMA, fig, ax, cid):
             samples[i].times.append(float(FMA[k][0]))
             samples[i].concentrations.append(float(FMA[k][1]))
 
-    fig.clear()
-    ax = fig.add_subplot()
-    plt.plot(samples[i].times, samples[i].concentrations, linewidth = 2.0)
-
-    line_L = draggable_lines(ax, samples[i].peak_start_time, [samples[i].start_time, samples[i].start_time + len(samples[i].concentrations)], plt.gca().get_ylim())   # left draggable boundary line
-    line_R = draggable_lines(ax, samples[i].peak_end_time, [samples[i].start_time, samples[i].start_time + len(samples[i].concentrations)], plt.gca().get_ylim())     # right draggable boundary line
+    # the figure's artists are created on the first draw and updated in place afterwards
+    plot = review_plot(fig)
+    plot.plot(ax, samples[i].times, samples[i].concentrations)
+    line_L, line_R = plot.cursors(ax, samples[i].peak_start_time, samples[i].peak_end_time, [samples[i].start_time, samples[i].start_time + len(samples[i].concentrations)])   # left and right draggable boundary lines
 
     # if currently on the last sample, change header information, otherwise set title to user controls
     if i == len(samples) - 1:
@@ -159,8 +157,7 @@ def draw_plot(i, samples, FMA, fig, ax, cid):
     ax.set(ylabel = "CH4 concentration (ppm)")  # y axis label
     fig.canvas.mpl_disconnect(cid)
     cid = fig.canvas.mpl_connect('key_press_event', lambda event: on_press(event, i, samples, line_L, line_R, FMA, fig, ax, cid))   # connect key press event  
-    ax.grid(True)
-    fig.canvas.draw()
+    plot.draw()
 
 
 # obtains peak bounds from user interactive plots
@@ -168,9 +165,7 @@ def obtain_peaks(samples, FMA):
     i = 0
     fig, ax = plt.subplots()
     fig.set_size_inches(6,6)
-    line_L = draggable_lines(ax, samples[i].start_time, [samples[i].start_time, samples[i].end_time], plt.gca().get_ylim())   # left draggable boundary line
-    line_R = draggable_lines(ax, samples[i].end_time, [samples[i].start_time, samples[i].end_time], plt.gca().get_ylim())     # right draggable boundary line
-    cid = fig.canvas.mpl_connect('key_press_event', lambda event: on_press(event, i, samples, line_L, line_R, FMA, fig, ax, cid))   # connect key press event
+    cid = ''
     plt.grid(True)
     plt.ion()
     draw_plot(i, samples, FMA, fig, ax, cid)
@@ -11,7 +11,7 @@ from pdfminer import high_level
 import PySimpleGUI as sg
 import traceback
 
-from utils import linear_regression
+from utils import linear_regressions, export_tables, EXPORT_FORMATS
         
 
 
@@ -163,38 +163,47 @@ def process_PDFs(samples, standards, sample_rows, PDFs, window, regex, count):
     return samples, standards, sample_rows, longest_file_name, dates
 
 
-# calculate flux for each sample, recursively navigate down to the bottom layer for time and calculate flux
-def flux_helper(val, count, current):
+# collect the time series of each sample, recursively navigate down to the bottom layer for time
+def flux_helper(val, count, current, samples, Xs, Ys):
     if current > count:
         for k, v in val.items():
-            flux_helper(v, count, current + 1)
+            flux_helper(v, count, current + 1, samples, Xs, Ys)
     else:
         for k, v in val.items():
-            v["RoC (ppm/min)"] = []
-            v["R2"] = []
+            samples.append(v)
             for i in range(0, 5):
-                X = []
-                Y = []
-                for time in v:
-                    if time == "RoC (ppm/min)" or time == "R2":
-                        continue
-                    
-                    X.append(float(time))
-                    Y.append(float(v[time][i]))
-
                 try:
-                    m, b, R2 = linear_regression(X, Y)
-                    v["RoC (ppm/min)"].append(round(m, 3)) 
-                    v["R2"].append(round(R2, 3))
+                    X = [float(time) for time in v]
+                    Y = [float(v[time][i]) for time in v]
                 except:
-                    v["RoC (ppm/min)"].append('')
-                    v["R2"].append('')
+                    # missing concentrations can't be fit
+                    X = []
+                    Y = []
+                Xs.append(X)
+                Ys.append(Y)
 
 
-# initiate recursive flux calculation
+# initiate recursive flux calculation, every series is fit in one batch
 def flux(something, count):
+    samples = []
+    Xs = []
+    Ys = []
     for k, v in something.items():
-        flux_helper(v, count - 1, 0)
+        flux_helper(v, count - 1, 0, samples, Xs, Ys)
+
+    slopes, _, RSQs, _, _ = linear_regressions(Xs, Ys)
+
+    for j in range(len(samples)):
+        v = samples[j]
+        v["RoC (ppm/min)"] = []
+        v["R2"] = []
+        for i in range(j*5, j*5 + 5):
+            if isnan(slopes[i]) or isnan(RSQs[i]):
+                v["RoC (ppm/min)"].append('')
+                v["R2"].append('')
+            else:
+                v["RoC (ppm/min)"].append(round(float(slopes[i]), 3))
+                v["R2"].append(round(float(RSQs[i]), 3))
 
 
 # flatten sample dictionary into list of lists for excel reporting
@@ -217,8 +226,37 @@ def flatten_helper(val, key_list, list_o_list):
         list_o_list.append(key_list + val)
         
         
-# output results to excel sheet
-def output_data(samples, standards, longest_file_name, columns, dates, count):
+# the standards and the flattened sample rows (including rate of change and R2 rows) as columns for utils.export_tables
+def sample_tables(samples, standards, columns, count):
+    gases = ['Methane', 'Carbon Dioxide', 'Oxygen', 'Nitrogen', 'Nitrous Oxide']
+    gas_columns = ['methane_ppm', 'carbon_dioxide_ppm', 'oxygen_percent', 'nitrogen_percent', 'nitrous_oxide_ppm']
+    names = (list(columns) + ['column %i' %(k + 1) for k in range(len(columns), count)])[:count]
+
+    standard_table = {key: [] for key in ['standard'] + gas_columns + ['file']}
+    for standard in standards:
+        for k in range(len(standards[standard]['Methane'])):
+            standard_table['standard'].append(standard)
+            for gas, key in zip(gases, gas_columns):
+                standard_table[key].append(standards[standard][gas][k])
+            standard_table['file'].append(standards[standard]['File'][k])
+
+    # missing concentrations are NaN, rate of change and R2 rows have no file
+    sample_table = {key: [] for key in ['date'] + names + gas_columns + ['file']}
+    for row in samples:
+        if str(row[0]).lower() == 'blank':
+            continue
+        sample_table['date'].append(str(row[0]))
+        for name, value in zip(names, row[1:count + 1]):
+            sample_table[name].append(str(value))
+        concentrations = row[count + 1:]
+        for k in range(len(gas_columns)):
+            sample_table[gas_columns[k]].append(float(concentrations[k]) if k < len(concentrations) and concentrations[k] != '' else float('nan'))
+        sample_table['file'].append(concentrations[5] if len(concentrations) > 5 else '')
+    return {'standards': standard_table, 'samples': sample_table}
+
+
+# output results to excel sheet, and optionally exports the sample tables in one of utils.EXPORT_FORMATS next to it
+def output_data(samples, standards, longest_file_name, columns, dates, count, export=None):
     
     # column number map for flux formula
     column_number_map = {
@@ -236,6 +274,8 @@ def output_data(samples, standards, longest_file_name, columns, dates, count):
 
     # get output file location from user
     out = tkinter.filedialog.asksaveasfilename(defaultextension='.xlsx')
+    if export:
+        print("Exported", ", ".join(export_tables(out, sample_tables(samples, standards, columns, count), export)))
     workbook = xlsxwriter.Workbook(out)
 
     # setting up formatting for legibility 
@@ -358,6 +398,7 @@ def GC():
         [sg.Text('Columns', size=(15, 1), background_color='#0680BF'), sg.InputText(key='-COLS-')],
         [sg.Text('Standards', size=(15, 1), background_color='#0680BF'), sg.InputText(key='-STANDARDS-')],
         [sg.Checkbox("Calculate flux?", key="-FLUX-", background_color='#0680BF', enable_events=True)],
+        [sg.Text('Also export tables:', size=(15, 1), background_color='#0680BF'), sg.Combo(['none'] + list(EXPORT_FORMATS), default_value='none', readonly=True, key='-EXPORT-')],
         [sg.Text("", background_color='#0680BF')],
         [sg.Submit(), sg.Cancel()]]
 
@@ -452,7 +493,7 @@ def GC():
 
             print("Outputting results")
             # output data to excel file
-            out = output_data(samples, standards, longest_file_name, columns, dates, count)
+            out = output_data(samples, standards, longest_file_name, columns, dates, count, values['-EXPORT-'] if values['-EXPORT-'] != 'none' else None)
 
         except Exception as e:
             window.close()
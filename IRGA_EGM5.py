@@ -2,45 +2,65 @@ import traceback
 import glob
 import matplotlib.pyplot as plt
 import matplotlib.lines as lines
-from math import floor
 import sys
+import numpy as np
 import xlsxwriter
 import tkinter
 import tkinter.filedialog
-from matplotlib.offsetbox import AnchoredText
 from matplotlib.widgets import TextBox
 import PySimpleGUI as sg
 import os
 import re
 
-from utils import draggable_lines, linear_regression
+from utils import (
+    review_plot, report_column, export_tables, EXPORT_FORMATS, unique_names,
+    PrefixSums, select_models, FLUX_MODELS, bootstrap_cis, BOOTSTRAP_RESAMPLES, CONFIDENCE_LEVEL,
+    Cuts, cut_offsets, data_loss,
+)
 
 class Flux:
     def __init__(self, name, CO2, times, PARs, temps, volume):
         self.name = name
-        self.CO2 = CO2
-        self.times = times
+        self.CO2 = np.array(CO2, dtype=float)
+        self.times = np.array(times, dtype=float)
         self.temps = temps
         self.PARs = PARs
         self.temp = sum(temps)/len(temps)
         self.PAR = sum(PARs)/len(PARs)
         self.volume = volume
 
-        self.pruned_CO2 = CO2
-        self.pruned_times = times
-
+        self.pruned_columns = {}    # pruned times and CO2 aligned with the original data, for reporting
         self.time_offsets = []
         self.CO2_offsets = []
 
         self.original_length = 0    # original length of flux data
         self.data_loss = 0          # total percent of data set pruned
         
-        self.cuts = []
+        self.cuts = Cuts(len(times))    # every user data cut, the pruned data sets are derived from these
+        self.sums = None        # prefix sums of the original data, for fast regressions of the pruned data
 
+        self.model = 'linear'   # flux model fit to the data, see utils.FLUX_MODELS
         self.RSQ = 0        # R^2 for final rate calculation
+        self.CI = None      # bootstrap confidence interval (low, high) of the NEE, when requested
         self.RoC = 0        # rate of change (concentration/minute)
         self.NEE = 0
 
+    # pruned data sets are derived from the original data and the cuts
+    @property
+    def pruned_times(self):
+        # times are offset by every cut, including cuts at the start of the data
+        return self.cuts.prune(self.times, interior_only=False)
+
+    @property
+    def pruned_CO2(self):
+        return self.cuts.prune(self.CO2)
+
+    # linear regression of the pruned CO2 over the pruned times, O(k) in the number of cuts
+    def regression(self):
+        if self.sums is None:
+            self.sums = PrefixSums(self.times, self.CO2)
+        return self.sums.regression(self.times, self.CO2, self.cuts, x_interior_only=False)
+
 
 def on_press(event, i, fluxes, line_L, line_R, fig, ax, cid):
     sys.stdout.flush()
@@ -48,54 +68,29 @@ def on_press(event, i, fluxes, line_L, line_R, fig, ax, cid):
     # if enter key pressed, cut data according to currently set cut bounds
     if event.key == 'enter':
 
-        # get cut indices from left and right lines
-        time_L = floor(line_L.line.get_xdata()[0])
-        time_R = floor(line_R.line.get_xdata()[0])
+        # cut the data between the left and right lines, tracking the bounds of each cut
+        time_L = line_L.line.get_xdata()[0]
+        time_R = line_R.line.get_xdata()[0]
 
-        time_L_index = fluxes[i].pruned_times.index(time_L)
-        time_R_index = fluxes[i].pruned_times.index(time_R)
-        
-        if (time_R_index - time_L_index + 1) >= len(fluxes[i].pruned_times):
+        if not fluxes[i].cuts.cut(fluxes[i].pruned_times, time_L, time_R):
             print("Error! Can't cut entire data set, please narrow your selection with the two red cursors")
         else:
-            # if both indices exist, set CO2 delta as the gap between the last entry before and first entry after the cut
-            # this is for the sake of maintaining a linear relationship, it adds a fixed offset to each entry after the cut
-            # if the cut is at the boundary of the data, the offset will be set to zero (i.e. the cut isn't in the middle of the data)
-            if time_L_index and time_R_index:
-                CO2_delta = fluxes[i].pruned_CO2[time_L_index] - fluxes[i].pruned_CO2[time_R_index]
-            else:
-                CO2_delta = 0
-
-            # obtain time offset as the time elapsed by the cut
-            # for the sake of maintaining a linear relationship, adds a fixed offset
-            time_delta = time_R - time_L
-            fluxes[i].cuts.append([time_L_index, time_R_index])
-
-            times = []
-            CO2 = []
-
-            # if entry is not in the cut, add it to a new set
-            for k in range(len(fluxes[i].pruned_times)):
-                if fluxes[i].pruned_times[k] < time_L:
-                    times.append(fluxes[i].pruned_times[k])
-                    CO2.append(fluxes[i].pruned_CO2[k])
-                if fluxes[i].pruned_times[k] > time_R:
-                    times.append(fluxes[i].pruned_times[k] - time_delta)
-                    CO2.append(fluxes[i].pruned_CO2[k] + CO2_delta)
-            
-            # update flux pruned sets with cut sets
-            fluxes[i].pruned_times = times
-            fluxes[i].pruned_CO2 = CO2
-
             # refresh the plot
             draw_plot(i, fluxes, fig, ax, cid)
 
-    # if r key pressed, reset data
+    # if r key pressed, reset data (the cuts can still be restored one at a time with redo)
     if event.key == 'r':
-        fluxes[i].pruned_times = fluxes[i].times
-        fluxes[i].pruned_CO2 = fluxes[i].CO2
-        fluxes[i].cuts = []
-        draw_plot(i, fluxes, fig, ax, cid)
+        if fluxes[i].cuts.reset():
+            draw_plot(i, fluxes, fig, ax, cid)
+
+    # z key undoes the most recent cut, y key redoes the most recently undone cut
+    if event.key == 'z':
+        if fluxes[i].cuts.undo():
+            draw_plot(i, fluxes, fig, ax, cid)
+
+    if event.key == 'y':
+        if fluxes[i].cuts.redo():
+            draw_plot(i, fluxes, fig, ax, cid)
     
     # right arrow key moves to the next flux, or exits if currently on the last flux
     if event.key == 'right':
@@ -172,36 +167,28 @@ def input_data(folder, field_file):
 
 def draw_plot(i, fluxes, fig, ax, cid):
 
-    fig.clear()
-    ax = fig.add_subplot()
-
-    print(fluxes[i].pruned_times)
-    print(fluxes[i].pruned_CO2)
-    m, b, R2 = linear_regression(fluxes[i].pruned_times, fluxes[i].pruned_CO2)
-    at = AnchoredText(
-        r"$R^{2}$ = " + str(round(R2, 5)), prop=dict(size=15), frameon=True, loc='upper center')
-    at.patch.set_alpha(0.5)
-    at.patch.set_boxstyle("round,pad=0.,rounding_size=0.2")
-    ax.add_artist(at)
-    
-    plt.plot(fluxes[i].pruned_times, fluxes[i].pruned_CO2, linewidth = 2.0)
-    line_L = draggable_lines(ax, fluxes[i].pruned_times[0], [fluxes[i].pruned_times[0], fluxes[i].pruned_times[-1]], plt.gca().get_ylim())   # left draggable boundary line
-    line_R = draggable_lines(ax, fluxes[i].pruned_times[-1], [fluxes[i].pruned_times[0], fluxes[i].pruned_times[-1]], plt.gca().get_ylim())     # right draggable boundary line
+    times = fluxes[i].pruned_times
+    CO2 = fluxes[i].pruned_CO2
+
+    # the figure's artists are created on the first draw and updated in place afterwards
+    plot = review_plot(fig)
+    m, b, R2 = fluxes[i].regression()
+    plot.text(ax, r"$R^{2}$ = " + str(round(R2, 5)), size=15)
+    plot.plot(ax, times, CO2)
+    line_L, line_R = plot.cursors(ax, times[0], times[-1], [times[0], times[-1]])   # left and right draggable boundary lines
 
     # if currently on the last flux, change header information, otherwise set title to user controls
     if i == len(fluxes) - 1:
-        ax.set(title = fluxes[i].name +  "\nLast flux! Press right arrow to finish, enter to cut data, r to reset cuts\nUse the mouse to drag peak bounds")
+        ax.set(title = fluxes[i].name +  "\nLast flux! Press right arrow to finish, enter to cut data, z/y to undo/redo, r to reset cuts\nUse the mouse to drag peak bounds")
     else:      
-        ax.set(title = fluxes[i].name + '\nUse arrow keys to navigate fluxes, enter to cut data, r to reset cuts\nUse the mouse to drag cut bounds')
+        ax.set(title = fluxes[i].name + '\nUse arrow keys to navigate fluxes, enter to cut data, z/y to undo/redo, r to reset cuts\nUse the mouse to drag cut bounds')
 
     ax.set(xlabel = "Time (s)")                 # x axis label
 
     ax.set(ylabel = "CO2 concentration (ppm)")  # y axis label
     fig.canvas.mpl_disconnect(cid)
     cid = fig.canvas.mpl_connect('key_press_event', lambda event: on_press(event, i, fluxes, line_L, line_R, fig, ax, cid))   # connect key press event  
-    ax.grid(True)
-
-    fig.canvas.draw()
+    plot.draw()
 
 
 def prune(fluxes):
@@ -218,12 +205,16 @@ def prune(fluxes):
         fig.canvas.start_event_loop(0.05)
 
 
-def flux_calculation(fluxes):
-    for flux in fluxes:
-        X = flux.pruned_times
-        Y = flux.pruned_CO2
+def flux_calculation(fluxes, model='linear'):
+    # fit every flux in one batch, the rate of change is the model's initial slope
+    slopes, RSQs, models = select_models([flux.pruned_times for flux in fluxes], [flux.pruned_CO2 for flux in fluxes], model)
 
-        m, b, R2 = linear_regression(X, Y)
+    for flux, m, R2, name in zip(fluxes, slopes, RSQs, models):
+        if np.isnan(m) or np.isnan(R2):
+            raise Exception("Error: Can't fit {} to the data of flux {}, please check the cuts.".format("a line" if name == 'linear' else f"the {name} model", flux.name))
+        m = float(m)
+        R2 = float(R2)
+        flux.model = name
 
         flux.RSQ = R2
         flux.RoC = m * 60
@@ -231,44 +222,79 @@ def flux_calculation(fluxes):
         adjusted_volume = (flux.volume*273.15)/(flux.temp + 273.15)*1000
         flux.NEE = ((m*44.01)/(22.414))*(adjusted_volume/0.58 ** 2)*(86400/1000000)
 
-def offsets(fluxes):
-    
-    for flux in fluxes:
+# bootstrap confidence intervals of every flux after flux_calculation, scaled from the slope to the NEE
+def confidence_intervals(fluxes, resamples=BOOTSTRAP_RESAMPLES, processes=1):
+    slope_CIs = bootstrap_cis([flux.pruned_times for flux in fluxes], [flux.pruned_CO2 for flux in fluxes], [flux.model for flux in fluxes],
+                              resamples, level=CONFIDENCE_LEVEL, processes=processes)
+    for flux, (low, high) in zip(fluxes, slope_CIs):
+        scale = flux.NEE / (flux.RoC / 60) if flux.RoC else np.nan
+        flux.CI = tuple(sorted((low * scale, high * scale)))
 
-        flux.max_time = max(flux.pruned_times)
-        flux.min_time = min(flux.pruned_times)
-
-        # for each cut, rebuild pruned data sets with '' for cut indices
-        cut_size = 0
-        flux.data_loss = 100 - round(len(flux.pruned_times) / len(flux.times) * 100, 2)
-        for cut in flux.cuts:
-            for i in range(cut[0] + cut_size, cut[1] + 1 + cut_size):
-                flux.pruned_times.insert(i, '')
-                flux.pruned_CO2.insert(i, '')
-            cut_size += cut[1] + cut[0] + 1
-
-        # calculate the offset at each index
-        for k in range(len(flux.times)):
-            if flux.pruned_times[k] != '':
-                flux.time_offsets.append(flux.times[k] - flux.pruned_times[k])
-                flux.CO2_offsets.append(flux.CO2[k] - flux.pruned_CO2[k])
-            else:
-                flux.time_offsets.append(0)
-                flux.CO2_offsets.append(0)
 
-def output_data(fluxes, date):
+# calculates cut offsets for the sake of reporting, for every flux at once
+def offsets(fluxes):
+    cuts = [flux.cuts for flux in fluxes]
+    times, time_offsets = cut_offsets([flux.times for flux in fluxes], cuts, interior_only=False)
+    CO2, CO2_offsets = cut_offsets([flux.CO2 for flux in fluxes], cuts)
+    losses = data_loss(cuts)
+
+    for k in range(len(fluxes)):
+        flux = fluxes[k]
+        flux.max_time = np.nanmax(times[k])
+        flux.min_time = np.nanmin(times[k])
+        flux.data_loss = float(losses[k])
+        flux.pruned_columns = {'times': times[k], 'CO2': CO2[k]}
+        flux.time_offsets = time_offsets[k]
+        flux.CO2_offsets = CO2_offsets[k]
+
+# the summary and the long-format original and pruned series of every flux, as columns for utils.export_tables
+def flux_tables(fluxes):
+    summary = {'flux_id': [], 'name': [], 'gas': [], 'model': [], 'RSQ': [], 'rate_of_change': [], 'm': [], 'NEE': [],
+               'CI_low': [], 'CI_high': [], 'chamber_volume': [], 'air_temp': [], 'PAR': [], 'data_loss': []}
+    series = {'flux_id': [], 'gas': [], 't': [], 'pruned_t': [], 'time_offset': [], 'value': [], 'pruned_value': [], 'offset': [],
+              'PAR': [], 'temp': [], 'cut': []}
+    for flux, flux_id in zip(fluxes, unique_names([flux.name for flux in fluxes])):
+        n = len(flux.times)
+        CI_low, CI_high = flux.CI if flux.CI else (np.nan, np.nan)
+        results = [flux_id, flux.name, 'co2', flux.model, flux.RSQ, flux.RoC, flux.RoC/60, flux.NEE,
+                   CI_low, CI_high, flux.volume, flux.temp, flux.PAR, flux.data_loss]
+        for key, value in zip(summary, results):
+            summary[key].append(value)
+        columns = [[flux_id] * n, ['co2'] * n, flux.times, flux.pruned_columns['times'], flux.time_offsets, flux.CO2,
+                   flux.pruned_columns['CO2'], flux.CO2_offsets, np.asarray(flux.PARs, dtype=float), np.asarray(flux.temps, dtype=float), ~flux.cuts.keep]
+        for key, column in zip(series, columns):
+            series[key].append(column)
+    series = {key: np.concatenate(columns) if columns else [] for key, columns in series.items()}
+    return {'summary': summary, 'series': series}
+
+
+# outputs data to excel file, and optionally exports the flux tables in one of utils.EXPORT_FORMATS next to it
+def output_data(fluxes, date, export=None):
 
     out = tkinter.filedialog.asksaveasfilename(defaultextension='.xlsx')
+    if export:
+        print("Exported", ", ".join(export_tables(out, flux_tables(fluxes), export)))
     workbook = xlsxwriter.Workbook(out)
 
     worksheet = workbook.add_worksheet("Summary")
     worksheet.write_row(1, 0, ["Date:", date])
     worksheet.write_column(3, 0, ["Flux name", '', "Chamber volume (L)", "Air temp (K)", '',  "RSQ", "Rate of change (CO2 [ppm/min])", "m (CO2 [ppm/sec])", "NEE (g CO2 m^-2 d^-1)", "Data loss (%)", "PAR", "Surface moisture", "Surface temperature"])
 
+    # the flux model is only reported when something other than a straight line was fit
+    models = any(flux.model != 'linear' for flux in fluxes)
+    if models:
+        worksheet.write(4, 0, "Model")
     for i in range(len(fluxes)):
         print(fluxes[i].name)
-        worksheet.write_column(3, i + 1, [fluxes[i].name , '', fluxes[i].volume, fluxes[i].temp, '', fluxes[i].RSQ, fluxes[i].RoC, fluxes[i].RoC/60, fluxes[i].NEE, fluxes[i].data_loss, fluxes[i].PAR])
+        worksheet.write_column(3, i + 1, [fluxes[i].name , fluxes[i].model if models else '', fluxes[i].volume, fluxes[i].temp, '', fluxes[i].RSQ, fluxes[i].RoC, fluxes[i].RoC/60, fluxes[i].NEE, fluxes[i].data_loss, fluxes[i].PAR])
         worksheet.set_column(i + 1, i + 1, len(fluxes[i].name ))
+    # confidence intervals go below the rest of the summary
+    if any(flux.CI for flux in fluxes):
+        level = round(CONFIDENCE_LEVEL * 100)
+        worksheet.write_column(16, 0, [f"NEE {level}% CI low", f"NEE {level}% CI high"])
+        for i in range(len(fluxes)):
+            if fluxes[i].CI:
+                worksheet.write_column(16, i + 1, ['' if value != value else value for value in fluxes[i].CI])
     worksheet.set_column(0, 0, len("Rate of change (CH4 [ppm/min])"))
 
 
@@ -285,6 +311,8 @@ def output_data(fluxes, date):
         worksheet.write_row(2, 0, ["Rate of change (CO2 [ppm/min]", flux.RoC, '', '', "Air temp (K)", flux.temp])
         worksheet.write_row(3, 0, ["NEE (g CO2 m^-2 d^-1)", flux.NEE])
         worksheet.write_row(4, 0, ["Data loss (%)", flux.data_loss])
+        if models:
+            worksheet.write_row(3, 4, ["Model", flux.model])
 
         worksheet.write(6, 0, "Original times (s)")
         worksheet.set_column(0, 0, len("Rate of change (CH4 [ppm/min])"))
@@ -305,8 +333,13 @@ def output_data(fluxes, date):
         worksheet.set_column(8, 8, len("Temperatures (K)"))
         worksheet.set_column(9, 9, len("Temperatures (K)"))
 
-        for i in range(len(flux.times)):
-            worksheet.write_row(i + 7, 0, [flux.times[i], flux.pruned_times[i], flux.time_offsets[i], '', flux.CO2[i], flux.pruned_CO2[i], flux.CO2_offsets[i], '', flux.PARs[i], flux.temps[i]])
+        # write each data set as a column, with '' for cut indices
+        columns = [flux.times.tolist(), report_column(flux.pruned_columns['times']), flux.time_offsets.tolist(), None,
+                   flux.CO2.tolist(), report_column(flux.pruned_columns['CO2']), flux.CO2_offsets.tolist(), None,
+                   flux.PARs, flux.temps]
+        for col in range(len(columns)):
+            if columns[col] is not None:
+                worksheet.write_column(7, col, columns[col])
 
         # generate chart showing cut values compared to kept values with offsets
         chart = workbook.add_chart({'type': 'line'})
@@ -336,6 +369,9 @@ def IRGA():
         [sg.Text("", background_color='#B9139D')],
         [sg.Text('Field data file: (.csv, .txt)', size=(21, 1), background_color='#B9139D'), sg.Input(key='-FIELD-'), sg.FileBrowse()],
         [sg.Text('IRGA files folder:', size=(15, 1), background_color='#B9139D'), sg.Input(key='-FOLDER-'), sg.FolderBrowse()],
+        [sg.Checkbox(f'Bootstrap {round(CONFIDENCE_LEVEL * 100)}% confidence intervals of the fluxes', default=False, key='-CI-', background_color='#B9139D')],
+        [sg.Text('Flux model:', size=(15, 1), background_color='#B9139D'), sg.Combo(list(FLUX_MODELS) + ['aic'], default_value='linear', readonly=True, key='-MODEL-')],
+        [sg.Text('Also export tables:', size=(15, 1), background_color='#B9139D'), sg.Combo(['none'] + list(EXPORT_FORMATS), default_value='none', readonly=True, key='-EXPORT-')],
         [sg.Text("Date:", size=(15, 1), background_color='#B9139D'), sg.InputText(key='-DATE-')],
         [sg.Text("", background_color='#B9139D')],
         [sg.Submit(), sg.Cancel()]]
@@ -375,13 +411,17 @@ def IRGA():
             prune(fluxes)
 
             print("Calculating fluxes")
-            flux_calculation(fluxes)
+            flux_calculation(fluxes, values['-MODEL-'])
+
+            if values['-CI-']:
+                print("Bootstrapping confidence intervals")
+                confidence_intervals(fluxes)
 
             print("Calculating offsets")
             offsets(fluxes)
 
             print("Outputting data")
-            out = output_data(fluxes, date)
+            out = output_data(fluxes, date, export=values['-EXPORT-'] if values['-EXPORT-'] != 'none' else None)
 
         except Exception as e:
             window.close()
@@ -1,20 +1,29 @@
-from math import floor
 import sys
 import re
+import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib.offsetbox import AnchoredText
 import os
 import tkinter
 import tkinter.filedialog
-import xlsxwriter
 import PySimpleGUI as sg
 import traceback
 
-from utils import draggable_lines, linear_regression
+from utils import (
+    review_plot, review_state, decimate,
+    report_workbook, write_columns, report_column, long_sheets, charted, REPORT_LAYOUTS,
+    export_tables, EXPORT_FORMATS, flux_tables, flux_series, SERIES_COLUMNS,
+    PrefixSums, select_models, FLUX_MODELS, bootstrap_cis, BOOTSTRAP_RESAMPLES, CONFIDENCE_LEVEL,
+    Cuts, cut_offsets, data_loss, ebullition,
+    unique_names,
+)
     
 
 # Flux object
 class Flux:
+    __slots__ = ('name', 'start_time', 'end_time', 'chamber_height', 'surface_area', 'original_length', 'data_loss',
+                 'times', 'CH4', 'H2O', 'cuts', 'sums', 'pruned_columns', 'time_offsets', 'CH4_offsets',
+                 'suggestions', 'max_time', 'min_time', 'temp', 'model', 'RSQ', 'RoC', 'flux', 'CI')
+
     def __init__(self, name, light_or_dark, start_time, end_time, chamber_height, surface_area):
 
         light_regex = r"L|l|Light|light"
@@ -36,26 +45,47 @@ class Flux:
         self.original_length = 0    # original length of flux data
         self.data_loss = 0          # total percent of data set pruned
 
-        self.times = []             # LGR times
-        self.pruned_times = []      # pruned LGR times
-        self.time_offsets = []      # offsets for each LGR time index
+        self.times = np.array([])   # LGR times, shared time axis for every series
+        self.CH4 = np.array([])     # LGR gas concentrations
+        self.H2O = np.array([])
 
-        self.CH4 = []               # LGR gas concentrations
-        self.pruned_CH4 = []        # pruned LGR concentrations
-        self.CH4_offsets = []       # offsets for each LGR concentration index
+        self.cuts = Cuts(0)     # every user data cut, the pruned data sets are derived from these
+        self.suggestions = None # suggested ebullition cuts, [first, last] original indices not yet accepted or rejected, None until found
+        self.sums = None        # prefix sums of the original data, for fast regressions of the pruned data
 
-        self.H2O = []
-        self.pruned_H2O = []
-        self.H2O_offsets = []
+        self.pruned_columns = {}            # pruned times, CH4 and H2O aligned with the original data, for reporting
+        self.time_offsets = np.array([])    # offsets for each LGR time index
+        self.CH4_offsets = np.array([])     # offsets for each LGR concentration index
 
         self.temp = 0               # Average temperature from LGR
-
-        self.cuts = []      # every user data cut
             
+        self.model = 'linear'   # flux model fit to the data, see utils.FLUX_MODELS
         self.RSQ = 0        # R^2 for final rate calculation
+        self.CI = None      # bootstrap confidence interval (low, high) of the flux, when requested
         self.RoC = 0        # rate of change (concentration/minute)
         self.flux = 0       # final calculated flux
 
+    # pruned data sets are derived from the original data and the cuts
+    @property
+    def pruned_times(self):
+        # times are offset by every cut, including cuts at the start of the data
+        return self.cuts.prune(self.times, interior_only=False)
+
+    @property
+    def pruned_CH4(self):
+        return self.cuts.prune(self.CH4)
+
+    @property
+    def pruned_H2O(self):
+        # humidity is only cut, never offset
+        return self.H2O[self.cuts.keep]
+
+    # linear regression of the pruned CH4 over the pruned times, O(k) in the number of cuts
+    def regression(self):
+        if self.sums is None:
+            self.sums = PrefixSums(self.times, self.CH4)
+        return self.sums.regression(self.times, self.CH4, self.cuts, x_interior_only=False)
+
 
 # parses raw LGR data, as well as field data into flux objects
 def input_data(field_data, LGR_data, CO2_or_CH4):
@@ -186,12 +216,10 @@ def input_data(field_data, LGR_data, CO2_or_CH4):
                     temps.append(float(x[LGR_temp_index]))
                     if time_seconds == flux.end_time: # if current line in LGR data is the end time of the current flux, finalize times and concentrations sets and stop
                         
-                        flux.times = times
-                        flux.CH4 = CH4
-                        flux.H2O = H2O
-                        flux.pruned_times = times
-                        flux.pruned_CH4 = CH4
-                        flux.pruned_H2O = H2O
+                        flux.times = np.array(times)
+                        flux.CH4 = np.array(CH4)
+                        flux.H2O = np.array(H2O)
+                        flux.cuts = Cuts(len(times))
                         flux.original_length = len(times)
                         flux.temp = sum(temps)/len(temps)
 
@@ -215,59 +243,39 @@ def on_press(event, i, fluxes, line_L, line_R, fig, ax1, ax2, cid, CO2_or_CH4):
     # if enter key pressed, cut data according to currently set cut bounds
     if event.key == 'enter':
 
-        # get cut indices from left and right lines
-        time_L = floor(line_L.line.get_xdata()[0])
-        time_R = floor(line_R.line.get_xdata()[0])
+        # cut the data between the left and right lines, tracking the bounds of each cut
+        time_L = line_L.line.get_xdata()[0]
+        time_R = line_R.line.get_xdata()[0]
 
-        time_L_index = fluxes[i].pruned_times.index(time_L)
-        time_R_index = fluxes[i].pruned_times.index(time_R)
-        
-        if (time_R_index - time_L_index + 1) >= len(fluxes[i].pruned_times):
+        if not fluxes[i].cuts.cut(fluxes[i].pruned_times, time_L, time_R):
             print("Error! Can't cut entire data set, please narrow your selection with the two red cursors")
         else:
-            # if both indices exist, set CH4 delta as the gap between the last entry before and first entry after the cut
-            # this is for the sake of maintaining a linear relationship, it adds a fixed offset to each entry after the cut
-            # if the cut is at the boundary of the data, the offset will be set to zero (i.e. the cut isn't in the middle of the data)
-            if time_L_index and time_R_index:
-                CH4_delta = fluxes[i].pruned_CH4[time_L_index] - fluxes[i].pruned_CH4[time_R_index]
-            else:
-                CH4_delta = 0
-
-            # obtain time offset as the time elapsed by the cut
-            # for the sake of maintaining a linear relationship, adds a fixed offset
-            time_delta = time_R - time_L
-            fluxes[i].cuts.append([time_L_index, time_R_index])
-
-            times = []
-            CH4 = []
-            H2O = []
-
-            # if entry is not in the cut, add it to a new set
-            for k in range(len(fluxes[i].pruned_times)):
-                if fluxes[i].pruned_times[k] < time_L:
-                    times.append(fluxes[i].pruned_times[k])
-                    CH4.append(fluxes[i].pruned_CH4[k])
-                    H2O.append(fluxes[i].pruned_H2O[k])
-                if fluxes[i].pruned_times[k] > time_R:
-                    times.append(fluxes[i].pruned_times[k] - time_delta)
-                    CH4.append(fluxes[i].pruned_CH4[k] + CH4_delta)
-                    H2O.append(fluxes[i].pruned_H2O[k])
-            
-            # update flux pruned sets with cut sets
-            fluxes[i].pruned_times = times
-            fluxes[i].pruned_CH4 = CH4
-            fluxes[i].pruned_H2O = H2O
-
             # refresh the plot
             draw_plot(i, fluxes, fig, ax1, ax2, cid, CO2_or_CH4)
 
-    # if r key pressed, reset data
+    # if r key pressed, reset data (the cuts can still be restored one at a time with redo)
     if event.key == 'r':
-        fluxes[i].pruned_times = fluxes[i].times
-        fluxes[i].pruned_CH4 = fluxes[i].CH4
-        fluxes[i].pruned_H2O = fluxes[i].H2O
-        fluxes[i].cuts = []
+        if fluxes[i].cuts.reset():
+            draw_plot(i, fluxes, fig, ax1, ax2, cid, CO2_or_CH4)
+
+    # a key accepts the suggested ebullition cuts as regular cuts, x key rejects them
+    if event.key == 'a' and fluxes[i].suggestions:
+        fluxes[i].cuts.cut_suggestions(fluxes[i].times, fluxes[i].suggestions)
+        fluxes[i].suggestions = []
         draw_plot(i, fluxes, fig, ax1, ax2, cid, CO2_or_CH4)
+
+    if event.key == 'x' and fluxes[i].suggestions:
+        fluxes[i].suggestions = []
+        draw_plot(i, fluxes, fig, ax1, ax2, cid, CO2_or_CH4)
+
+    # z key undoes the most recent cut, y key redoes the most recently undone cut
+    if event.key == 'z':
+        if fluxes[i].cuts.undo():
+            draw_plot(i, fluxes, fig, ax1, ax2, cid, CO2_or_CH4)
+
+    if event.key == 'y':
+        if fluxes[i].cuts.redo():
+            draw_plot(i, fluxes, fig, ax1, ax2, cid, CO2_or_CH4)
     
     # right arrow key moves to the next flux, or exits if currently on the last flux
     if event.key == 'right':
@@ -287,39 +295,49 @@ def on_press(event, i, fluxes, line_L, line_R, fig, ax1, ax2, cid, CO2_or_CH4):
 #draw plot for i-th flux
 def draw_plot(i, fluxes, fig, ax1, ax2, cid, CO2_or_CH4):
 
-    ax1.clear()
-    m, b, R2 = linear_regression(fluxes[i].pruned_times, fluxes[i].pruned_CH4)
-    at = AnchoredText(
-        r"$R^{2}$ = " + str(round(R2, 5)), prop=dict(size=15), frameon=True, loc='upper center')
-    at.patch.set_boxstyle("round,pad=0.,rounding_size=0.2")
-    at.patch.set_alpha(0.5)
-    ax1.add_artist(at)
-    ax1.plot(fluxes[i].pruned_times, fluxes[i].pruned_CH4, linewidth = 2.0)
-    ax1.grid(True)
-    line_L = draggable_lines(ax1, fluxes[i].pruned_times[0], [fluxes[i].pruned_times[0], fluxes[i].pruned_times[-1]], ax1.get_ylim())   # left draggable boundary line
-    line_R = draggable_lines(ax1, fluxes[i].pruned_times[-1], [fluxes[i].pruned_times[0], fluxes[i].pruned_times[-1]], ax1.get_ylim())     # right draggable boundary line
+    # the figure's artists are created on the first draw and updated in place afterwards,
+    # the fluxes next to this one are prepared in the background meanwhile
+    plot = review_plot(fig)
+    R2, spans, (CH4, H2O) = plot.prepared(fluxes, i, prepare_plot, review_state)
+    # the flux may only be read once prepared() has waited for any background preparation of it
+    times = fluxes[i].pruned_times
+    plot.text(ax1, r"$R^{2}$ = " + str(round(R2, 5)), size=15)
+    plot.plot(ax1, *CH4)
+    plot.shade(ax1, spans, color='orange', alpha=0.3)    # suggested ebullition cuts
+    line_L, line_R = plot.cursors(ax1, times[0], times[-1], [times[0], times[-1]])   # left and right draggable boundary lines
 
     # if currently on the last flux, change header information, otherwise set title to user controls
     if i == len(fluxes) - 1:
-        ax1.set(title = fluxes[i].name +  "\nLast flux! Press right arrow to finish, enter to cut data, r to reset cuts\nUse the mouse to drag peak bounds")
+        ax1.set(title = fluxes[i].name +  "\nLast flux! Press right arrow to finish, enter to cut data, z/y to undo/redo, r to reset cuts\nUse the mouse to drag peak bounds")
     else:      
-        ax1.set(title = fluxes[i].name + '\nUse arrow keys to navigate fluxes, enter to cut data, r to reset cuts\nUse the mouse to drag cut bounds')
+        ax1.set(title = fluxes[i].name + '\nUse arrow keys to navigate fluxes, enter to cut data, z/y to undo/redo, r to reset cuts\nUse the mouse to drag cut bounds')
+    if spans:
+        ax1.set(title = ax1.get_title() + ", a/x to accept/reject suggested cuts (orange)")
 
     if CO2_or_CH4 == 'co2':
         ax1.set(ylabel = "CO2 concentration (ppm)")  # y axis label
     else:
         ax1.set(ylabel = "CH4 concentration (ppb)")
     
-    ax2.clear()
-    ax2.plot(fluxes[i].pruned_times, fluxes[i].pruned_H2O, linewidth = 2.0)
-    ax2.grid(True)
+    plot.plot(ax2, *H2O)
 
     ax2.set(xlabel = "Time (s)")
     ax2.set(ylabel = "H2O (ppm)")
 
     fig.canvas.mpl_disconnect(cid)
     cid = fig.canvas.mpl_connect('key_press_event', lambda event: on_press(event, i, fluxes, line_L, line_R, fig, ax1, ax2, cid, CO2_or_CH4))   # connect key press event  
-    fig.canvas.draw()
+    plot.draw()
+
+
+# everything draw_plot shows for a flux: R^2, the suggested cut spans and the decimated (times, data) of the
+# CH4 and H2O, finding the suggested cuts the first time
+def prepare_plot(flux):
+    if flux.suggestions is None:
+        flux.suggestions = ebullition(flux.times, flux.CH4)
+    times = flux.pruned_times
+    m, b, R2 = flux.regression()
+    spans = flux.cuts.pruned_spans(times, flux.suggestions)
+    return R2, spans, [decimate(times, data) for data in (flux.pruned_CH4, flux.pruned_H2O)]
 
 
 # entry point for drawing the plots for the user to cut data
@@ -335,15 +353,20 @@ def prune(fluxes, CO2_or_CH4):
     while plt.get_fignums():
         fig.canvas.draw_idle()
         fig.canvas.start_event_loop(0.05)
+    review_plot(fig).close()
 
 
 # performs linear regression to generate linear gas concentration rate of change per minute
-def flux_calculation(fluxes, CO2_or_CH4):
-    for flux in fluxes:
-        X = flux.pruned_times
-        Y = flux.pruned_CH4
+def flux_calculation(fluxes, CO2_or_CH4, model='linear'):
+    # fit every flux in one batch, the rate of change is the model's initial slope
+    slopes, RSQs, models = select_models([flux.pruned_times for flux in fluxes], [flux.pruned_CH4 for flux in fluxes], model)
 
-        m, b, R2 = linear_regression(X, Y)
+    for flux, m, R2, name in zip(fluxes, slopes, RSQs, models):
+        if np.isnan(m) or np.isnan(R2):
+            raise Exception("Error: Can't fit {} to the data of flux {}, please check the cuts.".format("a line" if name == 'linear' else f"the {name} model", flux.name))
+        m = float(m)
+        R2 = float(R2)
+        flux.model = name
 
         # calculates flux depending on CO2 vs. CH4
         vol = flux.surface_area * flux.chamber_height * 1000
@@ -356,52 +379,91 @@ def flux_calculation(fluxes, CO2_or_CH4):
             flux.flux = (flux.RoC*(vol/(0.0821*flux.temp))*(0.016*1440)/(flux.surface_area)*(12/16)/1000000)
 
 
-# calculates cut offsets for the sake of reporting
-def offsets(fluxes):
-
-    for flux in fluxes:
-
-        flux.max_time = max(flux.pruned_times)
-        flux.min_time = min(flux.pruned_times)
-
-        # for each cut, rebuild pruned data sets with '' for cut indices
-        cut_size = 0
-        flux.data_loss = 100 - round(len(flux.pruned_times) / len(flux.times) * 100, 2)
-        for cut in flux.cuts:
-            for i in range(cut[0] + cut_size, cut[1] + 1 + cut_size):
-                flux.pruned_times.insert(i, '')
-                flux.pruned_CH4.insert(i, '')
-                flux.pruned_H2O.insert(i, '')
-            cut_size += cut[1] + cut[0] + 1
-
-        # calculate the offset at each index
-        for k in range(len(flux.times)):
-            if flux.pruned_times[k] != '':
-                flux.time_offsets.append(flux.times[k] - flux.pruned_times[k])
-                flux.CH4_offsets.append(flux.CH4[k] - flux.pruned_CH4[k])
-            else:
-                flux.time_offsets.append(0)
-                flux.CH4_offsets.append(0)
+# bootstrap confidence intervals of every flux after flux_calculation, scaled from the slope to the flux
+def confidence_intervals(fluxes, resamples=BOOTSTRAP_RESAMPLES, processes=1):
+    slope_CIs = bootstrap_cis([flux.pruned_times for flux in fluxes], [flux.pruned_CH4 for flux in fluxes], [flux.model for flux in fluxes],
+                              resamples, level=CONFIDENCE_LEVEL, processes=processes)
+    for flux, (low, high) in zip(fluxes, slope_CIs):
+        scale = flux.flux / (flux.RoC / 60) if flux.RoC else np.nan
+        flux.CI = tuple(sorted((low * scale, high * scale)))
 
 
-# outputs data to excel file
-def outputData(fluxes, site, date, CO2_or_CH4):
+# calculates cut offsets for the sake of reporting, for every flux at once
+def offsets(fluxes):
+    cuts = [flux.cuts for flux in fluxes]
+    times, time_offsets = cut_offsets([flux.times for flux in fluxes], cuts, interior_only=False)
+    CH4, CH4_offsets = cut_offsets([flux.CH4 for flux in fluxes], cuts)
+    losses = data_loss(cuts)
+
+    for k in range(len(fluxes)):
+        flux = fluxes[k]
+        flux.max_time = np.nanmax(times[k])
+        flux.min_time = np.nanmin(times[k])
+        flux.data_loss = float(losses[k])
+        # humidity is only cut, never offset
+        flux.pruned_columns = {'times': times[k], 'CH4': CH4[k], 'H2O': np.where(flux.cuts.keep, flux.H2O, np.nan)}
+        flux.time_offsets = time_offsets[k]
+        flux.CH4_offsets = CH4_offsets[k]
+
+
+# the original, pruned and offset series of a flux's gas (kept in its CH4 columns whether it's CO2 or CH4), for utils.flux_series
+def gas_series(flux):
+    return flux.CH4, flux.pruned_columns['CH4'], flux.CH4_offsets
+
+
+# the results of the flux's one gas, for utils.flux_tables
+def gas_results(flux, gas):
+    return [(gas, flux.model, flux.RSQ, flux.RoC, flux.flux, flux.CI, gas_series(flux))]
+
+
+# outputs data to excel file, every worksheet is written row by row (see utils.report_workbook)
+# and optionally exports the flux tables in one of utils.EXPORT_FORMATS next to it
+# layout is one of utils.REPORT_LAYOUTS, charts is True, False or an R^2 threshold (see utils.charted)
+def outputData(fluxes, site, date, CO2_or_CH4, charts=True, export=None, layout='sheets'):
+    if layout not in REPORT_LAYOUTS:
+        raise Exception("Error: Unknown report layout {}, expected one of {}".format(layout, ", ".join(REPORT_LAYOUTS)))
     out = tkinter.filedialog.asksaveasfilename(defaultextension='.xlsx')
-    workbook = xlsxwriter.Workbook(out)
+    if export:
+        print("Exported", ", ".join(export_tables(out, flux_tables(fluxes, [gas_results(flux, CO2_or_CH4.lower()) for flux in fluxes]), export)))
+    workbook = report_workbook(out)
 
     # summary worksheet, displays R^2, rate of change, flux, chamber volume, air temp for each flux
     worksheet = workbook.add_worksheet("Summary")
     worksheet.write_row(0, 0, ["Site:", site])
     worksheet.write_row(1, 0, ["Date:", date])
     if CO2_or_CH4.lower() == "co2":
-        worksheet.write_column(3, 0, ["Flux name", '', "Chamber volume (L)", "Air temp (C)", '',  "RSQ", "Rate of change (CO2 [ppm/min])", "m (CO2 [ppm/sec])", "Flux of CO2 (g C m^-2 d^-1", "Data loss (%)", "Surface moisture", "Surface temperature", "PAR"])
+        labels = ["Flux name", '', "Chamber volume (L)", "Air temp (C)", '',  "RSQ", "Rate of change (CO2 [ppm/min])", "m (CO2 [ppm/sec])", "Flux of CO2 (g C m^-2 d^-1", "Data loss (%)", "Surface moisture", "Surface temperature", "PAR"]
     else:
-        worksheet.write_column(3, 0, ["Flux name", '', "Chamber volume (L)", "Air temp (C)", '', "RSQ", "Rate of change (CH4 [ppb/min])", "m (CH4 [ppb/sec])", "Flux of CH4 (g C m^-2 d^-1", "Data loss (%)", "Surface moisture", "Surface temperature", "PAR"])
+        labels = ["Flux name", '', "Chamber volume (L)", "Air temp (C)", '', "RSQ", "Rate of change (CH4 [ppb/min])", "m (CH4 [ppb/sec])", "Flux of CH4 (g C m^-2 d^-1", "Data loss (%)", "Surface moisture", "Surface temperature", "PAR"]
+    # the flux model is only reported when something other than a straight line was fit
+    models = any(flux.model != 'linear' for flux in fluxes)
+    if models:
+        labels[1] = "Model"
+    # confidence intervals go below the rest of the summary
+    CIs = any(flux.CI for flux in fluxes)
+    if CIs:
+        level = round(CONFIDENCE_LEVEL * 100)
+        labels += [f"Flux {level}% CI low", f"Flux {level}% CI high"]
+    columns = [labels]
     for i in range(len(fluxes)):
         vol = fluxes[i].surface_area * fluxes[i].chamber_height * 1000
-        worksheet.write_column(3, i + 1, [fluxes[i].name , '', vol, fluxes[i].temp, '', fluxes[i].RSQ, fluxes[i].RoC, fluxes[i].RoC/60, fluxes[i].flux, fluxes[i].data_loss])
+        results = [fluxes[i].name , fluxes[i].model if models else '', vol, fluxes[i].temp, '', fluxes[i].RSQ, fluxes[i].RoC, fluxes[i].RoC/60, fluxes[i].flux, fluxes[i].data_loss]
+        if fluxes[i].CI:
+            results += ['', '', ''] + ['' if value != value else value for value in fluxes[i].CI]
+        columns.append(results)
         worksheet.set_column(i + 1, i + 1, len(fluxes[i].name ))
+    write_columns(worksheet, 3, 0, columns)
     worksheet.set_column(0, 0, len("Rate of change (CH4 [ppm/min])"))
+
+    # the series of every flux in one long table, with charts on their own worksheet
+    if layout == 'long':
+        gas = CO2_or_CH4.lower()
+        y_axis = 'CO2 concentration (ppm)' if gas == 'co2' else 'CH4 concentration (ppb)'
+        blocks = ((flux_id, y_axis, flux_series(flux, flux_id, gas, gas_series(flux)), flux.RSQ)
+                  for flux, flux_id in zip(fluxes, unique_names([flux.name for flux in fluxes])))
+        long_sheets(workbook, SERIES_COLUMNS, blocks, charts)
+        workbook.close()
+        return out
     
     # create page for each flux, pages give a detailed breakdown of each fluxes data sets as well as the values that have been cut
     worksheets = {}
@@ -417,10 +479,10 @@ def outputData(fluxes, site, date, CO2_or_CH4):
         worksheet.write_row(1, 0, ["RSQ", flux.RSQ, '', '', "Chamber volume (L)", vol])
         if CO2_or_CH4.lower() == 'co2':
             worksheet.write_row(2, 0, ["Rate of change (CO2 [ppm/min]", flux.RoC, '', '', "Air temp (C)", flux.temp])
-            worksheet.write_row(3, 0, ["Flux of CO2 (g C m^-2 d^-1)", flux.flux])
+            worksheet.write_row(3, 0, ["Flux of CO2 (g C m^-2 d^-1)", flux.flux] + (['', '', "Model", flux.model] if models else []))
         else:
             worksheet.write_row(2, 0, ["Rate of change (CH4 [ppb/min]", flux.RoC, '', '', "Air temp (C)", flux.temp])
-            worksheet.write_row(3, 0, ["Flux of CH4 (g C m^-2 d^-1)", flux.flux])
+            worksheet.write_row(3, 0, ["Flux of CH4 (g C m^-2 d^-1)", flux.flux] + (['', '', "Model", flux.model] if models else []))
         worksheet.write_row(4, 0, ["Data loss (%)", flux.data_loss])
 
         worksheet.write(6, 0, "Original times (s)")
@@ -450,8 +512,13 @@ def outputData(fluxes, site, date, CO2_or_CH4):
         worksheet.write(6, 9, "Pruned H2O (ppm)")
         worksheet.set_column(9, 9, len("Pruned H2O (ppm)"))
 
-        for i in range(len(flux.times)):
-            worksheet.write_row(i + 7, 0, [flux.times[i], flux.pruned_times[i], flux.time_offsets[i], '', flux.CH4[i], flux.pruned_CH4[i], flux.CH4_offsets[i], '', flux.H2O[i], flux.pruned_H2O[i]])
+        # write each data set as a column, with '' for cut indices
+        columns = [flux.times.tolist(), report_column(flux.pruned_columns['times']), flux.time_offsets.tolist(), None,
+                   flux.CH4.tolist(), report_column(flux.pruned_columns['CH4']), flux.CH4_offsets.tolist(), None,
+                   flux.H2O.tolist(), report_column(flux.pruned_columns['H2O'])]
+        write_columns(worksheet, 7, 0, columns)
+        if not charted([flux.RSQ], charts):
+            continue
 
         # generate chart showing cut values compared to kept values with offsets
         chart1 = workbook.add_chart({'type': 'line'})
@@ -491,6 +558,11 @@ def LGR():
         [sg.Text('Field data file: (.csv, .txt)', size=(21, 1), background_color='#00A1A0'), sg.Input(key='-FIELD-'), sg.FileBrowse()],
         [sg.Text('LGR data file: (.csv, .txt)', size=(21, 1), background_color='#00A1A0'), sg.Input(key='-LGR-'), sg.FileBrowse()],
         [sg.Text('Gas to analyze:', size=(15, 1), background_color='#00A1A0'), sg.Radio('CO2', 'RADIO2', enable_events=True, default=False, key='-CO2-', background_color='#00A1A0'), sg.Radio('CH4', 'RADIO2',enable_events=True, default=True, key='-CH4-', background_color='#00A1A0')],
+        [sg.Checkbox(f'Bootstrap {round(CONFIDENCE_LEVEL * 100)}% confidence intervals of the fluxes', default=False, key='-CI-', background_color='#00A1A0')],
+        [sg.Text('Flux model:', size=(15, 1), background_color='#00A1A0'), sg.Combo(list(FLUX_MODELS) + ['aic'], default_value='linear', readonly=True, key='-MODEL-')],
+        [sg.Text('Also export tables:', size=(15, 1), background_color='#00A1A0'), sg.Combo(['none'] + list(EXPORT_FORMATS), default_value='none', readonly=True, key='-EXPORT-')],
+        [sg.Text('Report layout:', size=(15, 1), background_color='#00A1A0'), sg.Combo(list(REPORT_LAYOUTS), default_value='sheets', readonly=True, key='-LAYOUT-'),
+            sg.Text('Only chart fluxes with R^2 below:', background_color='#00A1A0'), sg.InputText(key='-CHARTRSQ-', size=(6, 1))],
         [sg.Text("Site name:", size=(15, 1), background_color='#00A1A0'), sg.InputText(key='-SITE-')],
         [sg.Text("Date:", size=(15, 1), background_color='#00A1A0'), sg.InputText(key='-DATE-')],
         [sg.Text("", background_color='#00A1A0')],
@@ -544,13 +616,18 @@ def LGR():
             prune(fluxes, CO2_or_CH4)
 
             print("Calculating fluxes")
-            flux_calculation(fluxes, CO2_or_CH4)
+            flux_calculation(fluxes, CO2_or_CH4, values['-MODEL-'])
+
+            if values['-CI-']:
+                print("Bootstrapping confidence intervals")
+                confidence_intervals(fluxes)
 
             print("Calculating offsets")
             offsets(fluxes)
 
             print("Outputting data")
-            out = outputData(fluxes, site, date, CO2_or_CH4)
+            charts = float(values['-CHARTRSQ-']) if values['-CHARTRSQ-'].strip() else True
+            out = outputData(fluxes, site, date, CO2_or_CH4, charts=charts, export=values['-EXPORT-'] if values['-EXPORT-'] != 'none' else None, layout=values['-LAYOUT-'])
 
         except Exception as e:
             window.close()
@@ -1,7 +1,6 @@
 from math import nan
 import sys
 import matplotlib.pyplot as plt
-import matplotlib.lines as lines
 import numpy as np
 import random
 import csv
@@ -16,49 +15,7 @@ from os.path import  join
 import PySimpleGUI as sg
 import traceback
 
-
-
-# draggable lines for user cuts
-class draggable_lines:
-    def __init__(self, ax, start_coordinate, x_bounds, y_bounds):
-        self.ax = ax
-        self.c = ax.get_figure().canvas
-        self.x_bounds = x_bounds
-        self.y_bounds = y_bounds
-        self.press = None
-
-        self.line = lines.Line2D([start_coordinate, start_coordinate], y_bounds, color='r', picker=5)
-
-        self.ax.add_line(self.line)
-        self.c.draw_idle()
-        self.sid = self.c.mpl_connect('button_press_event', self.on_press)
-        self.sid = self.c.mpl_connect('motion_notify_event', self.on_motion)
-        self.sid = self.c.mpl_connect('button_release_event', self.on_release)
-
-
-    def on_press(self, event):
-        if abs(event.xdata - self.line.get_xdata()[0]) < 3:
-            self.press = (self.line.get_xdata()[0], event.xdata)
-        return
-    
-    def on_motion(self, event):
-        if self.press == None:
-            return 
-        try: 
-            x0, xpress = self.press
-            dx = event.xdata - xpress
-            if self.x_bounds[0] >= (x0 + dx):
-                self.line.set_xdata([self.x_bounds[0],self.x_bounds[0]])
-            elif (x0 + dx) >= self.x_bounds[1]:
-                self.line.set_xdata([self.x_bounds[1], self.x_bounds[1]])
-            else:
-                self.line.set_xdata([x0+dx, x0+dx])
-        except:
-            pass
-    
-    def on_release(self, event):
-        self.press = None
-        self.c.draw_idle()
+from utils import review_plot
 
 
 # sample object, one created for each individual sample
@@ -185,12 +142,10 @@ def draw_plot(i, samples, LGR, fig, ax, cid):
             samples[i].concentrations_CH4.append(float(LGR[k][1]))
             samples[i].concentrations_CO2.append(float(LGR[k][2]))
 
-    fig.clear()
-    ax = fig.add_subplot()
-    plt.plot(samples[i].times, samples[i].concentrations_CH4, linewidth = 2.0)
-
-    line_L = draggable_lines(ax, samples[i].peak_start_time, [samples[i].start_time, samples[i].start_time + len(samples[i].concentrations_CH4)], plt.gca().get_ylim())   # left draggable boundary line
-    line_R = draggable_lines(ax, samples[i].peak_end_time, [samples[i].start_time, samples[i].start_time + len(samples[i].concentrations_CH4)], plt.gca().get_ylim())     # right draggable boundary line
+    # the figure's artists are created on the first draw and updated in place afterwards
+    plot = review_plot(fig)
+    plot.plot(ax, samples[i].times, samples[i].concentrations_CH4)
+    line_L, line_R = plot.cursors(ax, samples[i].peak_start_time, samples[i].peak_end_time, [samples[i].start_time, samples[i].start_time + len(samples[i].concentrations_CH4)])   # left and right draggable boundary lines
 
     # if currently on the last sample, change header information, otherwise set title to user controls
     if i == len(samples) - 1:
@@ -202,8 +157,7 @@ def draw_plot(i, samples, LGR, fig, ax, cid):
     ax.set(ylabel = "CH4 concentration (ppm)")  # y axis label
     fig.canvas.mpl_disconnect(cid)
     cid = fig.canvas.mpl_connect('key_press_event', lambda event: on_press(event, i, samples, line_L, line_R, LGR, fig, ax, cid))   # connect key press event  
-    ax.grid(True)
-    fig.canvas.draw()
+    plot.draw()
 
 
 # obtains peak bounds from user interactive plots
@@ -211,11 +165,7 @@ def obtain_peaks(samples, LGR):
     i = 0
     fig, ax = plt.subplots()
     fig.set_size_inches(6,6)
-
-    line_L = draggable_lines(ax, samples[i].peak_start_time, [samples[i].start_time, samples[i].start_time + len(samples[i].concentrations_CH4)], plt.gca().get_ylim())   # left draggable boundary line
-    line_R = draggable_lines(ax, samples[i].peak_end_time, [samples[i].start_time, samples[i].start_time + len(samples[i].concentrations_CH4)], plt.gca().get_ylim())     # right draggable boundary line
-
-    cid = fig.canvas.mpl_connect('key_press_event', lambda event: on_press(event, i, samples, line_L, line_R, LGR, fig, ax, cid))   # connect key press event
+    cid = ''
     plt.grid(True)
     plt.ion()
     draw_plot(i, samples, LGR, fig, ax, cid)
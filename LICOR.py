@@ -8,36 +8,67 @@
 # For issues, suggestions or concerns contact btnewton@uwaterloo.ca
 
 
-from math import floor
 import sys
 import re
+import time
+import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib.offsetbox import AnchoredText
 import os
 import tkinter
 import tkinter.filedialog
-import xlsxwriter
+from xlsxwriter.utility import xl_col_to_name
 import PySimpleGUI as sg
 import traceback
 
-from utils import draggable_lines, linear_regression
+from utils import (
+    review_plot, review_state, decimate,
+    report_workbook, write_columns, report_column, long_sheets, charted, REPORT_LAYOUTS,
+    export_tables, EXPORT_FORMATS, flux_tables, flux_series, SERIES_COLUMNS,
+    PrefixSums, select_models, FLUX_MODELS, bootstrap_cis, BOOTSTRAP_RESAMPLES, CONFIDENCE_LEVEL,
+    Cuts, cut_offsets, data_loss, read_cuts, ebullition,
+    time_to_seconds, unique_names,
+)
+from licor_data import read_licor, open_licor, licor_paths, LicorTail, MMAP_SIZE, epoch_ns, NS
 
-# Define global variable for the gas type being analyzed (CO2 or CH4)
-LICOR_GAS = ''
 # Dictionary of units for concentration of different gas types
 gas_units = {
     'ch4': 'ppb',
     'co2': 'ppm',
     'n2o': 'ppb',
 }
+# how far (in seconds) a flux start or end time may be from the closest logged LICOR row
+TIME_TOLERANCE = 5
+# how often (in seconds) live mode checks the LICOR file for new data
+POLL_INTERVAL = 2
+# the automatic linear window search only considers windows of at least this many datapoints and seconds
+MIN_WINDOW_LENGTH = 30
+MIN_WINDOW_DURATION = 60
 output_units = {
     'ch4': '(mg C m^-2 d^-1)',
     'co2': '(g C m^-2 d^-1)',
     'n2o': '(mg N2O m^-2 d^-1)'
 }
 
+class Session:
+    """
+    Gas choice of one flux analysis: the gas plotted and cut during review, and whether the file's other
+    gases are calculated with the same cuts. Created by the GUI, process() or watch() and passed to every step.
+    """
+    __slots__ = ('gas', 'all_gases')
+
+    def __init__(self, gas, all_gases=False):
+        self.gas = gas.lower()          # gas type being analyzed (CO2, CH4 or N2O), this is the gas plotted for cutting
+        self.all_gases = all_gases      # also calculate fluxes for every other gas in the LICOR file, sharing gas's cuts
+        if self.gas not in gas_units:
+            raise Exception("Error: Unknown gas {}, expected one of {}".format(gas, ", ".join(gas_units)))
+
+
 # Flux object
 class Flux:
+    __slots__ = ('name', 'start_time', 'end_time', 'temp', 'chamber_height', 'surface_area', 'original_length', 'data_loss',
+                 'times', 'samples', 'gases', 'H2O', 'methane', 'cuts', 'sums', 'pruned_columns', 'time_offsets', 'sample_offsets',
+                 'suggestions', 'max_time', 'min_time', 'model', 'RSQ', 'RoC', 'flux', 'CI')
+
     def __init__(self, name, light_or_dark, start_time, end_time, start_temp, end_temp, chamber_height, surface_area):
 
         light_regex = r"L|l|Light|light"
@@ -60,32 +91,75 @@ class Flux:
         self.original_length = 0    # original length of flux data
         self.data_loss = 0          # total percent of data set pruned
 
-        self.times = []             # LICOR times
-        self.pruned_times = []      # pruned LICOR times
-        self.time_offsets = []      # offsets for each LICOR time index
-
-        self.samples = []           # LICOR gas concentrations
-        self.pruned_samples = []    # pruned LICOR concentrations
-        self.sample_offsets = []    # offsets for each LICOR concentration index
-
-        self.H2O = []
-        self.pruned_H2O = []
-        self.H2O_offsets = []
-
-        # Lists for holding raw methane measurements. Will only be populated when LICOR_GAS == co2
-        self.methane = []
-        self.pruned_methane = []
-        self.methane_offsets = []
-
-        self.cuts = []      # every user data cut
-            
-        self.RSQ = 0        # R^2 for final rate calculation
-        self.RoC = 0        # rate of change (concentration/minute)
-        self.flux = 0       # final calculated flux
-
-
-# parses raw LICOR data, as well as field data into flux objects
-def input_data(field_data, licor_data):
+        self.times = np.array([])           # LICOR times, shared time axis for every series
+        self.samples = np.array([])         # LICOR gas concentrations of the session's gas
+        self.gases = {}                     # concentrations of every gas analyzed, keyed by gas, the session's gas first
+        self.H2O = np.array([])
+        self.methane = np.array([])         # raw methane measurements, will only be populated when the session's gas is co2
+
+        self.cuts = Cuts(0)     # every user data cut, the pruned data sets are derived from these
+        self.suggestions = None # suggested ebullition cuts, [first, last] original indices not yet accepted or rejected, None until found
+        self.sums = None        # prefix sums of the original data, for fast regressions of the pruned data
+
+        self.pruned_columns = {}            # pruned times, H2O and each gas aligned with the original data, for reporting
+        self.time_offsets = np.array([])    # offsets for each LICOR time index
+        self.sample_offsets = {}            # offsets for each LICOR concentration index, per gas
+
+        # final results, per gas
+        self.model = {}     # flux model fit to each gas, see utils.FLUX_MODELS
+        self.RSQ = {}       # R^2 for final rate calculation
+        self.RoC = {}       # rate of change (concentration/minute)
+        self.flux = {}      # final calculated flux
+        self.CI = {}        # bootstrap confidence interval (low, high) of the flux, when requested
+
+    # pruned data sets are derived from the original data and the cuts
+    @property
+    def pruned_times(self):
+        return self.cuts.prune(self.times)
+
+    @property
+    def pruned_samples(self):
+        return self.cuts.prune(self.samples)
+
+    @property
+    def pruned_H2O(self):
+        return self.cuts.prune(self.H2O)
+
+    @property
+    def pruned_methane(self):
+        if len(self.methane) == 0:
+            return self.methane
+        return self.cuts.prune(self.methane)
+
+    # linear regression of the pruned samples over the pruned times, O(k) in the number of cuts
+    def regression(self):
+        if self.sums is None:
+            self.sums = PrefixSums(self.times, self.samples)
+        return self.sums.regression(self.times, self.samples, self.cuts)
+
+
+# builds a sorted int64 epoch nanosecond index from the SECONDS and NANOSECONDS columns, dropping duplicated rows
+# and rows without a time, returns the sorted epochs and the row order that sorts the parsed columns to match
+def time_index(seconds, nanoseconds):
+    valid = np.flatnonzero(~np.isnan(seconds))
+    epochs = epoch_ns(seconds[valid], nanoseconds[valid])
+    rows = np.argsort(epochs, kind='stable')
+    epochs = epochs[rows]
+    unique = np.concatenate(([True], np.diff(epochs) > 0))
+    return epochs[unique], valid[rows[unique]]
+
+
+# binary searches the epoch (ns) index for the row closest to each target epoch (s)
+def nearest_rows(epochs, targets):
+    targets = epoch_ns(targets)
+    rows = np.clip(np.searchsorted(epochs, targets), 1, len(epochs) - 1)
+    # distances are compared in whole seconds, so any row logged during the target second is an exact match
+    previous_closer = targets - epochs[rows - 1] // NS * NS < epochs[rows] // NS * NS - targets
+    return np.maximum(np.where(previous_closer, rows - 1, rows), 0)
+
+
+# parses the field data file into flux objects, without any LICOR data yet
+def read_field_data(field_data):
     fluxes = [] # set of flux objects
 
     # find relevant data indices in field data file
@@ -98,12 +172,6 @@ def input_data(field_data, licor_data):
     chamber_height_regex = r"chamber[ -_]height[ ]?(m)"
     surface_area_regex = r"surface[ -_]area[ ]?(m^2)"
 
-    LICOR_time_regex = r"^TIME"
-    LICOR_CH4_regex = r"CH4"
-    LICOR_CO2_regex = r"CO2"
-    LICOR_N2O_regex = r"N2O"
-    LICOR_H2O_regex = r"H2O"
-
     time_regex = r"(\d*):(\d*):(\d*)"
 
     collar_index = 0
@@ -115,12 +183,6 @@ def input_data(field_data, licor_data):
     chamber_height_index = 6
     surface_area_index = 7
 
-    LICOR_time_index = 7
-    LICOR_CH4_index = 10
-    LICOR_CO2_index = 9
-    LICOR_H2O_index = 8
-    LICOR_N2O_index = 10
-
     # for each flux, obtain from field data file the name, start and end times
     f = open(field_data, "r")
     x = next(f).replace('\t', ',').replace(';',',').split(",")
@@ -154,144 +216,182 @@ def input_data(field_data, licor_data):
         fluxes.append(Flux(x[collar_index], x[l_or_d_index], x[start_time_index], x[end_time_index], x[start_temp_index], x[end_temp_index], float(x[chamber_height_index]), float(x[surface_area_index])))
     f.close()
 
-    # use the raw LICOR data as well as the parsed field data to obtain unpruned sets of times and concentrations for each flux
-    f = open(licor_data, "r")
-    x = next(f).replace('\t', ',').replace(';',',').split(",")
-    while x[0] != "DATAH":
-        x = next(f).replace('\t', ',').replace(';',',').split(",")
-    print(x)
+    return fluxes
+
+
+# finds the LICOR columns from the DATAH header, and the gases to parse
+# returns the column indices (keyed by 'seconds', 'nanoseconds', 'time', 'H2O' and gas), the gases analyzed and the gases parsed
+def licor_columns(header, session):
+    LICOR_seconds_regex = r"^SECONDS"
+    LICOR_nanoseconds_regex = r"^NANOSECONDS"
+    LICOR_time_regex = r"^TIME"
+    LICOR_CH4_regex = r"CH4"
+    LICOR_CO2_regex = r"CO2"
+    LICOR_N2O_regex = r"N2O"
+    LICOR_H2O_regex = r"H2O"
+
+    LICOR_seconds_index = 1
+    LICOR_nanoseconds_index = 2
+    LICOR_time_index = 7
+    LICOR_CH4_index = 10
+    LICOR_CO2_index = 9
+    LICOR_H2O_index = 8
+    LICOR_N2O_index = 10
+
     # Determine the index (column) of the time, H2O, and sample gas
-    for i in range(len(x)):
-        if re.search(LICOR_time_regex, x[i], re.IGNORECASE):
+    for i in range(len(header)):
+        if re.search(LICOR_seconds_regex, header[i], re.IGNORECASE):
+            LICOR_seconds_index = i
+        if re.search(LICOR_nanoseconds_regex, header[i], re.IGNORECASE):
+            LICOR_nanoseconds_index = i
+        if re.search(LICOR_time_regex, header[i], re.IGNORECASE):
             LICOR_time_index = i
-        if re.search(LICOR_CH4_regex, x[i], re.IGNORECASE):
+        if re.search(LICOR_CH4_regex, header[i], re.IGNORECASE):
             LICOR_CH4_index = i
-        if re.search(LICOR_CO2_regex, x[i], re.IGNORECASE):
+        if re.search(LICOR_CO2_regex, header[i], re.IGNORECASE):
             LICOR_CO2_index = i
-        if re.search(LICOR_N2O_regex, x[i], re.IGNORECASE):
+        if re.search(LICOR_N2O_regex, header[i], re.IGNORECASE):
             LICOR_N2O_index = i
-        if re.search(LICOR_H2O_regex, x[i], re.IGNORECASE):
+        if re.search(LICOR_H2O_regex, header[i], re.IGNORECASE):
             LICOR_H2O_index = i
-    if LICOR_GAS == 'co2':
-        index = LICOR_CO2_index
-        methane_index = LICOR_CH4_index
-    elif LICOR_GAS == 'ch4':
-        index = LICOR_CH4_index
+    gas_indices = {'co2': LICOR_CO2_index, 'ch4': LICOR_CH4_index, 'n2o': LICOR_N2O_index}
+    gas_regexes = {'co2': LICOR_CO2_regex, 'ch4': LICOR_CH4_regex, 'n2o': LICOR_N2O_regex}
+    found_gases = [gas for gas in gas_regexes if any(re.search(gas_regexes[gas], column, re.IGNORECASE) for column in header)]
+
+    # the session's gas first, then every other gas the LICOR reports if they were all asked for
+    gases = [session.gas]
+    if session.all_gases:
+        gases += [gas for gas in found_gases if gas != session.gas]
+    # raw methane measurements are plotted when the session's gas is co2
+    parsed_gases = gases + (['ch4'] if session.gas == 'co2' and 'ch4' not in gases else [])
+
+    index = {'seconds': LICOR_seconds_index, 'nanoseconds': LICOR_nanoseconds_index, 'time': LICOR_time_index, 'H2O': LICOR_H2O_index}
+    index.update(gas_indices)
+    return index, gases, parsed_gases
+
+
+# epochs of the field start and end times of each flux, anchored to the LICOR data's first local midnight
+# the field sheet only has times of day, so only when the LICOR data runs past midnight (last is its latest
+# epoch) are the fluxes taken to be in chronological order, a start more than 12 hours before the previous
+# one then being on the next day
+def flux_epochs(fluxes, midnight, last):
+    starts = np.array([midnight + time_to_seconds(flux.start_time) for flux in fluxes])
+    ends = np.array([midnight + time_to_seconds(flux.end_time) for flux in fluxes])
+    days = np.concatenate(([0], np.cumsum(np.diff(starts) < -43200)))
+    # never past the last day of the LICOR data, a single day of data keeps the fluxes in any order
+    if np.isfinite(last):
+        days = np.minimum(days, max(int((last - midnight) // 86400), 0))
+    for k in np.flatnonzero(np.diff(days, prepend=0)):
+        print("Flux {} and the fluxes after it are taken to be on day {} of the LICOR data".format(fluxes[k].name, days[k] + 1))
+    starts += days * 86400
+    ends += days * 86400
+    ends[ends < starts] += 86400   # flux spans midnight
+    return starts, ends
+
+
+# fills each flux's data sets from the parsed LICOR rows, using the rows closest to its start and end epochs
+# gases come from licor_columns, the session's gas first
+def load_fluxes(fluxes, data, index, gases, parsed_gases, starts, ends):
+    # the parsed columns are shared between every gas
+    epochs, rows = time_index(data[:, index['seconds']], data[:, index['nanoseconds']])
+    concentrations = {gas: data[rows, index[gas]] for gas in parsed_gases}
+    H2O = data[rows, index['H2O']]
+    methane = concentrations['ch4'] if gases[0] == 'co2' else np.array([])
+
+    start_rows = nearest_rows(epochs, starts)
+    end_rows = nearest_rows(epochs, ends)
+
+    for k in range(len(fluxes)):
+        flux = fluxes[k]
+        if abs(epochs[start_rows[k]] / NS - starts[k]) > TIME_TOLERANCE or abs(epochs[end_rows[k]] / NS - ends[k]) > TIME_TOLERANCE or end_rows[k] <= start_rows[k]:
+            raise Exception("Error: No LICOR data found within {} seconds of the start and end times of flux {}, please check the field data times.".format(TIME_TOLERANCE, flux.name))
+
+        # flux series are views into the parsed columns, sharing one time axis in seconds (with the true
+        # sub-second spacing of the rows) since the flux's first row
+        window = slice(start_rows[k], end_rows[k] + 1)
+        flux.times = (epochs[window] - epochs[start_rows[k]]) / NS
+        flux.gases = {gas: concentrations[gas][window] for gas in gases}
+        flux.samples = flux.gases[gases[0]]
+        flux.H2O = H2O[window]
+        flux.methane = methane[window]
+        flux.cuts = Cuts(len(flux.times))
+        flux.original_length = len(flux.times)
+
+
+def input_data(field_data, licor_data, session):
+    fluxes = read_field_data(field_data)
+
+    # use the raw LICOR data as well as the parsed field data to obtain unpruned sets of times and concentrations for each flux
+    # several files (a folder or list of daily files) are merged into one timeline, they and large archives are memory
+    # mapped and only the rows around each flux are decoded, a single smaller file is parsed whole (and cached)
+    reader = None
+    paths = licor_paths(licor_data)
+    if len(paths) > 1 or os.path.getsize(paths[0]) > MMAP_SIZE:
+        reader = open_licor(paths)
+        header = reader.header
     else:
-        index = LICOR_N2O_index
+        header, data = read_licor(paths[0])
+    index, gases, parsed_gases = licor_columns(header, session)
 
-    in_flux = 0
-    times = []
-    samples = []
-    H2O = []
-    methane = []  # for raw methane measurements, only populated when LICOR_GAS == co2
-
-    # go line by line in LICOR data, adding relevant times and concentrations to appropriate fluxes
-    for flux in fluxes:
-        f.seek(6)
-        print(flux.name)
-        for line in f:
-            x = line.replace('\t', ',').replace(';', ',').split(',')
-            if x[0] == "DATA":
-                for k in range(len(x)):
-                    x[k] = x[k].strip(' \t\n\r')
-                if len(x) == 2:
-                    continue
-                if in_flux == 0:    # if current line in LICOR data isn't in a flux, check to see if it's the start time of the next flux
-                    if x[LICOR_time_index] == flux.start_time:
-                        in_flux = 1
-                        start_seconds = float(x[1])
-                        times.append(float(x[1]) - start_seconds)
-                        samples.append(float(x[index]))
-                        H2O.append(float(x[LICOR_H2O_index]))
-                        if LICOR_GAS == 'co2':
-                            methane.append(float(x[LICOR_CH4_index]))
-
-                elif in_flux == 1:  # if current line in LICOR data is in a flux, append the time and gas concentration to flux
-                    times.append(float(x[1]) - start_seconds)
-                    samples.append(float(x[index]))
-                    H2O.append(float(x[LICOR_H2O_index]))
-                    if LICOR_GAS == 'co2':
-                            methane.append(float(x[LICOR_CH4_index]))
-                    if x[LICOR_time_index] == flux.end_time:  # if current line in LICOR data is the end time of the current flux, finalize times and concentrations sets and stop
-                        flux.times = times
-                        flux.samples = samples
-                        flux.H2O = H2O
-                        flux.methane = methane
-                        flux.pruned_times = times
-                        flux.pruned_samples = samples
-                        flux.pruned_H2O = H2O
-                        flux.pruned_methane = methane
-                        flux.original_length = len(times)
-
-                        times = []
-                        samples = []
-                        H2O = []
-                        methane = []
-                        in_flux = 0
-                        start_seconds = 0 
-                        continue
-    f.close()
-    return fluxes
+    columns = [index['seconds'], index['nanoseconds'], index['time'], index['H2O']] + [index[gas] for gas in parsed_gases]
+    first_row = reader.first_row(columns) if reader is not None else (data[0] if len(data) else None)
+    if first_row is None:
+        raise Exception("Error: No data found in LICOR file, please ensure you're using the original unedited file")
 
+    # the field sheet only has local times of day, so anchor them to the epoch of the LICOR file's first local midnight
+    last = reader.last_epoch() if reader is not None else np.nanmax(data[:, index['seconds']])
+    starts, ends = flux_epochs(fluxes, first_row[index['seconds']] - first_row[index['time']], last)
 
-def prune_list(data, time_L_index, time_R_index, time_L, time_R):
-    """
-    Shift the values in data by removing those within [time_L_index, time_R_index] while
-    keeping the data continuous. Achieve continuity by shifting all datapoints after
-    time_R_index by a delta equal to the gap between the last entry before and first entry
-    after the cut.
-    If the cut is at the boundary of the data (i.e. the cut isn't in the middle of the data),
-    the offset (delta) will be zero.
-    """
-    if time_L_index and time_R_index:
-        delta = data[time_L_index] - data[time_R_index]
-    else:
-        delta = 0
+    if reader is not None:
+        data = reader.windows(zip(starts - TIME_TOLERANCE - 1, ends + TIME_TOLERANCE + 1), columns)
+        reader.close()
+        if len(data) == 0:
+            raise Exception("Error: No LICOR data found near the field data times, please check the field data times.")
 
-    return data[: time_L] + [datapoint + delta for datapoint in data[time_R+1 :]]
+    load_fluxes(fluxes, data, index, gases, parsed_gases, starts, ends)
+    return fluxes
 
 
 # process button press for plot
-def on_press(event, i, fluxes, line_L, line_R, fig, ax1, ax2, ax3, cid):
+def on_press(event, i, fluxes, line_L, line_R, fig, ax1, ax2, ax3, cid, session):
     sys.stdout.flush()
 
     # if enter key pressed, cut data according to currently set cut bounds
     if event.key == 'enter':
 
-        # get cut indices from left and right lines
-        time_L = floor(line_L.line.get_xdata()[0])
-        time_R = floor(line_R.line.get_xdata()[0])
-
-        time_L_index = fluxes[i].pruned_times.index(time_L)
-        time_R_index = fluxes[i].pruned_times.index(time_R)
+        # cut the data between the left and right lines, tracking the bounds of each cut
+        time_L = line_L.line.get_xdata()[0]
+        time_R = line_R.line.get_xdata()[0]
 
-        if (time_R_index - time_L_index + 1) >= len(fluxes[i].pruned_times):
+        if not fluxes[i].cuts.cut(fluxes[i].pruned_times, time_L, time_R):
             print("Error! Can't cut entire data set, please narrow your selection with the two red cursors")
         else:
-            # track the upper and lower bounds of each cut in a list
-            fluxes[i].cuts.append([time_L_index, time_R_index])
-
-            # prune the time list to reflect the cut
-            fluxes[i].pruned_times = prune_list(fluxes[i].pruned_times, time_L_index, time_R_index, time_L, time_R)
-
-            # prune the samples, H2O, and optionally methane to reflect the cut
-            fluxes[i].pruned_samples = prune_list(fluxes[i].pruned_samples, time_L_index, time_R_index, time_L, time_R)
-            fluxes[i].pruned_H2O = prune_list(fluxes[i].pruned_H2O, time_L_index, time_R_index, time_L, time_R)
-            if LICOR_GAS == 'co2':
-                fluxes[i].pruned_methane = prune_list(fluxes[i].pruned_methane, time_L_index, time_R_index, time_L, time_R)
-
             # refresh the plot
-            draw_plot(i, fluxes, fig, ax1, ax2, ax3, cid)
+            draw_plot(i, fluxes, fig, ax1, ax2, ax3, cid, session)
 
-    # if r key pressed, reset data
+    # if r key pressed, reset data (the cuts can still be restored one at a time with redo)
     if event.key == 'r':
-        fluxes[i].pruned_times = fluxes[i].times
-        fluxes[i].pruned_samples = fluxes[i].samples
-        fluxes[i].pruned_H2O = fluxes[i].H2O
-        fluxes[i].pruned_methane = fluxes[i].methane
-        fluxes[i].cuts = []
-        draw_plot(i, fluxes, fig, ax1, ax2, ax3, cid)
+        if fluxes[i].cuts.reset():
+            draw_plot(i, fluxes, fig, ax1, ax2, ax3, cid, session)
+
+    # a key accepts the suggested ebullition cuts as regular cuts, x key rejects them
+    if event.key == 'a' and fluxes[i].suggestions:
+        fluxes[i].cuts.cut_suggestions(fluxes[i].times, fluxes[i].suggestions)
+        fluxes[i].suggestions = []
+        draw_plot(i, fluxes, fig, ax1, ax2, ax3, cid, session)
+
+    if event.key == 'x' and fluxes[i].suggestions:
+        fluxes[i].suggestions = []
+        draw_plot(i, fluxes, fig, ax1, ax2, ax3, cid, session)
+
+    # z key undoes the most recent cut, y key redoes the most recently undone cut
+    if event.key == 'z':
+        if fluxes[i].cuts.undo():
+            draw_plot(i, fluxes, fig, ax1, ax2, ax3, cid, session)
+
+    if event.key == 'y':
+        if fluxes[i].cuts.redo():
+            draw_plot(i, fluxes, fig, ax1, ax2, ax3, cid, session)
     
     # right arrow key moves to the next flux, or exits if currently on the last flux
     if event.key == 'right':
@@ -300,72 +400,74 @@ def on_press(event, i, fluxes, line_L, line_R, fig, ax1, ax2, ax3, cid):
             plt.close('all')
             return 0
         else:
-            ax1.clear()
-            ax2.clear()
-            if ax3:
-                ax3.clear()
-            draw_plot(i + 1, fluxes, fig, ax1, ax2, ax3, cid)
+            draw_plot(i + 1, fluxes, fig, ax1, ax2, ax3, cid, session)
         
     # left arrow key moves to the previous flux, or does nothing if at the beginning
     if event.key == 'left':
         if i != 0:
-            draw_plot(i - 1, fluxes, fig, ax1, ax2, ax3, cid)
+            draw_plot(i - 1, fluxes, fig, ax1, ax2, ax3, cid, session)
 
 
 #draw plot for i-th flux
-def draw_plot(i, fluxes, fig, ax1, ax2, ax3, cid):
+def draw_plot(i, fluxes, fig, ax1, ax2, ax3, cid, session):
     """
     Function to add data from fluxes to the axes and draw figure.
-    If LICOR_GAS != co2, ax3 will be None.
+    If the session's gas isn't co2, ax3 will be None.
     """
 
-    ax1.clear()
-    m, b, R2 = linear_regression(fluxes[i].pruned_times, fluxes[i].pruned_samples)
-    at = AnchoredText(
-        r"$R^{2}$ = " + str(round(R2, 5)), prop=dict(size=12), frameon=True, loc='upper center')
-    at.patch.set_boxstyle("round,pad=0.,rounding_size=0.2")
-    at.patch.set_alpha(0.5)
-    ax1.add_artist(at)
-    ax1.plot(fluxes[i].pruned_times, fluxes[i].pruned_samples, linewidth = 2.0)
-    ax1.grid(True)
-    line_L = draggable_lines(ax1, fluxes[i].pruned_times[0], [fluxes[i].pruned_times[0], fluxes[i].pruned_times[-1]], ax1.get_ylim())   # left draggable boundary line
-    line_R = draggable_lines(ax1, fluxes[i].pruned_times[-1], [fluxes[i].pruned_times[0], fluxes[i].pruned_times[-1]], ax1.get_ylim())     # right draggable boundary line
+    # the figure's artists are created on the first draw and updated in place afterwards,
+    # the fluxes next to this one are prepared in the background meanwhile
+    plot = review_plot(fig)
+    R2, spans, (samples, H2O, methane) = plot.prepared(fluxes, i, prepare_plot, review_state)
+    # the flux may only be read once prepared() has waited for any background preparation of it
+    times = fluxes[i].pruned_times
+    plot.text(ax1, r"$R^{2}$ = " + str(round(R2, 5)))
+    plot.plot(ax1, *samples)
+    plot.shade(ax1, spans, color='orange', alpha=0.3)    # suggested ebullition cuts
+    line_L, line_R = plot.cursors(ax1, times[0], times[-1], [times[0], times[-1]])   # left and right draggable boundary lines
 
     # if currently on the last flux, change header information, otherwise set title to user controls
     if i == len(fluxes) - 1:
-        ax1.set(title = fluxes[i].name +  "\nLast flux! Press right arrow to finish, enter to cut data, r to reset cuts\nUse the mouse to drag peak bounds")
+        ax1.set(title = fluxes[i].name +  "\nLast flux! Press right arrow to finish, enter to cut data, z/y to undo/redo, r to reset cuts\nUse the mouse to drag peak bounds")
     else:      
-        ax1.set(title = fluxes[i].name + '\nUse arrow keys to navigate fluxes, enter to cut data, r to reset cuts\nUse the mouse to drag cut bounds')
+        ax1.set(title = fluxes[i].name + '\nUse arrow keys to navigate fluxes, enter to cut data, z/y to undo/redo, r to reset cuts\nUse the mouse to drag cut bounds')
+    if spans:
+        ax1.set(title = ax1.get_title() + ", a/x to accept/reject suggested cuts (orange)")
 
-    ax1.set(ylabel = f"{LICOR_GAS.upper()} concentration ({gas_units[LICOR_GAS]})")  # y axis label
-
-    ax2.clear()
-    ax2.plot(fluxes[i].pruned_times, fluxes[i].pruned_H2O, linewidth = 2.0)
-    ax2.grid(True)
+    ax1.set(ylabel = f"{session.gas.upper()} concentration ({gas_units[session.gas]})")  # y axis label
 
+    plot.plot(ax2, *H2O)
     ax2.set(ylabel = "H2O (ppm)")
 
-    if LICOR_GAS == 'co2':
-        ax3.clear()
-        ax3.plot(fluxes[i].pruned_times, fluxes[i].pruned_methane, linewidth = 2.0)
-        ax3.grid(True)
-
+    if session.gas == 'co2':
+        plot.plot(ax3, *methane)
         ax3.set(xlabel = "Time (s)")                 # x axis label
         ax3.set(ylabel = "CH4 (ppb)")
     else:
         ax2.set(xlabel = "Time (s)")                 # x axis label
 
     fig.canvas.mpl_disconnect(cid)
-    cid = fig.canvas.mpl_connect('key_press_event', lambda event: on_press(event, i, fluxes, line_L, line_R, fig, ax1, ax2, ax3, cid))   # connect key press event
-    fig.canvas.draw()
+    cid = fig.canvas.mpl_connect('key_press_event', lambda event: on_press(event, i, fluxes, line_L, line_R, fig, ax1, ax2, ax3, cid, session))   # connect key press event
+    plot.draw()
+
+
+# everything draw_plot shows for a flux: R^2, the suggested cut spans and the decimated (times, data) of the
+# samples, H2O and methane, finding the suggested cuts the first time
+def prepare_plot(flux):
+    if flux.suggestions is None:
+        flux.suggestions = ebullition(flux.times, flux.samples)
+    times = flux.pruned_times
+    m, b, R2 = flux.regression()
+    spans = flux.cuts.pruned_spans(times, flux.suggestions)
+    return R2, spans, [decimate(times, data) for data in (flux.pruned_samples, flux.pruned_H2O, flux.pruned_methane)]
 
 
 # entry point for drawing the plots for the user to cut data
-def prune(fluxes):
+def prune(fluxes, session):
     i = 0
-    # Create figure and axes for plots. If LICOR_GAS == co2, create
+    # Create figure and axes for plots. If the session's gas is co2, create
     # a third plot at the bottom for raw methane measurements.
-    if LICOR_GAS == 'co2':
+    if session.gas == 'co2':
         fig, (ax1, ax2, ax3) = plt.subplots(3, 1)
         fig.set_size_inches(9, 7)
     else:
@@ -375,140 +477,311 @@ def prune(fluxes):
     cid = ''
     plt.grid(True)
     plt.ion()
-    draw_plot(i, fluxes, fig, ax1, ax2, ax3, cid)
+    draw_plot(i, fluxes, fig, ax1, ax2, ax3, cid, session)
     plt.show(block=False)
     while plt.get_fignums():
         fig.canvas.draw_idle()
         fig.canvas.start_event_loop(0.05)
+    review_plot(fig).close()
 
 
-# performs linear regression to generate linear gas concentration rate of change per minute
-def flux_calculation(fluxes):
+# trims every flux to its best linear window (by R^2 or RMSE), stored as initial cuts that can still be undone
+def best_windows(fluxes, min_length=MIN_WINDOW_LENGTH, min_duration=MIN_WINDOW_DURATION, criterion='r2'):
     for flux in fluxes:
-        X = flux.pruned_times
-        Y = flux.pruned_samples
+        if flux.sums is None:
+            flux.sums = PrefixSums(flux.times, flux.samples)
+        window = flux.sums.best_window(flux.times, min_length, min_duration, criterion)
+        if window is None:
+            print("No window of {} datapoints and {} seconds fits a line for flux {}, leaving it untrimmed".format(min_length, min_duration, flux.name))
+        else:
+            flux.cuts.trim(flux.times, *window)
+
 
-        m, b, R2 = linear_regression(X, Y)
+# performs linear regression to generate linear gas concentration rate of change per minute
+def flux_calculation(fluxes, model='linear'):
+    # fit every gas of every flux in one batch, the gases share the pruned times
+    # the rate of change is the model's initial slope, model='aic' picks the best model of each flux and gas
+    series = [(flux, gas) for flux in fluxes for gas in flux.gases]
+    slopes, RSQs, models = select_models([flux.pruned_times for flux, gas in series], [flux.cuts.prune(flux.gases[gas]) for flux, gas in series], model)
+
+    for (flux, gas), m, R2, name in zip(series, slopes, RSQs, models):
+        if np.isnan(m) or np.isnan(R2):
+            raise Exception("Error: Can't fit {} to the {} data of flux {}, please check the cuts.".format("a line" if name == 'linear' else f"the {name} model", gas.upper(), flux.name))
+        m = float(m)
+        R2 = float(R2)
+        flux.model[gas] = name
 
         # calculates flux depending on CO2 vs. CH4
         vol = flux.surface_area * flux.chamber_height * 1000
 
-        flux.RSQ = R2
-        flux.RoC = m * 60
-        if LICOR_GAS == "co2":
-            flux.flux = (flux.RoC*(vol/(0.0821*flux.temp))*(0.044*1440)/(flux.surface_area)*(12/44)/1000)
-        elif LICOR_GAS == 'ch4':
-            flux.flux = (flux.RoC*(vol/(0.0821*flux.temp))*(0.016*1440)/(flux.surface_area)*(12/16)/1000)
-        else:  # LICOR_GAS == 'n2o'
-            flux.flux = (flux.RoC*(vol/(0.0821*flux.temp))*(0.044*1440)/(flux.surface_area)/1000)
+        flux.RSQ[gas] = R2
+        flux.RoC[gas] = m * 60
+        if gas == "co2":
+            flux.flux[gas] = (flux.RoC[gas]*(vol/(0.0821*flux.temp))*(0.044*1440)/(flux.surface_area)*(12/44)/1000)
+        elif gas == 'ch4':
+            flux.flux[gas] = (flux.RoC[gas]*(vol/(0.0821*flux.temp))*(0.016*1440)/(flux.surface_area)*(12/16)/1000)
+        else:  # gas == 'n2o'
+            flux.flux[gas] = (flux.RoC[gas]*(vol/(0.0821*flux.temp))*(0.044*1440)/(flux.surface_area)/1000)
 
 
-# calculates cut offsets for the sake of reporting
-def offsets(fluxes):
+# bootstrap confidence intervals of every flux and gas after flux_calculation, scaled from the slope to the flux
+def confidence_intervals(fluxes, resamples=BOOTSTRAP_RESAMPLES, processes=1):
+    series = [(flux, gas) for flux in fluxes for gas in flux.gases]
+    slope_CIs = bootstrap_cis([flux.pruned_times for flux, gas in series], [flux.cuts.prune(flux.gases[gas]) for flux, gas in series],
+                              [flux.model[gas] for flux, gas in series], resamples, level=CONFIDENCE_LEVEL, processes=processes)
+    for (flux, gas), (low, high) in zip(series, slope_CIs):
+        scale = flux.flux[gas] / (flux.RoC[gas] / 60) if flux.RoC[gas] else np.nan
+        flux.CI[gas] = tuple(sorted((low * scale, high * scale)))
 
-    for flux in fluxes:
 
-        flux.max_time = max(flux.pruned_times)
-        flux.min_time = min(flux.pruned_times)
-
-        # for each cut, rebuild pruned data sets with '' for cut indices
-        cut_size = 0
-        flux.data_loss = 100 - round(len(flux.pruned_times) / len(flux.times) * 100, 2)
-        for cut in flux.cuts:
-            for i in range(cut[0] + cut_size, cut[1] + 1 + cut_size):
-                flux.pruned_times.insert(i, '')
-                flux.pruned_samples.insert(i, '')
-                flux.pruned_H2O.insert(i, '')
-                flux.pruned_methane.insert(i, '')
-            cut_size += cut[1] + cut[0] + 1
-
-        # calculate the offset at each index
-        for k in range(len(flux.times)):
-            if flux.pruned_times[k] != '':
-                flux.time_offsets.append(flux.times[k] - flux.pruned_times[k])
-                flux.sample_offsets.append(flux.samples[k] - flux.pruned_samples[k])
-            else:
-                flux.time_offsets.append(0)
-                flux.sample_offsets.append(0)
-
-
-# outputs data to excel file
-def outputData(fluxes, site, date):
-    out = tkinter.filedialog.asksaveasfilename(defaultextension='.xlsx')
-    workbook = xlsxwriter.Workbook(out)
-
-    # summary worksheet, displays R^2, rate of change, flux, chamber volume, air temp for each flux
+# calculates cut offsets for the sake of reporting, for every flux at once
+def offsets(fluxes):
+    cuts = [flux.cuts for flux in fluxes]
+    times, time_offsets = cut_offsets([flux.times for flux in fluxes], cuts)
+    H2O, _ = cut_offsets([flux.H2O for flux in fluxes], cuts)
+    gases = {gas: cut_offsets([flux.gases[gas] for flux in fluxes], cuts) for gas in fluxes[0].gases} if fluxes else {}
+    losses = data_loss(cuts)
+
+    for k in range(len(fluxes)):
+        flux = fluxes[k]
+        flux.max_time = np.nanmax(times[k])
+        flux.min_time = np.nanmin(times[k])
+        flux.data_loss = float(losses[k])
+        flux.pruned_columns = {'times': times[k], 'H2O': H2O[k]}
+        flux.time_offsets = time_offsets[k]
+        for gas, (samples, sample_offsets) in gases.items():
+            flux.pruned_columns[gas] = samples[k]
+            flux.sample_offsets[gas] = sample_offsets[k]
+
+
+# the original, pruned and offset series of one gas of a flux, for utils.flux_series
+def gas_series(flux, gas):
+    return flux.gases[gas], flux.pruned_columns[gas], flux.sample_offsets[gas]
+
+
+# the results of every gas of a flux, for utils.flux_tables
+def gas_results(flux):
+    return [(gas, flux.model[gas], flux.RSQ[gas], flux.RoC[gas], flux.flux[gas], flux.CI.get(gas), gas_series(flux, gas)) for gas in flux.gases]
+
+
+# outputs data to excel file, every worksheet is written row by row (see utils.report_workbook)
+# and optionally exports the flux tables in one of utils.EXPORT_FORMATS next to it
+# layout is one of utils.REPORT_LAYOUTS, charts is True, False or an R^2 threshold (see utils.charted)
+def outputData(fluxes, site, date, out=None, charts=True, export=None, layout='sheets'):
+    if layout not in REPORT_LAYOUTS:
+        raise Exception("Error: Unknown report layout {}, expected one of {}".format(layout, ", ".join(REPORT_LAYOUTS)))
+    # ask the user where to save the report unless a location was given
+    if out is None:
+        out = tkinter.filedialog.asksaveasfilename(defaultextension='.xlsx')
+    if export:
+        print("Exported", ", ".join(export_tables(out, flux_tables(fluxes, [gas_results(flux) for flux in fluxes]), export)))
+    workbook = report_workbook(out)
+    gases = list(fluxes[0].gases) if fluxes else []
+
+    # summary worksheet, displays R^2, rate of change, flux, chamber volume, air temp for each flux, with a block of results per gas
     worksheet = workbook.add_worksheet("Summary")
     worksheet.write_row(0, 0, ["Site:", site])
     worksheet.write_row(1, 0, ["Date:", date])
-    worksheet.write_column(3, 0, ["Flux name", '', "Chamber volume (L)", "Air temp (K)", '', "RSQ", f"Rate of change ({LICOR_GAS.upper()} [{gas_units[LICOR_GAS]}/min])", f"m ({LICOR_GAS.upper()} [{gas_units[LICOR_GAS]}/sec])", f"Flux of {LICOR_GAS.upper()} {output_units[LICOR_GAS]}", "Data loss (%)", "Surface moisture", "Surface temperature", "PAR"])
+    labels = ["Flux name", '', "Chamber volume (L)", "Air temp (K)", '']
+    # the flux model is only reported when something other than a straight line was fit
+    models = any(name != 'linear' for flux in fluxes for name in flux.model.values())
+    if models:
+        labels[1] = "Model"
+    CIs = any(flux.CI for flux in fluxes)
+    level = round(CONFIDENCE_LEVEL * 100)
+    for gas in gases:
+        labels += ["RSQ" if len(gases) == 1 else f"RSQ ({gas.upper()})", f"Rate of change ({gas.upper()} [{gas_units[gas]}/min])", f"m ({gas.upper()} [{gas_units[gas]}/sec])", f"Flux of {gas.upper()} {output_units[gas]}"]
+        if CIs:
+            labels += [f"Flux of {gas.upper()} {level}% CI low", f"Flux of {gas.upper()} {level}% CI high"]
+    columns = [labels + ["Data loss (%)", "Surface moisture", "Surface temperature", "PAR"]]
     for i in range(len(fluxes)):
         vol = fluxes[i].surface_area * fluxes[i].chamber_height * 1000
-        worksheet.write_column(3, i + 1, [fluxes[i].name , '', vol, fluxes[i].temp, '', fluxes[i].RSQ, fluxes[i].RoC, fluxes[i].RoC/60, fluxes[i].flux, fluxes[i].data_loss])
+        results = [fluxes[i].name , '', vol, fluxes[i].temp, '']
+        if models:
+            results[1] = ", ".join(fluxes[i].model[gas] if len(gases) == 1 else f"{gas.upper()} {fluxes[i].model[gas]}" for gas in gases)
+        for gas in gases:
+            results += [fluxes[i].RSQ[gas], fluxes[i].RoC[gas], fluxes[i].RoC[gas]/60, fluxes[i].flux[gas]]
+            if CIs:
+                results += ['' if value != value else value for value in fluxes[i].CI.get(gas, ('', ''))]
+        columns.append(results + [fluxes[i].data_loss])
         worksheet.set_column(i + 1, i + 1, len(fluxes[i].name ))
+    write_columns(worksheet, 3, 0, columns)
     worksheet.set_column(0, 0, len("Rate of change (CH4 [ppm/min])"))  # Gas type and units used only for length
+
+    # the series of every flux in one long table, with charts on their own worksheet
+    if layout == 'long':
+        names = unique_names([flux.name for flux in fluxes])
+        blocks = ((f"{flux_id} {gas.upper()}", f"{gas.upper()} concentration ({gas_units[gas]})", flux_series(flux, flux_id, gas, gas_series(flux, gas)), flux.RSQ[gas])
+                  for flux, flux_id in zip(fluxes, names) for gas in gases)
+        long_sheets(workbook, SERIES_COLUMNS, blocks, charts)
+        workbook.close()
+        return out
     
     # create page for each flux, pages give a detailed breakdown of each fluxes data sets as well as the values that have been cut
-    worksheets = {}
-    for flux in fluxes:
+    header = 3 * len(gases) + 3     # row of the column headers, the data starts on the row after
+    for flux, sheet_name in zip(fluxes, unique_names([flux.name for flux in fluxes])):
         vol = flux.surface_area*flux.chamber_height * 1000
-        if flux.name not in worksheets:
-            worksheet = workbook.add_worksheet(flux.name)
-            worksheets[flux.name] = 1
-        else:
-            worksheets[flux.name] += 1
-            worksheet = workbook.add_worksheet(flux.name + " (%s)" %(str(worksheets[flux.name])))
+        worksheet = workbook.add_worksheet(sheet_name)
         worksheet.write_row(0, 0, ["Name", flux.name])
-        worksheet.write_row(1, 0, ["RSQ", flux.RSQ, '', '', "Chamber volume (L)", vol])
-        worksheet.write_row(2, 0, [f"Rate of change ({LICOR_GAS.upper()} [{gas_units[LICOR_GAS]}/min])", flux.RoC, '', '', "Air temp (K)", flux.temp])
-        worksheet.write_row(3, 0, [f"Flux of {LICOR_GAS.upper()} {output_units[LICOR_GAS]}", flux.flux])
-        worksheet.write_row(4, 0, ["Data loss (%)", flux.data_loss])
-
-        worksheet.write(6, 0, "Original times (s)")
+        # results of each gas on the left, chamber details on the right of the first rows
+        results = []
+        for gas in gases:
+            results += [["RSQ" if len(gases) == 1 else f"RSQ ({gas.upper()})", flux.RSQ[gas]],
+                        [f"Rate of change ({gas.upper()} [{gas_units[gas]}/min])", flux.RoC[gas]],
+                        [f"Flux of {gas.upper()} {output_units[gas]}", flux.flux[gas]]]
+        details = [["Chamber volume (L)", vol], ["Air temp (K)", flux.temp]]
+        if models:
+            details.append(["Model", ", ".join(flux.model[gas] if len(gases) == 1 else f"{gas.upper()} {flux.model[gas]}" for gas in gases)])
+        for r in range(len(results)):
+            worksheet.write_row(r + 1, 0, results[r] + (['', ''] + details[r] if r < len(details) else []))
+        worksheet.write_row(header - 2, 0, ["Data loss (%)", flux.data_loss])
+
+        worksheet.write(header, 0, "Original times (s)")
         worksheet.set_column(0, 0, len("Rate of change (CH4 [ppm/min])"))  # Gas type and units used only for length
-        worksheet.write(6, 1, "Pruned times (s)")
+        worksheet.write(header, 1, "Pruned times (s)")
         worksheet.set_column(1, 1, len("Pruned times (s)"))
-        worksheet.write(6, 2, "Time offsets (s)")
+        worksheet.write(header, 2, "Time offsets (s)")
         worksheet.set_column(2, 2, len("Time offsets (s)"))
 
-        worksheet.write(6, 4, f"Original {LICOR_GAS.upper()} concentrations ({gas_units[LICOR_GAS]})")
-        worksheet.set_column(4, 4, len(f"Original {LICOR_GAS.upper()} concentrations ({gas_units[LICOR_GAS]})"))
-        worksheet.write(6, 5, f"Pruned {LICOR_GAS.upper()} concentrations ({gas_units[LICOR_GAS]})")
-        worksheet.set_column(5, 5, len(f"Pruned {LICOR_GAS.upper()} concentrations ({gas_units[LICOR_GAS]})"))
-        worksheet.write(6, 6, f"{LICOR_GAS.upper()} concentration offsets ({gas_units[LICOR_GAS]})")
-        worksheet.set_column(6, 6, len(f"{LICOR_GAS.upper()} concentration offsets ({gas_units[LICOR_GAS]})"))
-
-        worksheet.write(6, 8, "Original H2O (ppm)")
-        worksheet.set_column(8, 8, len("Original H2O (ppm)"))
-        worksheet.write(6, 9, "Pruned H2O (ppm)")
-        worksheet.set_column(9, 9, len("Pruned H2O (ppm)"))
-
-        for i in range(len(flux.times)):
-            worksheet.write_row(i + 7, 0, [flux.times[i], flux.pruned_times[i], flux.time_offsets[i], '', flux.samples[i], flux.pruned_samples[i], flux.sample_offsets[i], '', flux.H2O[i], flux.pruned_H2O[i]])
-
-        # generate chart showing cut values compared to kept values with offsets
-        chart1 = workbook.add_chart({'type': 'line'})
-        chart1.add_series({'values' : '=\'%s\'!E8:E%i'%(flux.name, len(flux.times) + 9), 'categories' : '=\'%s\'!A8:A%i'%(flux.name, len(flux.samples) + 9), 'name': 'Cut values', 'line': {'color': 'red'}})
-        chart1.add_series({'values' : '=\'%s\'!F8:F%i'%(flux.name, len(flux.times) + 9), 'categories' : '=\'%s\'!A9:A%i'%(flux.name, len(flux.samples) + 9), 'name': 'Kept values', 'line': {'color': 'green'}})
-        chart1.set_y_axis({'interval_unit': 10, 'interval_tick': 2, 'name': f"{LICOR_GAS.upper()} concentration ({gas_units[LICOR_GAS]})"})
-        chart1.set_x_axis({'name': 'Time (s)'})
-        chart1.set_title({'name' : 'Concentration vs. Time'})
-        chart1.set_size({'width': 800, 'height': 600})
-        worksheet.insert_chart('L8', chart1)
-
-        chart2 = workbook.add_chart({'type': 'line'})
-        chart2.add_series({'values' : '=\'%s\'!I8:I%i'%(flux.name, len(flux.times) + 9), 'categories' : '=\'%s\'!A8:A%i'%(flux.name, len(flux.samples) + 9), 'name': 'Cut values', 'line': {'color': 'red'}})
-        chart2.add_series({'values' : '=\'%s\'!J8:J%i'%(flux.name, len(flux.times) + 9), 'categories' : '=\'%s\'!A9:A%i'%(flux.name, len(flux.samples) + 9), 'name': 'Kept values', 'line': {'color': 'green'}})
-        chart2.set_y_axis({'interval_unit': 10, 'interval_tick': 2, 'name': 'H2O (ppm)'})
-        chart2.set_x_axis({'name': 'Time (s)'})
-        chart2.set_title({'name': 'Humidity vs. Time'})
-        chart2.set_size({'width': 800, 'height': 600})
-        worksheet.insert_chart('L40', chart2)
+        # each gas gets its original, pruned and offset columns, followed by H2O
+        columns = [flux.times.tolist(), report_column(flux.pruned_columns['times']), flux.time_offsets.tolist(), None]
+        for gas in gases:
+            col = len(columns)
+            for title in [f"Original {gas.upper()} concentrations ({gas_units[gas]})", f"Pruned {gas.upper()} concentrations ({gas_units[gas]})", f"{gas.upper()} concentration offsets ({gas_units[gas]})"]:
+                worksheet.write(header, col, title)
+                worksheet.set_column(col, col, len(title))
+                col += 1
+            columns += [flux.gases[gas].tolist(), report_column(flux.pruned_columns[gas]), flux.sample_offsets[gas].tolist(), None]
+        H2O_col = len(columns)
+        worksheet.write(header, H2O_col, "Original H2O (ppm)")
+        worksheet.set_column(H2O_col, H2O_col, len("Original H2O (ppm)"))
+        worksheet.write(header, H2O_col + 1, "Pruned H2O (ppm)")
+        worksheet.set_column(H2O_col + 1, H2O_col + 1, len("Pruned H2O (ppm)"))
+        columns += [flux.H2O.tolist(), report_column(flux.pruned_columns['H2O'])]
+
+        # write each data set as a column, with '' for cut indices
+        write_columns(worksheet, header + 1, 0, columns)
+        if not charted([flux.RSQ[gas] for gas in gases], charts):
+            continue
+
+        # generate charts showing cut values compared to kept values with offsets, one per gas then humidity
+        first = header + 2      # first data row, as numbered in excel
+        last = len(flux.times) + header + 3
+        chart_col = xl_col_to_name(H2O_col + 3)
+        plots = [(4*g + 4, f"{gases[g].upper()} concentration ({gas_units[gases[g]]})", 'Concentration vs. Time' if len(gases) == 1 else f"{gases[g].upper()} concentration vs. Time") for g in range(len(gases))]
+        plots.append((H2O_col, 'H2O (ppm)', 'Humidity vs. Time'))
+        for c in range(len(plots)):
+            col, y_axis, title = plots[c]
+            original = xl_col_to_name(col)
+            pruned = xl_col_to_name(col + 1)
+            chart = workbook.add_chart({'type': 'line'})
+            chart.add_series({'values' : '=\'%s\'!%s%i:%s%i'%(sheet_name, original, first, original, last), 'categories' : '=\'%s\'!A%i:A%i'%(sheet_name, first, last), 'name': 'Cut values', 'line': {'color': 'red'}})
+            chart.add_series({'values' : '=\'%s\'!%s%i:%s%i'%(sheet_name, pruned, first, pruned, last), 'categories' : '=\'%s\'!A%i:A%i'%(sheet_name, first + 1, last), 'name': 'Kept values', 'line': {'color': 'green'}})
+            chart.set_y_axis({'interval_unit': 10, 'interval_tick': 2, 'name': y_axis})
+            chart.set_x_axis({'name': 'Time (s)'})
+            chart.set_title({'name' : title})
+            chart.set_size({'width': 800, 'height': 600})
+            worksheet.insert_chart('%s%i' %(chart_col, first + 32*c), chart)
     
     workbook.close()    
     return out
 
 
+# applies cut intervals given on the original time axis of each flux, keyed by worksheet name (see utils.read_cuts)
+def apply_cuts(fluxes, cuts):
+    names = unique_names([flux.name for flux in fluxes])
+    fluxes_by_name = dict(zip(names, fluxes))
+    for name, intervals in cuts.items():
+        if name not in fluxes_by_name:
+            raise Exception("Error: Cuts given for flux {}, which isn't in the field data. Fluxes are named: {}".format(name, ", ".join(names)))
+        flux = fluxes_by_name[name]
+        for time_L, time_R in intervals:
+            if not flux.cuts.cut_original(flux.times, time_L, time_R):
+                raise Exception("Error: Cutting {} to {} seconds would remove all of the data of flux {}".format(time_L, time_R, name))
+
+
+# non-interactive processing, cuts come from a dictionary or cuts file instead of the plots
+def process(field_data, licor_data, gas, out, site='', date='', cuts=None, all_gases=False, auto_cut=False, best_window=None, model='linear', bootstrap=0, processes=1, charts=True, export=None, layout='sheets'):
+    session = Session(gas, all_gases)
+    fluxes = input_data(field_data, licor_data, session)
+    if best_window:
+        best_windows(fluxes, criterion=best_window)
+    if auto_cut:
+        # suggested ebullition cuts are made first, so cuts from a cuts file still refer to the original time axis
+        for flux in fluxes:
+            flux.cuts.cut_suggestions(flux.times, ebullition(flux.times, flux.samples))
+    if isinstance(cuts, str):
+        cuts = read_cuts(cuts)
+    if cuts:
+        apply_cuts(fluxes, cuts)
+    flux_calculation(fluxes, model)
+    if bootstrap:
+        confidence_intervals(fluxes, bootstrap, processes)
+    offsets(fluxes)
+    return outputData(fluxes, site, date, out, charts, export, layout)
+
+
+# prints the results of a flux as soon as it's calculated in live mode
+def print_flux(flux):
+    for gas in flux.gases:
+        print("{}: {} RSQ = {:.5f}, rate of change = {:.5g} {}/min, flux = {:.5g} {}".format(flux.name, gas.upper(), flux.RSQ[gas], flux.RoC[gas], gas_units[gas], flux.flux[gas], output_units[gas]))
+    sys.stdout.flush()
+
+
+# live mode, follows a LICOR file (or the newest file in a folder) while it's being logged and calculates each flux,
+# without cuts, as soon as the logged data passes its end time. Results are passed to on_flux as they're calculated.
+# Stops once every flux is done (or on ctrl-c), writes the report of the calculated fluxes if out is given and returns them
+def watch(field_data, licor_data, gas, out=None, site='', date='', all_gases=False, on_flux=print_flux, poll_interval=POLL_INTERVAL, model='linear'):
+    session = Session(gas, all_gases)
+    fluxes = read_field_data(field_data)
+    tail = LicorTail(licor_data)
+    data = None         # logged rows that an unfinished flux may still need
+    starts = None
+    pending = list(range(len(fluxes)))
+    done = []
+    try:
+        while pending:
+            rows = tail.poll()
+            if len(rows):
+                data = rows if data is None else np.concatenate([data, rows])
+            # nothing logged yet, or every row was forgotten and none has been logged since
+            if data is None or not len(data):
+                time.sleep(poll_interval)
+                continue
+            if starts is None:
+                index, gases, parsed_gases = licor_columns(tail.header, session)
+                # the LICOR keeps logging, so the field sheet may run into the next days
+                starts, ends = flux_epochs(fluxes, data[0, index['seconds']] - data[0, index['time']], np.inf)
+
+            # a flux is closed once the LICOR has logged past its end time
+            latest = np.nanmax(data[:, index['seconds']])
+            closed = [k for k in pending if ends[k] + TIME_TOLERANCE < latest]
+            for k in closed:
+                try:
+                    load_fluxes([fluxes[k]], data, index, gases, parsed_gases, starts[[k]], ends[[k]])
+                    flux_calculation([fluxes[k]], model)
+                except Exception as e:
+                    print(e)
+                    continue
+                done.append(fluxes[k])
+                on_flux(fluxes[k])
+            pending = [k for k in pending if k not in closed]
+
+            # forget rows logged before every unfinished flux
+            if pending:
+                data = data[data[:, index['seconds']] >= starts[pending].min() - TIME_TOLERANCE - 1]
+            if not closed:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Stopped watching, {} of {} fluxes calculated".format(len(done), len(fluxes)))
+
+    done = [flux for flux in fluxes if flux in done]
+    if out is not None and done:
+        offsets(done)
+        outputData(done, site, date, out)
+    return done
+
+
 #########################################################################################################################
 ######################################## script execution starts here! ##################################################
 #########################################################################################################################
@@ -519,13 +792,20 @@ def LICOR():
     layout = [[sg.Text('LICOR Flux Data Processing Tool', font='Any 36', background_color='#DF954A')],
         [sg.Text("", background_color='#DF954A')],
         [sg.Text('Field data file: (.csv, .txt)', size=(21, 1), background_color='#DF954A'), sg.Input(key='-FIELD-'), sg.FileBrowse()],
-        [sg.Text('LICOR data file: (.csv, .txt)', size=(21, 1), background_color='#DF954A'), sg.Input(key='-LICOR-'), sg.FileBrowse()],
+        [sg.Text('LICOR data file(s): (.csv, .txt, .data)', size=(21, 1), background_color='#DF954A'), sg.Input(key='-LICOR-'), sg.FilesBrowse()],
         [
             sg.Text('Gas to analyze:', size=(15, 1), background_color='#DF954A'),
             sg.Radio('CO2', 'RADIO2', enable_events=True, default=False, key='-CO2-', background_color='#DF954A'),
             sg.Radio('CH4', 'RADIO2', enable_events=True, default=True, key='-CH4-', background_color='#DF954A'),
             sg.Radio('N2O', 'RADIO2', enable_events=True, default=False, key='-N2O-', background_color='#DF954A'),
         ],
+        [sg.Checkbox('Also calculate every other gas in the LICOR file (same cuts)', default=False, key='-ALL-', background_color='#DF954A')],
+        [sg.Text('Flux model:', size=(15, 1), background_color='#DF954A'), sg.Combo(list(FLUX_MODELS) + ['aic'], default_value='linear', readonly=True, key='-MODEL-')],
+        [sg.Checkbox(f'Bootstrap {round(CONFIDENCE_LEVEL * 100)}% confidence intervals of the fluxes', default=False, key='-CI-', background_color='#DF954A')],
+        [sg.Checkbox('Start each flux trimmed to its best linear window (by R^2)', default=False, key='-WINDOW-', background_color='#DF954A')],
+        [sg.Text('Also export tables:', size=(15, 1), background_color='#DF954A'), sg.Combo(['none'] + list(EXPORT_FORMATS), default_value='none', readonly=True, key='-EXPORT-')],
+        [sg.Text('Report layout:', size=(15, 1), background_color='#DF954A'), sg.Combo(list(REPORT_LAYOUTS), default_value='sheets', readonly=True, key='-LAYOUT-'),
+            sg.Text('Only chart fluxes with R^2 below:', background_color='#DF954A'), sg.InputText(key='-CHARTRSQ-', size=(6, 1))],
         [sg.Text("Site name:", size=(15, 1), background_color='#DF954A'), sg.InputText(key='-SITE-')],
         [sg.Text("Date:", size=(15, 1), background_color='#DF954A'), sg.InputText(key='-DATE-')],
         [sg.Text("", background_color='#DF954A')],
@@ -556,14 +836,13 @@ def LICOR():
             window[f'-CIRCLE-'].update(True)
 
     if cancelled == False:
-        # Set the global LICOR_GAS variable based on the radio button selected
-        global LICOR_GAS
+        # Set the session's gas based on the radio button selected
         if values['-CO2-']:
-            LICOR_GAS = 'co2'
+            session = Session('co2', values['-ALL-'])
         elif values['-CH4-']:
-            LICOR_GAS = 'ch4'
-        else:  # values['-CH4-'] is True
-            LICOR_GAS = 'n2o'
+            session = Session('ch4', values['-ALL-'])
+        else:  # values['-N2O-'] is True
+            session = Session('n2o', values['-ALL-'])
 
         try:
             field_data = values['-FIELD-']
@@ -577,19 +856,28 @@ def LICOR():
 
         try:
             print("Reading input files")
-            fluxes = input_data(field_data, licor_data)
+            fluxes = input_data(field_data, licor_data, session)
+
+            if values['-WINDOW-']:
+                print("Searching for the best linear windows")
+                best_windows(fluxes)
 
             print("Pruning data")
-            prune(fluxes)
+            prune(fluxes, session)
 
             print("Calculating fluxes")
-            flux_calculation(fluxes)
+            flux_calculation(fluxes, values['-MODEL-'])
+
+            if values['-CI-']:
+                print("Bootstrapping confidence intervals")
+                confidence_intervals(fluxes)
 
             print("Calculating offsets")
             offsets(fluxes)
 
             print("Outputting data")
-            out = outputData(fluxes, site, date)
+            charts = float(values['-CHARTRSQ-']) if values['-CHARTRSQ-'].strip() else True
+            out = outputData(fluxes, site, date, charts=charts, export=values['-EXPORT-'] if values['-EXPORT-'] != 'none' else None, layout=values['-LAYOUT-'])
 
         except Exception as e:
             window.close()
@@ -597,4 +885,41 @@ def LICOR():
             raise e
 
     window.close()
-    return 0
\ No newline at end of file
+    return 0
+
+
+# headless batch mode, e.g. python LICOR.py field_data.txt LICOR_data.txt --gas ch4 --cuts cuts.json -o report.xlsx
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Process LICOR flux data without the GUI")
+    parser.add_argument("field_data", help="field data file (.csv, .txt)")
+    parser.add_argument("licor_data", nargs='+', help="LICOR data file(s) (.csv, .txt, .data) or a folder of them, merged into one timeline")
+    parser.add_argument("--gas", choices=sorted(gas_units), default="ch4", help="gas to analyze")
+    parser.add_argument("--all-gases", action="store_true", help="also calculate fluxes for every other gas in the LICOR file")
+    parser.add_argument("--cuts", help="JSON or CSV file of cut intervals (s) per flux, keyed by worksheet name")
+    parser.add_argument("--auto-cut", action="store_true", help="cut every suggested ebullition interval before applying --cuts")
+    parser.add_argument("--best-window", choices=['r2', 'rmse'], help="trim each flux to its best linear window by this criterion before any other cuts")
+    parser.add_argument("--model", choices=list(FLUX_MODELS) + ['aic'], default='linear', help="flux model, aic picks the best model of each flux")
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="RESAMPLES", help="add bootstrap confidence intervals of the fluxes from this many resamples (e.g. %d)" %(BOOTSTRAP_RESAMPLES))
+    parser.add_argument("--processes", type=int, default=1, help="processes to spread the bootstrap over")
+    parser.add_argument("--no-charts", action="store_true", help="leave the charts out of the report, for large campaigns")
+    parser.add_argument("--chart-rsq", type=float, metavar="RSQ", help="only chart fluxes with an R^2 below this")
+    parser.add_argument("--layout", choices=REPORT_LAYOUTS, default='sheets', help="a worksheet per flux, or every flux's series in one long table")
+    parser.add_argument("--export", choices=EXPORT_FORMATS, help="also export the flux summary and series as tables next to the report")
+    parser.add_argument("--site", default='', help="site name")
+    parser.add_argument("--date", default='', help="date")
+    parser.add_argument("-o", "--out", help="output report (.xlsx), required unless watching")
+    parser.add_argument("--watch", action="store_true", help="follow a LICOR file (or folder) while it's being logged and print each flux as soon as it ends")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="seconds between checks for new data when watching")
+    args = parser.parse_args()
+    charts = False if args.no_charts else args.chart_rsq if args.chart_rsq is not None else True
+
+    if args.watch:
+        if len(args.licor_data) != 1:
+            parser.error("--watch follows a single LICOR file or folder")
+        watch(args.field_data, args.licor_data[0], args.gas, args.out, args.site, args.date, args.all_gases, poll_interval=args.interval, model=args.model)
+    elif args.out is None:
+        parser.error("the following arguments are required: -o/--out")
+    else:
+        print("Wrote", process(args.field_data, args.licor_data, args.gas, args.out, args.site, args.date, args.cuts, args.all_gases, args.auto_cut, args.best_window, args.model, args.bootstrap, args.processes, charts, args.export, args.layout))
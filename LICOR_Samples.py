@@ -1,11 +1,9 @@
 from math import nan
 import sys
 import matplotlib.pyplot as plt
-import matplotlib.lines as lines
 import numpy as np
 import random
 import csv
-import math
 import datetime
 import os
 import re
@@ -17,50 +15,21 @@ import PySimpleGUI as sg
 import traceback
 import statsmodels.api as sm
 
+from licor_data import open_licor, epoch_ns, NS
+from utils import review_plot
 
-LICOR_GAS = None
 
-# draggable lines for user cuts
-class draggable_lines:
-    def __init__(self, ax, start_coordinate, x_bounds, y_bounds):
-        self.ax = ax
-        self.c = ax.get_figure().canvas
-        self.x_bounds = x_bounds
-        self.y_bounds = y_bounds
-        self.press = None
+class Session:
+    """
+    Which LICOR was used for a set of injected samples, CO2/CH4 or N2O. It decides the columns read, the plots
+    drawn and the peak areas and standards reported, and is passed to each step instead of a module global.
+    """
+    __slots__ = ('gas',)
 
-        self.line = lines.Line2D([start_coordinate, start_coordinate], y_bounds, color='r', picker=5)
-
-        self.ax.add_line(self.line)
-        self.c.draw_idle()
-        self.sid = self.c.mpl_connect('button_press_event', self.on_press)
-        self.sid = self.c.mpl_connect('motion_notify_event', self.on_motion)
-        self.sid = self.c.mpl_connect('button_release_event', self.on_release)
-
-
-    def on_press(self, event):
-        if abs(event.xdata - self.line.get_xdata()[0]) < 3:
-            self.press = (self.line.get_xdata()[0], event.xdata)
-        return
-    
-    def on_motion(self, event):
-        if self.press == None:
-            return 
-        try: 
-            x0, xpress = self.press
-            dx = event.xdata - xpress
-            if self.x_bounds[0] >= (x0 + dx):
-                self.line.set_xdata([self.x_bounds[0],self.x_bounds[0]])
-            elif (x0 + dx) >= self.x_bounds[1]:
-                self.line.set_xdata([self.x_bounds[1], self.x_bounds[1]])
-            else:
-                self.line.set_xdata([x0+dx, x0+dx])
-        except:
-            pass
-    
-    def on_release(self, event):
-        self.press = None
-        self.c.draw_idle()
+    def __init__(self, gas):
+        self.gas = gas.upper()      # gases analyzed, CO2/CH4 or N2O
+        if self.gas not in ("CO2/CH4", "N2O"):
+            raise Exception("Error: Unknown gas {}, expected CO2/CH4 or N2O".format(gas))
 
 
 # sample object, one created for each individual sample
@@ -86,9 +55,10 @@ class sample:
         self.H2O = nan
 
 
-def input_data(sample_data, LICOR_data):
+# returns the samples and the LICOR rows around them as an array sorted by time, its first column being the times
+def input_data(sample_data, LICOR_data, session):
     samples = []
-    LICOR = []
+    LICOR = np.empty((0, 0))
 
     time_regex = r"(\d*):(\d*):(\d*)"
 
@@ -98,38 +68,6 @@ def input_data(sample_data, LICOR_data):
     LICOR_N2O_regex = r"N2O"
     LICOR_H2O_regex = r"H2O"
 
-    try:
-        f = open(LICOR_data, "r")
-        x = next(f).replace('\t', ',').replace(';',',').split(",")
-        while x[0] != "DATAH":
-            x = next(f).replace('\t', ',').replace(';',',').split(",")
-        print(x)
-        for i in range(len(x)):
-            if re.search(LICOR_time_regex, x[i], re.IGNORECASE):
-                LICOR_time_index = i
-            if re.search(LICOR_CH4_regex, x[i], re.IGNORECASE):
-                LICOR_CH4_index = i
-            if re.search(LICOR_CO2_regex, x[i], re.IGNORECASE):
-                LICOR_CO2_index = i
-            if re.search(LICOR_N2O_regex, x[i], re.IGNORECASE):
-                LICOR_N2O_index = i
-            if re.search(LICOR_H2O_regex, x[i], re.IGNORECASE):
-                LICOR_H2O_index = i
-
-        for line in f:
-            x = line.replace('\t', ',').replace(';', ',').split(',')
-            for k in range(len(x)):
-                x[k] = x[k].strip(' \t\n\r')
-            if x[0] == "DATA":
-                time_match = re.search(time_regex, x[LICOR_time_index])
-                time = float(time_match[1])*3600 + float(time_match[2])*60 + float(time_match[3])
-                if LICOR_GAS == "CO2/CH4":
-                    LICOR.append([time, float(x[LICOR_CH4_index])/1000, x[LICOR_CO2_index], x[LICOR_H2O_index]])
-                else:
-                    LICOR.append([time, float(x[LICOR_N2O_index])/1000, x[LICOR_H2O_index]])
-    except:
-        raise Exception("Error processing LICOR data file, please ensure you're using the original unedited file")
-
     try:
         f = open(sample_data, "r") 
         for line in f:
@@ -145,6 +83,50 @@ def input_data(sample_data, LICOR_data):
     except:
         raise Exception("Error processing sample file, please ensure all samples are listed in chronological order with no time overlap")
 
+    # the LICOR file(s) are memory mapped and only the rows around each sample are decoded
+    try:
+        reader = open_licor(LICOR_data)
+        header = reader.header
+        for i in range(len(header)):
+            if re.search(LICOR_time_regex, header[i], re.IGNORECASE):
+                LICOR_time_index = i
+            if re.search(LICOR_CH4_regex, header[i], re.IGNORECASE):
+                LICOR_CH4_index = i
+            if re.search(LICOR_CO2_regex, header[i], re.IGNORECASE):
+                LICOR_CO2_index = i
+            if re.search(LICOR_N2O_regex, header[i], re.IGNORECASE):
+                LICOR_N2O_index = i
+            if re.search(LICOR_H2O_regex, header[i], re.IGNORECASE):
+                LICOR_H2O_index = i
+
+        if session.gas == "CO2/CH4":
+            columns = [LICOR_CH4_index, LICOR_CO2_index, LICOR_H2O_index]
+        else:
+            columns = [LICOR_N2O_index, LICOR_H2O_index]
+        time_columns = [reader.seconds_index] + ([] if reader.nanoseconds_index is None else [reader.nanoseconds_index])
+
+        # sample times are local times of day, anchor them to the epoch of the LICOR file's first local midnight
+        # a sample never runs more than 180 seconds past its start (see process_samples)
+        first_row = reader.first_row([reader.seconds_index, LICOR_time_index])
+        midnight = first_row[reader.seconds_index] - first_row[LICOR_time_index]
+        data = reader.windows([(midnight + s.start_time - 1, midnight + s.start_time + 181) for s in samples], time_columns + columns)
+        reader.close()
+
+        # LICOR times are seconds since midnight, with the sub-second precision of the SECONDS and NANOSECONDS columns
+        nanoseconds = data[:, reader.nanoseconds_index] if reader.nanoseconds_index is not None else None
+        times = (epoch_ns(data[:, reader.seconds_index], nanoseconds) - epoch_ns(midnight)) / NS
+        if session.gas == "CO2/CH4":
+            LICOR = np.column_stack((times, data[:, columns[0]]/1000, data[:, columns[1]], data[:, columns[2]]))
+        else:
+            LICOR = np.column_stack((times, data[:, columns[0]]/1000, data[:, columns[1]]))
+        # sorted once here so that sample windows are found by binary search (see sample_window)
+        LICOR = LICOR[np.argsort(LICOR[:, 0], kind='stable')]
+    except:
+        raise Exception("Error processing LICOR data file, please ensure you're using the original unedited file")
+
+    if len(LICOR) == 0:
+        raise Exception("Error: No LICOR data found at the sample times, please check the sample file times.")
+
     return samples, LICOR
 
 
@@ -166,8 +148,22 @@ def process_samples(samples, LICOR):
                 samples[i].peak_end_time = samples[i].peak_start_time + 180
         
 
+# LICOR row indices [start, end) of the rows from start_time up to but excluding end_time
+def sample_window(LICOR, start_time, end_time):
+    times = LICOR[:, 0]
+    return np.searchsorted(times, start_time, 'left'), np.searchsorted(times, end_time, 'left')
+
+
+# index of the time closest to t in sorted times, the earliest one on ties
+def closest_index(times, t):
+    i = np.searchsorted(times, t, 'left')
+    if i == len(times) or (i > 0 and t - times[i - 1] <= times[i] - t):
+        return max(i - 1, 0)
+    return i
+
+
 # process button press for plot
-def on_press(event, i, samples, line_L, line_R, LICOR, fig, ax1, ax2, ax3, cid):
+def on_press(event, i, samples, line_L, line_R, LICOR, fig, ax1, ax2, ax3, cid, session):
     sys.stdout.flush()
 
     # when changing samples, obtain newly set start and end times from the positions of the user set bounds
@@ -180,78 +176,59 @@ def on_press(event, i, samples, line_L, line_R, LICOR, fig, ax1, ax2, ax3, cid):
             plt.close()
             return 0
         else:
-            ax1.clear()
-            ax2.clear()
-            if ax3:
-                ax3.clear()
-            draw_plot(i + 1, samples, LICOR, fig, ax1, ax2, ax3, cid)
+            draw_plot(i + 1, samples, LICOR, fig, ax1, ax2, ax3, cid, session)
 
 
     # left arrow key moves to the previous sample, or does nothing if at the beginning
     if event.key == 'left':
         if i != 0:
-            draw_plot(i - 1, samples, LICOR, fig, ax1, ax2, ax3, cid)
+            draw_plot(i - 1, samples, LICOR, fig, ax1, ax2, ax3, cid, session)
 
 
 #draw plot for i-th sample
-def draw_plot(i, samples, LICOR, fig, ax1, ax2, ax3, cid):
-    """If LICOR_GAS == N2O, ax3 will be None"""
+def draw_plot(i, samples, LICOR, fig, ax1, ax2, ax3, cid, session):
+    """If the session's gas is N2O, ax3 will be None"""
 
     # if sample hasn't already been processed
     if len(samples[i].times) == 0:
 
-        LICOR_start = 0
-        LICOR_end = 0
-
-        for j in range(len(LICOR)):
-            if float(samples[i].peak_start_time) - float(LICOR[j][0]) <= 0 and LICOR_start == 0:
-                LICOR_start = j
-            if float(samples[i].peak_end_time) - float(LICOR[j][0]) <= 0 and LICOR_end == 0:
-                LICOR_end = j
-
-        if LICOR_GAS == "CO2/CH4":
-            for k in range(math.floor(LICOR_start), math.ceil(LICOR_end)):
-                samples[i].times.append(float(LICOR[k][0]))
-                samples[i].concentrations_CH4.append(float(LICOR[k][1]))
-                samples[i].concentrations_CO2.append(float(LICOR[k][2]))
-                samples[i].concentrations_H2O.append(float(LICOR[k][3]))     
+        LICOR_start, LICOR_end = sample_window(LICOR, samples[i].peak_start_time, samples[i].peak_end_time)
+        window = LICOR[LICOR_start:LICOR_end]
+
+        samples[i].times = window[:, 0].tolist()
+        if session.gas == "CO2/CH4":
+            samples[i].concentrations_CH4 = window[:, 1].tolist()
+            samples[i].concentrations_CO2 = window[:, 2].tolist()
+            samples[i].concentrations_H2O = window[:, 3].tolist()
         else:
-            for k in range(math.floor(LICOR_start), math.ceil(LICOR_end)):
-                samples[i].times.append(float(LICOR[k][0]))
-                samples[i].concentrations_N2O.append(float(LICOR[k][1]))
-                samples[i].concentrations_H2O.append(float(LICOR[k][2])) 
-
-    ax1.clear()
-    ax1.grid(True)
-    ax2.clear()
-    ax2.grid(True)
-
-    if LICOR_GAS == "CO2/CH4":
-        ax1.plot(samples[i].times, samples[i].concentrations_CH4, linewidth = 2.0)
+            samples[i].concentrations_N2O = window[:, 1].tolist()
+            samples[i].concentrations_H2O = window[:, 2].tolist()
+
+    # the figure's artists are created on the first draw and updated in place afterwards
+    plot = review_plot(fig)
+    if session.gas == "CO2/CH4":
+        plot.plot(ax1, samples[i].times, samples[i].concentrations_CH4)
         ax1.set(ylabel="CH4 concentration (ppm)")  # y axis label
 
-        ax2.plot(samples[i].times, samples[i].concentrations_CO2 , linewidth = 2.0)
+        plot.plot(ax2, samples[i].times, samples[i].concentrations_CO2)
         ax2.set(ylabel="CO2 concentration (ppm)")
 
-        ax3.clear()
-        ax3.grid(True)
-        ax3.plot(samples[i].times, samples[i].concentrations_H2O , linewidth = 2.0)
+        plot.plot(ax3, samples[i].times, samples[i].concentrations_H2O)
         ax3.set(ylabel="H2O concentration (ppm)")  # y axis label
         ax3.set(xlabel="Time (s)")  # x axis label
 
         num_samples = len(samples[i].concentrations_CH4)
     else:
-        ax1.plot(samples[i].times, samples[i].concentrations_N2O, linewidth = 2.0)
+        plot.plot(ax1, samples[i].times, samples[i].concentrations_N2O)
         ax1.set(ylabel="N2O concentration (ppm)")  # y axis label
 
-        ax2.plot(samples[i].times, samples[i].concentrations_H2O , linewidth = 2.0)
+        plot.plot(ax2, samples[i].times, samples[i].concentrations_H2O)
         ax2.set(ylabel="H2O concentration (ppm)")  # y axis label 
         ax2.set(xlabel="Time (s)")
 
         num_samples = len(samples[i].concentrations_N2O)
 
-    line_L = draggable_lines(ax1, samples[i].peak_start_time, [samples[i].start_time, samples[i].start_time + num_samples], ax1.get_ylim())   # left draggable boundary line
-    line_R = draggable_lines(ax1, samples[i].peak_end_time, [samples[i].start_time, samples[i].start_time + num_samples], ax1.get_ylim())     # right draggable boundary line
+    line_L, line_R = plot.cursors(ax1, samples[i].peak_start_time, samples[i].peak_end_time, [samples[i].start_time, samples[i].start_time + num_samples])   # left and right draggable boundary lines
 
     # if currently on the last sample, change header information, otherwise set title to user controls
     if i == len(samples) - 1:
@@ -260,32 +237,27 @@ def draw_plot(i, samples, LICOR, fig, ax1, ax2, ax3, cid):
         ax1.set(title = samples[i].name + '\nUse arrow keys to navigate samples\nUse the mouse to drag peak bounds')
 
     fig.canvas.mpl_disconnect(cid)
-    cid = fig.canvas.mpl_connect('key_press_event', lambda event: on_press(event, i, samples, line_L, line_R, LICOR, fig, ax1, ax2, ax3, cid))   # connect key press event
-    fig.canvas.draw()
+    cid = fig.canvas.mpl_connect('key_press_event', lambda event: on_press(event, i, samples, line_L, line_R, LICOR, fig, ax1, ax2, ax3, cid, session))   # connect key press event
+    plot.draw()
 
 
 # obtains peak bounds from user interactive plots
-def obtain_peaks(samples, LICOR):
+def obtain_peaks(samples, LICOR, session):
     i = 0
-    # Create figure and axes for plots. If LICOR_GAS == CO2/CH4, create
+    # Create figure and axes for plots. If the session's gas is CO2/CH4, create
     # a third plot at the bottom for raw CO2 measurements.
-    if LICOR_GAS == 'CO2/CH4':
+    if session.gas == 'CO2/CH4':
         fig, (ax1, ax2, ax3) = plt.subplots(3, 1)
         fig.set_size_inches(9, 7)
-        sample_concentrations = samples[i].concentrations_CH4
     else:
         fig, (ax1, ax2) = plt.subplots(2, 1)
         fig.set_size_inches(9,6)
         ax3 = None
-        sample_concentrations = samples[i].concentrations_N2O 
-
-    line_L = draggable_lines(ax1, samples[i].peak_start_time, [samples[i].start_time, samples[i].start_time + len(sample_concentrations)], plt.gca().get_ylim())   # left draggable boundary line
-    line_R = draggable_lines(ax1, samples[i].peak_end_time, [samples[i].start_time, samples[i].start_time + len(sample_concentrations)], plt.gca().get_ylim())     # right draggable boundary line
 
-    cid = fig.canvas.mpl_connect('key_press_event', lambda event: on_press(event, i, samples, line_L, line_R, LICOR, fig, ax1, ax2, ax3, cid))   # connect key press event
+    cid = ''
     plt.grid(True)
     plt.ion()
-    draw_plot(i, samples, LICOR, fig, ax1, ax2, ax3, cid)
+    draw_plot(i, samples, LICOR, fig, ax1, ax2, ax3, cid, session)
     plt.show(block=False)
     while plt.get_fignums():
         fig.canvas.draw_idle()
@@ -293,47 +265,27 @@ def obtain_peaks(samples, LICOR):
 
 
 # using the new user set start and end times, trim all extraneous data outside these bounds
-# also cut out samples from overall Licor data set, for random baseline sampling used to generate linear model
-def standardize(samples, LICOR):
+def standardize(samples, session):
     for j in range(len(samples)):
-        LICOR_start = 0           # sample start index within sample time and concentration sets (not Licor data indices)
-        LICOR_end = 0             # sample end index within sample time and concentration sets (not Licor data incides)
-        LICOR_cut_L = 0           # sample start index within Licor data set
-        LICOR_cut_R = 0           # sample end index within Licor data set
-        start_temp = np.inf     # temporary variable for finding closest Licor time to user set start time
-        end_temp = np.inf       # temporary variable for finding closest Licor time to user set end time
-
-        # trims sample time and concentration sets
-        #TODO: This can be smarter, will come back later
-        for i in range(len(samples[j].times)):
-            if abs(samples[j].peak_start_time - samples[j].times[i]) < start_temp:
-                start_temp = abs(samples[j].peak_start_time - samples[j].times[i])
-                LICOR_start = i
-            if abs(samples[j].peak_end_time - samples[j].times[i]) < end_temp:
-                end_temp = abs(samples[j].peak_end_time - samples[j].times[i])
-                LICOR_end = i
+        # trims sample time and concentration sets to the samples closest to the user set start and end times
+        # (indices within the sample's own sets, not Licor data indices)
+        LICOR_start = closest_index(samples[j].times, samples[j].peak_start_time)
+        LICOR_end = closest_index(samples[j].times, samples[j].peak_end_time)
 
         # trim sample times and concentrations 
         samples[j].times = samples[j].times[LICOR_start: LICOR_end + 1]
-        if LICOR_GAS == "CO2/CH4":
+        if session.gas == "CO2/CH4":
             samples[j].concentrations_CH4 = samples[j].concentrations_CH4[LICOR_start: LICOR_end + 1]
             samples[j].concentrations_CO2 = samples[j].concentrations_CO2[LICOR_start: LICOR_end + 1]
         else:
             samples[j].concentrations_N2O = samples[j].concentrations_N2O[LICOR_start: LICOR_end + 1]
-        # cuts out sample from overall Licor data (used for baseline sampling in generating linear model)
-        for k in range(len(LICOR)):
-            if float(LICOR[k][0]) == samples[j].times[0]:
-                LICOR_cut_L = k
-            if float(LICOR[k][0]) == samples[j].times[-1]:
-                LICOR_cut_R = k
-        LICOR = LICOR[0: LICOR_cut_L] + LICOR[LICOR_cut_R + 1: -1]
 
 
 # integrates each sample to get peak areas
-def peak_areas(samples):
+def peak_areas(samples, session):
     for i in range(len(samples)):
 
-        if LICOR_GAS == "CO2/CH4":
+        if session.gas == "CO2/CH4":
             # determines whether the sample has a positive or negative peak based on the value of the middle relative to the beginning
             if samples[i].concentrations_CH4[int(len(samples[i].concentrations_CH4)/2)] < samples[i].concentrations_CH4[0]: # negative peak
                 baseline_CH4 = max(samples[i].concentrations_CH4)
@@ -369,7 +321,7 @@ def peak_areas(samples):
             samples[i].area_N2O = area_N2O
 
 # performs linear regression to generate linear relationship between peak areas and CH4 concentration
-def linear_model(samples, LICOR):
+def linear_model(samples, LICOR, session):
     X_CH4 = []
     Y_CH4 = []
 
@@ -439,7 +391,7 @@ def linear_model(samples, LICOR):
 
         return m, b, R2, p, F
 
-    if LICOR_GAS == "CO2/CH4":
+    if session.gas == "CO2/CH4":
         # m_CH4, b_CH4, R2_CH4, p_CH4, F_CH4 = statsmodels_linear_regression(X_CH4, Y_CH4)
         # m_CO2, b_CO2, R2_CO2, p_CO2, F_CO2 = statsmodels_linear_regression(X_CO2, Y_CO2)
         return *statsmodels_linear_regression(X_CH4, Y_CH4), *statsmodels_linear_regression(X_CO2, Y_CO2)
@@ -528,7 +480,7 @@ def LICOR_Samples():
     layout = [[sg.Text('LICOR sample Data Processing Tool', font='Any 36', background_color='#01A100')],
         [sg.Text("", background_color='#01A100')],
         [sg.Text('Sample data file: (.csv, .txt)', size=(21, 1), background_color='#01A100'), sg.Input(key='-SAMPLES-'), sg.FileBrowse()],
-        [sg.Text('LICOR data file: (.csv, .txt, .data)', size=(21, 1), background_color='#01A100'), sg.Input(key='-LICOR-'), sg.FileBrowse()],
+        [sg.Text('LICOR data file(s): (.csv, .txt, .data)', size=(21, 1), background_color='#01A100'), sg.Input(key='-LICOR-'), sg.FilesBrowse()],
         [sg.Text('Gas to analyze:', size=(15, 1), background_color='#01A100'), sg.Radio('CO2/CH4', 'RADIO2', enable_events=True, default=False, key='-CO2/CH4-', background_color='#01A100'), sg.Radio('N2O', 'RADIO2',enable_events=True, default=True, key='-N2O-', background_color='#01A100')],
         [sg.Text("", background_color='#01A100')],
         [sg.Submit(), sg.Cancel()]]
@@ -557,32 +509,31 @@ def LICOR_Samples():
         sample_data = values['-SAMPLES-']
         LICOR_data = values['-LICOR-']
 
-        global LICOR_GAS
         if values['-CO2/CH4-']:
-            LICOR_GAS = 'CO2/CH4'
+            session = Session('CO2/CH4')
         else:
-            LICOR_GAS = 'N2O'
+            session = Session('N2O')
 
         try:
             print("Reading input files")
-            samples, LICOR = input_data(sample_data, LICOR_data)
+            samples, LICOR = input_data(sample_data, LICOR_data, session)
 
             print("Processing data")
             process_samples(samples, LICOR)
 
             print("Obtaining peak bounds")
-            obtain_peaks(samples, LICOR)
+            obtain_peaks(samples, LICOR, session)
 
             print("Trimming data")
-            standardize(samples, LICOR)
+            standardize(samples, session)
 
             print("Calculating peak areas")
-            peak_areas(samples)
+            peak_areas(samples, session)
 
             print("Generating linear model")
 
-            if LICOR_GAS == "CO2/CH4":
-                m_CH4, b_CH4, R2_CH4, p_CH4, F_CH4, m_CO2, b_CO2, R2_CO2, p_CO2, F_CO2 = linear_model(samples, LICOR)
+            if session.gas == "CO2/CH4":
+                m_CH4, b_CH4, R2_CH4, p_CH4, F_CH4, m_CO2, b_CO2, R2_CO2, p_CO2, F_CO2 = linear_model(samples, LICOR, session)
                 print("Calculating concentrations")
                 for i in range(len(samples)):
                     samples[i].CH4 = samples[i].area_CH4 * m_CH4 + b_CH4
@@ -591,7 +542,7 @@ def LICOR_Samples():
                 print("Outputting data")
                 outputData_CO2_CH4(samples, m_CH4, b_CH4, R2_CH4, p_CH4, F_CH4, m_CO2, b_CO2, R2_CO2, p_CO2, F_CO2)
             else:
-                m_N2O, b_N2O, R2_N2O, p_N2O, F_N2O = linear_model(samples, LICOR)
+                m_N2O, b_N2O, R2_N2O, p_N2O, F_N2O = linear_model(samples, LICOR, session)
                 print("Calculating concentrations")
                 for i in range(len(samples)):
                     samples[i].N2O = samples[i].area_N2O * m_N2O + b_N2O
@@ -0,0 +1,569 @@
+# Reads raw LICOR data files (.data, .txt, .csv) into numeric columns
+# Parsed columns are cached in CACHE_DIR, so reopening a file is a near-instant load
+# Large files are memory mapped instead, and only the rows and columns a window needs are decoded
+
+import os
+import glob
+import mmap
+import heapq
+import hashlib
+import numpy as np
+
+from utils import time_to_seconds
+
+# parsed files are cached here, set to None to disable the cache
+CACHE_DIR = os.environ.get("PEDRO_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".pedro_cache"))
+# least recently used cache files are removed once the cache grows past this many bytes
+CACHE_SIZE = 2 * 1024 ** 3
+# bump when the parsed format changes so old cache files are never loaded
+CACHE_VERSION = 1
+# files larger than this many bytes are read through a LicorReader rather than parsed whole
+MMAP_SIZE = 256 * 1024 ** 2
+# a LicorReader indexes the byte offset and epoch of every BLOCK_ROWS-th line
+BLOCK_ROWS = 1024
+# bytes scanned at a time while building the index
+CHUNK_BYTES = 16 * 1024 ** 2
+# the DATAH header must start within this many bytes of the top of the file
+HEADER_BYTES = 64 * 1024
+# nanoseconds per second, epochs are shared as int64 nanoseconds
+NS = 1000000000
+
+
+# parses the DATA rows of a LICOR file, returns the DATAH column names and a (rows, columns) float array
+# TIME is converted to seconds since midnight, other non-numeric columns (DATE, REMARK) are nan
+def parse(licor_data):
+    f = open(licor_data, "r")
+    x = next(f).replace('\t', ',').replace(';', ',').split(",")
+    while x[0] != "DATAH":
+        x = next(f).replace('\t', ',').replace(';', ',').split(",")
+    header = [column.strip(' \t\n\r') for column in x]
+
+    rows = _split(f)
+    f.close()
+    return header, _decode(rows, header)
+
+
+# splits lines into fields, keeping only DATA rows
+def _split(lines):
+    rows = []
+    for line in lines:
+        x = line.replace('\t', ',').replace(';', ',').split(',')
+        if x[0] != "DATA" or len(x) == 2:
+            continue
+        rows.append(x)
+    return rows
+
+
+# converts split rows into a (rows, header) float array, only decoding the given column indices (default all)
+def _decode(rows, header, columns=None):
+    data = np.full((len(rows), len(header)), np.nan)
+    if not rows:
+        return data
+    for i in (range(1, len(header)) if columns is None else columns):
+        column = [row[i].strip(' \t\n\r') if i < len(row) else 'nan' for row in rows]
+        if header[i] == "TIME":
+            data[:, i] = _times(column)
+            continue
+        try:
+            data[:, i] = np.array(column, dtype=float)
+        except ValueError:
+            # text columns are left as nan, a numeric column only loses its malformed values
+            try:
+                float(column[0])
+            except ValueError:
+                continue
+            data[:, i] = [_to_float(value) for value in column]
+    return data
+
+
+# converts a column of HH:MM:SS times into seconds since midnight, in one pass unless a time is malformed
+def _times(column):
+    try:
+        fields = np.array(":".join(column).split(":"), dtype=float).reshape(len(column), 3)
+        return fields @ np.array([3600, 60, 1])
+    except ValueError:
+        return [_to_float(time, time_to_seconds) for time in column]
+
+
+# epoch of each row in int64 nanoseconds, from the SECONDS and NANOSECONDS columns
+# both are whole numbers well within a float's exact range, so no precision is lost on the way
+def epoch_ns(seconds, nanoseconds=None):
+    epochs = np.asarray(seconds).astype(np.int64) * NS
+    if nanoseconds is not None:
+        epochs += np.nan_to_num(np.asarray(nanoseconds)).astype(np.int64)
+    return epochs
+
+
+def _to_float(value, convert=float):
+    try:
+        return convert(value)
+    except ValueError:
+        return np.nan
+
+
+# cache file name, from the file's path, size, modification time and contents
+def _cache_key(licor_data):
+    stat = os.stat(licor_data)
+    content = hashlib.blake2b(digest_size=16)
+    with open(licor_data, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            content.update(chunk)
+    key = "%s|%i|%i|%s|%i" %(os.path.abspath(licor_data), stat.st_size, stat.st_mtime_ns, content.hexdigest(), CACHE_VERSION)
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + ".npz"
+
+
+# removes the least recently used cache files until the cache fits in CACHE_SIZE
+def _evict():
+    files = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".npz"):
+            stat = os.stat(os.path.join(CACHE_DIR, name))
+            files.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in files)
+    for _, size, name in sorted(files):
+        if total <= CACHE_SIZE:
+            break
+        os.remove(os.path.join(CACHE_DIR, name))
+        total -= size
+
+
+# parse() with a persistent cache, a cache that can't be read or written falls back to parsing
+def read_licor(licor_data):
+    if CACHE_DIR is None:
+        return parse(licor_data)
+
+    path = os.path.join(CACHE_DIR, _cache_key(licor_data))
+    try:
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as cached:
+                header, data = cached['header'].tolist(), cached['data']
+            os.utime(path)  # mark as recently used
+            return header, data
+    except (OSError, ValueError, KeyError) as e:
+        print("Warning: Couldn't read the cached copy of {}, parsing it instead ({})".format(licor_data, e))
+        path = None
+
+    header, data = parse(licor_data)
+
+    if path is not None:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            temp = path + ".%i.tmp" %(os.getpid())
+            with open(temp, "wb") as f:
+                np.savez(f, header=np.array(header), data=data)
+            os.replace(temp, path)
+            _evict()
+        except OSError as e:
+            print("Warning: Couldn't cache {} ({})".format(licor_data, e))
+    return header, data
+
+
+class LicorReader:
+    """
+    Memory mapped LICOR data file. The DATAH header is found once and a sparse index keeps the byte
+    offset and epoch (SECONDS) of every BLOCK_ROWS-th line, so a window of rows is decoded without
+    reading the rest of the file and memory stays flat however large the file is.
+    Time windows expect the rows in the order the LICOR logs them, otherwise every block is checked.
+    """
+    def __init__(self, licor_data, block_rows=BLOCK_ROWS):
+        self.licor_data = licor_data
+        self.block_rows = block_rows
+        self.file = open(licor_data, "rb")
+        self.map = None
+        if os.path.getsize(licor_data) == 0:
+            self.close()
+            raise Exception("Error: No DATAH header found in {}, please ensure you're using the original unedited file".format(licor_data))
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # find the header, data lines start right after it
+        position = 0
+        while True:
+            end = self.map.find(b'\n', position)
+            if end == -1 or position > HEADER_BYTES:
+                self.close()
+                raise Exception("Error: No DATAH header found in {}, please ensure you're using the original unedited file".format(licor_data))
+            x = self.map[position:end].decode(errors='replace').replace('\t', ',').replace(';', ',').split(",")
+            position = end + 1
+            if x[0] == "DATAH":
+                break
+        self.header = [column.strip(' \t\n\r') for column in x]
+        if "SECONDS" not in self.header:
+            self.close()
+            raise Exception("Error: No SECONDS column found in {}".format(licor_data))
+        self.seconds_index = self.header.index("SECONDS")
+        self.nanoseconds_index = self.header.index("NANOSECONDS") if "NANOSECONDS" in self.header else None
+        self.data_start = position
+
+        self._index()
+
+    def _index(self):
+        # byte offsets of every block_rows-th line, scanning for newlines a chunk at a time
+        size = len(self.map)
+        offsets = []
+        lines = 0
+        for start in range(self.data_start, size, CHUNK_BYTES):
+            chunk = np.frombuffer(self.map, dtype=np.uint8, count=min(CHUNK_BYTES, size - start), offset=start)
+            starts = np.flatnonzero(chunk == 10) + (start + 1)
+            del chunk   # the map can't be closed while a view of it exists
+            if start == self.data_start:
+                starts = np.concatenate(([start], starts))
+            starts = starts[starts < size]
+            offsets.append(starts[(-lines) % self.block_rows::self.block_rows])
+            lines += len(starts)
+        self.lines = lines
+        self.offsets = np.concatenate(offsets + [np.array([size])]).astype(np.int64)
+
+        # epoch of the first DATA row in each block, blocks without one take the previous block's epoch
+        epochs = np.array([self._first_epoch(self.offsets[b], self.offsets[b + 1]) for b in range(len(self.offsets) - 1)])
+        self.ordered = bool(np.all(np.diff(epochs[~np.isnan(epochs)]) >= 0))
+        if self.ordered and len(epochs):
+            epochs = np.fmax.accumulate(np.where(np.isnan(epochs), -np.inf, epochs))
+        self.epochs = epochs
+
+    def _first_epoch(self, start, end):
+        while start < end:
+            line_end = self.map.find(b'\n', start, end)
+            line_end = end if line_end == -1 else line_end
+            x = self.map[start:line_end].decode(errors='replace').replace('\t', ',').replace(';', ',').split(',')
+            if x[0] == "DATA" and len(x) > self.seconds_index:
+                try:
+                    return float(x[self.seconds_index])
+                except ValueError:
+                    pass
+            start = line_end + 1
+        return np.nan
+
+    def _decode_bytes(self, start, end, columns=None):
+        lines = self.map[start:end].decode(errors='replace').splitlines()
+        return _decode(_split(lines), self.header, columns)
+
+    def __len__(self):
+        # number of lines after the header, including any non DATA lines
+        return self.lines
+
+    def close(self):
+        if getattr(self, 'map', None) is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def line_offset(self, line):
+        # byte offset of a line, skipping forward from the start of its block
+        line = min(max(line, 0), self.lines)
+        block = line // self.block_rows
+        position = int(self.offsets[block])
+        for _ in range(line - block * self.block_rows):
+            position = self.map.find(b'\n', position)
+            if position == -1:
+                return len(self.map)
+            position += 1
+        return position
+
+    def rows(self, start, stop, columns=None):
+        # DATA rows among lines [start, stop), columns are header indices to decode (default all), others are nan
+        return self._decode_bytes(self.line_offset(start), self.line_offset(stop), columns)
+
+    def first_row(self, columns=None):
+        # the first DATA row, or None if the file has no data
+        for block in range(len(self.offsets) - 1):
+            data = self._decode_bytes(self.offsets[block], self.offsets[block + 1], columns)
+            if len(data):
+                return data[0]
+        return None
+
+    def last_epoch(self):
+        # the latest SECONDS in the file, or nan if the file has no data, only the last block is decoded
+        # when the rows are in time order
+        latest = np.nan
+        for block in range(len(self.offsets) - 2, -1, -1):
+            seconds = self._decode_bytes(self.offsets[block], self.offsets[block + 1], [self.seconds_index])[:, self.seconds_index]
+            if np.any(~np.isnan(seconds)):
+                latest = np.fmax(latest, np.nanmax(seconds))
+                if self.ordered:
+                    break
+        return latest
+
+    def window(self, start, end, columns=None):
+        # DATA rows with SECONDS in [start, end]
+        return self.windows([(start, end)], columns)
+
+    def windows(self, ranges, columns=None):
+        # DATA rows with SECONDS within any of the [start, end] ranges, each block is decoded at most once
+        data = list(self.iter_windows(ranges, columns))
+        if not data:
+            return np.full((0, len(self.header)), np.nan)
+        return np.concatenate(data)
+
+    def iter_windows(self, ranges, columns=None):
+        # windows() a batch of blocks at a time, in file order
+        ranges = list(ranges)
+        if columns is not None:
+            columns = sorted(set(columns) | {self.seconds_index})
+        blocks = np.zeros(len(self.epochs), dtype=bool)
+        if not self.ordered:
+            blocks[:] = True
+        for start, end in ranges:
+            first = max(np.searchsorted(self.epochs, start, 'right') - 1, 0)
+            last = np.searchsorted(self.epochs, end, 'right')
+            blocks[first:last] = True
+
+        block = 0
+        while block < len(blocks):
+            if not blocks[block]:
+                block += 1
+                continue
+            # decode runs of neighbouring blocks together
+            run = block
+            while run < len(blocks) and blocks[run]:
+                run += 1
+            for first in range(block, run, 64):
+                last = min(first + 64, run)
+                decoded = self._decode_bytes(self.offsets[first], self.offsets[last], columns)
+                seconds = decoded[:, self.seconds_index]
+                keep = np.zeros(len(decoded), dtype=bool)
+                for start, end in ranges:
+                    keep |= (seconds >= start) & (seconds <= end)
+                if keep.any():
+                    yield decoded[keep]
+            block = run
+
+
+class LicorArchive:
+    """
+    Several LICOR files (e.g. the daily files of a deployment) merged lazily into one time ordered
+    stream, with the same interface as a LicorReader. Columns are matched by name to the header of
+    the first file, and rows logged in more than one file are only kept once.
+    """
+    def __init__(self, paths):
+        readers = []
+        try:
+            for path in paths:
+                readers.append(LicorReader(path))
+        except Exception:
+            for reader in readers:
+                reader.close()
+            raise
+        if not readers:
+            raise Exception("Error: No LICOR data files found")
+
+        # earliest file first
+        firsts = [reader.first_row([reader.seconds_index]) for reader in readers]
+        order = sorted(range(len(readers)), key=lambda k: np.inf if firsts[k] is None else firsts[k][readers[k].seconds_index])
+        self.readers = [readers[k] for k in order]
+
+        self.header = self.readers[0].header
+        self.seconds_index = self.header.index("SECONDS")
+        self.nanoseconds_index = self.header.index("NANOSECONDS") if "NANOSECONDS" in self.header else None
+        # the column of each shared header column in each file, -1 if the file doesn't have it
+        self.columns = [[reader.header.index(column) if column in reader.header else -1 for column in self.header] for reader in self.readers]
+
+    def __len__(self):
+        return sum(len(reader) for reader in self.readers)
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _file_columns(self, k, columns):
+        if columns is None:
+            return None
+        return [self.columns[k][i] for i in columns if self.columns[k][i] >= 0]
+
+    def _shared(self, k, data):
+        # reorders a file's columns into the shared header
+        shared = np.full((len(data), len(self.header)), np.nan)
+        for i in range(len(self.header)):
+            if self.columns[k][i] >= 0:
+                shared[:, i] = data[:, self.columns[k][i]]
+        return shared
+
+    def _key(self, row):
+        nanoseconds = 0 if self.nanoseconds_index is None else row[self.nanoseconds_index]
+        return (row[self.seconds_index], 0 if np.isnan(nanoseconds) else nanoseconds)
+
+    def _file_rows(self, k, ranges, columns):
+        # time ordered rows of one file, decoded a batch at a time
+        reader = self.readers[k]
+        columns = self._file_columns(k, columns)
+        if columns is not None and self.nanoseconds_index is not None and self.columns[k][self.nanoseconds_index] >= 0:
+            columns.append(self.columns[k][self.nanoseconds_index])
+        for data in reader.iter_windows(ranges, columns):
+            data = self._shared(k, data)
+            nanoseconds = np.zeros(len(data)) if self.nanoseconds_index is None else np.nan_to_num(data[:, self.nanoseconds_index])
+            for row in data[np.lexsort((nanoseconds, data[:, self.seconds_index]))]:
+                yield row
+
+    def stream(self, ranges=((-np.inf, np.inf),), columns=None):
+        # k-way merge of every file's rows within the ranges, in time order without duplicates
+        ranges = list(ranges)
+        previous = None
+        for row in heapq.merge(*(self._file_rows(k, ranges, columns) for k in range(len(self.readers))), key=self._key):
+            key = self._key(row)
+            if key != previous:
+                previous = key
+                yield row
+
+    def first_row(self, columns=None):
+        for k in range(len(self.readers)):
+            row = self.readers[k].first_row(self._file_columns(k, columns))
+            if row is not None:
+                return self._shared(k, row[np.newaxis])[0]
+        return None
+
+    def last_epoch(self):
+        return np.fmax.reduce([reader.last_epoch() for reader in self.readers])
+
+    def rows(self, start, stop, columns=None):
+        # lines [start, stop) of the files laid end to end, in file order
+        data = []
+        for k in range(len(self.readers)):
+            length = len(self.readers[k])
+            if stop > 0 and start < length:
+                data.append(self._shared(k, self.readers[k].rows(max(start, 0), min(stop, length), self._file_columns(k, columns))))
+            start -= length
+            stop -= length
+        if not data:
+            return np.full((0, len(self.header)), np.nan)
+        return np.concatenate(data)
+
+    def windows(self, ranges, columns=None):
+        # DATA rows with SECONDS within any of the [start, end] ranges, merged across files
+        rows = list(self.stream(ranges, columns))
+        if not rows:
+            return np.full((0, len(self.header)), np.nan)
+        return np.array(rows)
+
+    def window(self, start, end, columns=None):
+        return self.windows([(start, end)], columns)
+
+
+# LICOR data files given as a path, a folder of daily files, a list of paths or paths joined by ';' (as the file browser gives them)
+def licor_paths(licor_data):
+    if not isinstance(licor_data, str):
+        return [path for item in licor_data for path in licor_paths(item)]
+    if ';' in licor_data:
+        return licor_paths([path for path in licor_data.split(';') if path])
+    if os.path.isdir(licor_data):
+        paths = sorted(glob.glob(os.path.join(licor_data, "*.data")))
+        if not paths:
+            paths = [path for path in sorted(glob.glob(os.path.join(licor_data, "*.txt")) + glob.glob(os.path.join(licor_data, "*.csv"))) if has_header(path)]
+        if not paths:
+            raise Exception("Error: No LICOR data files found in {}".format(licor_data))
+        return paths
+    return [licor_data]
+
+
+# whether a file starts like a LICOR data file
+def has_header(path):
+    with open(path, "rb") as f:
+        top = f.read(HEADER_BYTES)
+    return any(line.replace(b'\t', b',').replace(b';', b',').split(b',')[0] == b"DATAH" for line in top.split(b'\n'))
+
+
+# reader for one file, or a merged archive of several
+def open_licor(licor_data):
+    paths = licor_paths(licor_data)
+    if len(paths) == 1:
+        return LicorReader(paths[0])
+    return LicorArchive(paths)
+
+
+class LicorTail:
+    """
+    Follows a LICOR file as the instrument logs it, or the newest data file in a folder, only reading the bytes
+    appended since the last poll. A partial last line is held back until the rest of it is written. When the file
+    is truncated or replaced it's read again from the top, and when a newer file appears in the folder (the daily
+    rollover at midnight) the rest of the old file is read before following the new one.
+    """
+    def __init__(self, licor_data):
+        self.licor_data = licor_data
+        self.header = None          # header of the first file, every file's columns are matched to it by name
+        self.path = None            # file being followed
+        self.identity = None        # (device, inode) of the file being followed
+        self.position = 0           # bytes read from the file being followed
+        self.partial = b''          # incomplete last line
+        self.file_header = None     # header of the file being followed, once its DATAH line has been read
+
+    def _newest(self):
+        if not os.path.isdir(self.licor_data):
+            return self.licor_data
+        try:
+            return licor_paths(self.licor_data)[-1]
+        except Exception:
+            return None     # nothing logged yet
+
+    def _start(self, path):
+        self.path = path
+        self.identity = None
+        self.position = 0
+        self.partial = b''
+        self.file_header = None
+
+    def _read(self):
+        # complete lines appended since the last read
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        if self.identity is not None and ((stat.st_dev, stat.st_ino) != self.identity or stat.st_size < self.position):
+            self._start(self.path)     # truncated or replaced, start over
+        self.identity = (stat.st_dev, stat.st_ino)
+        if stat.st_size == self.position:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.position)
+            appended = f.read()
+        self.position += len(appended)
+        lines = (self.partial + appended).split(b'\n')
+        self.partial = lines.pop()
+        return [line.decode(errors='replace') for line in lines]
+
+    def _rows(self, lines):
+        # decodes DATA lines with the file's own header, then matches its columns to the shared header
+        rows = []
+        for line in lines:
+            if self.file_header is None:
+                x = line.replace('\t', ',').replace(';', ',').split(",")
+                if x[0] == "DATAH":
+                    self.file_header = [column.strip(' \t\n\r') for column in x]
+                    if self.header is None:
+                        self.header = self.file_header
+                continue
+            rows.append(line)
+        width = len(self.header) if self.header else 0
+        if not rows:
+            return np.full((0, width), np.nan)
+
+        decoded = _decode(_split(rows), self.file_header)
+        shared = np.full((len(decoded), width), np.nan)
+        for i in range(width):
+            if self.header[i] in self.file_header:
+                shared[:, i] = decoded[:, self.file_header.index(self.header[i])]
+        return shared
+
+    def poll(self):
+        # DATA rows logged since the last poll, in the columns of the first file's header
+        data = []
+        newest = self._newest()
+        if newest != self.path:
+            if self.path is not None:
+                data.append(self._rows(self._read()))   # finish the old file first
+            self._start(newest)
+        if self.path is not None:
+            data.append(self._rows(self._read()))
+        data = [rows for rows in data if len(rows)]
+        if not data:
+            return np.full((0, len(self.header) if self.header else 0), np.nan)
+        return np.concatenate(data)
@@ -1,5 +1,8 @@
 pip install matplotlib pdfminer.six PySimpleGUI tabula-py XlsxWriter tk statsmodels
 
+# Optional, for Parquet and Feather table exports (tables are exported as CSV without it)
+# pip install pyarrow
+
 # As of 2025, PySimpleGUI is no longer available for free.
 # An unmaintained version of PySimpleGUI 4.60.4.1 can be found at
 # https://pypi.org/project/PySimpleGUI-4-foss/
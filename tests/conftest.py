@@ -0,0 +1,8 @@
+import os
+import sys
+
+import matplotlib
+
+# the tool's modules live at the top of the repository, and the review plots are drawn without a display
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+matplotlib.use('Agg')
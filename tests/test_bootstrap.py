@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from utils import bootstrap_ci, bootstrap_cis
+
+
+def reference_ci(X, Y, degree, resamples, block, level, seed):
+    # refits the polynomial to every resample of the circular block bootstrap of its residuals
+    fitted = np.polyval(np.polyfit(X, Y, degree), X)
+    residuals = Y - fitted
+    residuals = residuals - residuals.mean()
+    n = len(X)
+    starts = np.random.default_rng(seed).integers(0, n, size=(resamples, -(-n // block)))
+    slopes = []
+    for r in range(resamples):
+        index = np.concatenate([(start + np.arange(block)) % n for start in starts[r]])[:n]
+        coefficients = np.polyfit(X, fitted + residuals[index], degree)
+        slopes.append(np.polyval(np.polyder(coefficients), X[0]))     # the initial slope
+    return np.percentile(slopes, [50 * (1 - level), 50 * (1 + level)])
+
+
+@pytest.mark.parametrize('model, degree', [('linear', 1), ('quadratic', 2)])
+@pytest.mark.parametrize('block', [1, 4, None])
+def test_bootstrap_ci_matches_refitting_every_resample(model, degree, block):
+    rng = np.random.default_rng(0)
+    X = np.sort(rng.uniform(0, 180, 90))
+    Y = 2000 + 0.4 * X - 0.0005 * X ** 2 + np.cumsum(rng.normal(0, 0.5, 90))
+    low, high = bootstrap_ci(X, Y, model, resamples=300, block=block, level=0.9, seed=7)
+    expected = reference_ci(X, Y, degree, 300, block or round(90 ** (1 / 3)), 0.9, 7)
+    assert np.allclose((low, high), expected)
+    assert low < np.polyval(np.polyder(np.polyfit(X, Y, degree)), X[0]) < high
+
+
+def test_bootstrap_ci_too_few_datapoints():
+    assert np.isnan(bootstrap_ci([0, 1, 2], [1, 2, 3])).all()
+
+
+def test_bootstrap_cis_dont_depend_on_the_number_of_processes():
+    rng = np.random.default_rng(1)
+    X = [np.arange(40, dtype=float) for _ in range(4)]
+    Y = [0.5 * x + rng.normal(0, 1, 40) for x in X]
+    models = ['linear', 'quadratic', 'exponential', 'linear']
+    single = bootstrap_cis(X, Y, models, resamples=200, seed=3)
+    assert single == bootstrap_cis(X, Y, models, resamples=200, seed=3, processes=2)
+    assert single != bootstrap_cis(X, Y, models, resamples=200, seed=4)
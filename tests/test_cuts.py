@@ -0,0 +1,133 @@
+import numpy as np
+
+from utils import Cuts, PrefixSums, cut_offsets, data_loss, ebullition, linear_regression, EBULLITION_THRESHOLD
+
+
+class Replay:
+    """
+    Reference for Cuts: the datapoints left after each cut, as (original index, time, value), with every cut
+    made in the middle of the data shifting the datapoints after it by the gap it leaves, one cut at a time.
+    """
+    def __init__(self, times, values):
+        self.original = (np.asarray(times, dtype=float), np.asarray(values, dtype=float))
+
+    def replay(self, cuts):
+        points = [[i, t, v] for i, (t, v) in enumerate(zip(*self.original))]
+        for time_L, time_R in cuts:
+            times = [point[1] for point in points]
+            L = max(np.searchsorted(times, min(time_L, time_R), 'right') - 1, 0)
+            R = max(np.searchsorted(times, max(time_L, time_R), 'right') - 1, 0)
+            if R - L + 1 >= len(points):
+                continue
+            if L > 0:
+                dt, dv = points[L][1] - points[R][1], points[L][2] - points[R][2]
+                for point in points[R + 1:]:
+                    point[1] += dt
+                    point[2] += dv
+            del points[L: R + 1]
+        return points
+
+
+def random_cut(rng, pruned_times):
+    return tuple(rng.uniform(pruned_times[0] - 5, pruned_times[-1] + 5, 2))
+
+
+def test_cuts_match_a_sequential_replay_through_undo_redo_and_reset():
+    rng = np.random.default_rng(0)
+    times = np.cumsum(rng.uniform(0.5, 1.5, 200))
+    values = 2000 + 0.3 * times + rng.normal(0, 1, 200)
+    reference = Replay(times, values)
+    cuts = Cuts(200)
+    made, undone = [], []     # the cuts the reference replays, and the ones undo and reset took back
+    for step in range(300):
+        action = rng.choice(['cut', 'cut', 'undo', 'redo', 'reset'], p=[0.3, 0.3, 0.2, 0.15, 0.05])
+        if action == 'cut':
+            cut = random_cut(rng, cuts.prune(times))
+            if cuts.cut(cuts.prune(times), *cut):
+                made.append(cut)
+                undone = []
+        elif action == 'undo':
+            assert cuts.undo() == bool(made)
+            if made:
+                undone.append(made.pop())
+        elif action == 'redo':
+            assert cuts.redo() == bool(undone)
+            if undone:
+                made.append(undone.pop())
+        else:
+            assert cuts.reset() == bool(made)
+            undone += made[::-1]
+            made = []
+
+        points = reference.replay(made)
+        assert len(cuts) == len(made)
+        assert np.flatnonzero(cuts.keep).tolist() == [point[0] for point in points]
+        assert cuts.kept == len(points)
+        assert np.allclose(cuts.prune(times), [point[1] for point in points])
+        assert np.allclose(cuts.prune(values), [point[2] for point in points])
+
+
+def test_pruned_regression_and_offsets_match_the_pruned_data():
+    rng = np.random.default_rng(1)
+    fluxes = []
+    for k in range(5):
+        times = np.arange(120, dtype=float)
+        values = 400 + rng.normal(1, 0.3) * times + rng.normal(0, 2, 120)
+        cuts = Cuts(120)
+        for _ in range(k):
+            cuts.cut(cuts.prune(times), *random_cut(rng, cuts.prune(times)))
+        fluxes.append((times, values, cuts))
+
+    pruned, offsets = cut_offsets([values for _, values, _ in fluxes], [cuts for _, _, cuts in fluxes])
+    for (times, values, cuts), aligned, offset in zip(fluxes, pruned, offsets):
+        expected = cuts.prune(values)
+        assert np.allclose(aligned[cuts.keep], expected) and np.isnan(aligned[~cuts.keep]).all()
+        assert np.allclose(offset[cuts.keep], values[cuts.keep] - expected) and (offset[~cuts.keep] == 0).all()
+        regression = PrefixSums(times, values).regression(times, values, cuts)
+        assert np.allclose(regression, linear_regression(cuts.prune(times), expected)[:3])
+    assert np.allclose(data_loss([cuts for _, _, cuts in fluxes]),
+                       [100 - round(cuts.kept / 120 * 100, 2) for _, _, cuts in fluxes])
+
+
+def reference_ebullition(times, samples, threshold=EBULLITION_THRESHOLD, pad=1):
+    # the same detector written out datapoint by datapoint
+    rates = [(samples[i + 1] - samples[i]) / (times[i + 1] - times[i]) for i in range(len(samples) - 1)]
+    median = np.median(rates)
+    deviation = [abs(rate - median) for rate in rates]
+    scale = 1.4826 * np.median(deviation)
+    suggestions = []
+    for i in range(len(rates)):
+        if deviation[i] > threshold * scale:
+            first, last = max(i - pad, 0), min(i + 1 + pad, len(samples) - 1)
+            if suggestions and first <= suggestions[-1][1] + 1:
+                suggestions[-1][1] = max(suggestions[-1][1], last)
+            else:
+                suggestions.append([first, last])
+    return suggestions
+
+
+def test_ebullition_matches_a_datapoint_by_datapoint_scan():
+    rng = np.random.default_rng(2)
+    for seed in range(20):
+        times = np.cumsum(rng.uniform(0.8, 1.2, 150))
+        samples = 2000 + 0.5 * times + rng.normal(0, 0.5, 150)
+        for jump in rng.integers(5, 145, rng.integers(0, 4)):
+            samples[jump:] += rng.uniform(20, 60)
+        assert ebullition(times, samples) == reference_ebullition(times, samples)
+
+
+def test_cutting_suggested_ebullition_removes_the_jumps():
+    rng = np.random.default_rng(3)
+    times = np.arange(180, dtype=float)
+    samples = 2000 + 0.5 * times + rng.normal(0, 0.3, 180)
+    samples[60:] += 40
+    samples[130:] += 25
+    suggestions = ebullition(times, samples)
+    assert [first <= 59 < 60 <= last for first, last in suggestions].count(True) == 1
+    assert [first <= 129 < 130 <= last for first, last in suggestions].count(True) == 1
+
+    cuts = Cuts(180)
+    assert cuts.cut_suggestions(times, suggestions) == len(suggestions)
+    assert cuts.pruned_spans(cuts.prune(times), suggestions) == []
+    m, b, R2 = linear_regression(cuts.prune(times), cuts.prune(samples))[:3]
+    assert abs(m - 0.5) < 0.01 and R2 > 0.999
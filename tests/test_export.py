@@ -0,0 +1,65 @@
+import csv
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import utils
+from utils import export_tables, flux_tables, SERIES_COLUMNS, SUMMARY_COLUMNS
+
+
+def tables():
+    return {'summary': {'flux_id': ["C1 light", "C1 dark"], 'RSQ': [0.99, np.nan], 'flux': [1.25, -0.5]},
+            'series': {'flux_id': np.array(["C1 light"] * 3), 't': np.arange(3.0), 'pruned_value': np.array([1.0, np.nan, 3.0]),
+                       'cut': np.array([False, True, False])}}
+
+
+def test_export_falls_back_to_csv_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'pyarrow', None)
+    paths = export_tables(str(tmp_path / "report.xlsx"), tables(), 'parquet')
+    assert paths == [str(tmp_path / "report_summary.csv"), str(tmp_path / "report_series.csv")]
+    with open(paths[0], newline='') as f:
+        assert list(csv.reader(f)) == [['flux_id', 'RSQ', 'flux'], ['C1 light', '0.99', '1.25'], ['C1 dark', '', '-0.5']]
+    with open(paths[1], newline='') as f:
+        rows = list(csv.reader(f))
+    # missing values are left empty
+    assert rows == [['flux_id', 't', 'pruned_value', 'cut'], ['C1 light', '0.0', '1.0', 'False'],
+                    ['C1 light', '1.0', '', 'True'], ['C1 light', '2.0', '3.0', 'False']]
+
+
+def test_export_rejects_unknown_formats(tmp_path):
+    with pytest.raises(Exception, match="Unknown export format"):
+        export_tables(str(tmp_path / "report.xlsx"), tables(), 'xls')
+
+
+def test_export_parquet_and_feather_round_trip(tmp_path):
+    pyarrow = pytest.importorskip("pyarrow")
+    for format in ('parquet', 'feather'):
+        paths = export_tables(str(tmp_path / "report.xlsx"), tables(), format)
+        read = pyarrow.parquet.read_table if format == 'parquet' else pyarrow.feather.read_table
+        series = read(paths[1]).to_pydict()
+        assert series['t'] == [0.0, 1.0, 2.0] and series['cut'] == [False, True, False]
+        assert series['pruned_value'][0] == 1.0 and np.isnan(series['pruned_value'][1])
+
+
+def test_flux_tables_of_every_gas():
+    def flux(n, keep):
+        times = np.arange(n, dtype=float)
+        cuts = SimpleNamespace(keep=np.array(keep))
+        return SimpleNamespace(name="C1 light", times=times, H2O=times + 100, time_offsets=np.zeros(n), cuts=cuts, temp=293.15,
+                               surface_area=0.5, chamber_height=0.2, data_loss=100 * (n - sum(keep)) / n,
+                               pruned_columns={'times': np.where(keep, times, np.nan), 'H2O': np.where(keep, times + 100, np.nan)})
+    fluxes = [flux(3, [True, False, True]), flux(2, [True, True])]
+    series = lambda values: (values, values * 2, np.zeros(len(values)))
+    results = [[('co2', 'linear', 0.9, 6.0, 1.5, (1.0, 2.0), series(np.arange(3.0))), ('ch4', 'linear', 0.8, 3.0, 0.5, None, series(np.arange(3.0)))],
+               [('co2', 'quadratic', 0.7, -6.0, -1.5, None, series(np.ones(2)))]]
+    tables = flux_tables(fluxes, results)
+    summary, long = tables['summary'], tables['series']
+    assert list(summary) == SUMMARY_COLUMNS and list(long) == SERIES_COLUMNS
+    # duplicate flux names are told apart, and a gas without a confidence interval gets missing bounds
+    assert summary['flux_id'] == ["C1 light", "C1 light", "C1 light (2)"] and summary['gas'] == ['co2', 'ch4', 'co2']
+    assert summary['m'] == [0.1, 0.05, -0.1] and summary['chamber_volume'] == [100.0] * 3
+    assert summary['CI_low'][0] == 1.0 and np.isnan(summary['CI_low'][1]) and np.isnan(summary['CI_high'][2])
+    assert all(len(column) == 8 for column in long.values())
+    assert long['gas'].tolist() == ['co2'] * 3 + ['ch4'] * 3 + ['co2'] * 2 and long['cut'].tolist() == [False, True, False] * 2 + [False] * 2
+    assert long['pruned_value'].tolist() == [0.0, 2.0, 4.0] * 2 + [2.0, 2.0]
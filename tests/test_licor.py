@@ -0,0 +1,129 @@
+import json
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("PySimpleGUI")
+
+import LICOR
+
+MIDNIGHT = 1668056400.0     # the LICOR data's first local midnight
+SAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample-files", "LICOR")
+FIELD_DATA = os.path.join(SAMPLES, "field_data.txt")
+LICOR_DATA = os.path.join(SAMPLES, "LICOR_data.txt")
+
+
+def fluxes(*times):
+    return [SimpleNamespace(name=f"flux {k}", start_time=start, end_time=end) for k, (start, end) in enumerate(times)]
+
+
+def test_flux_epochs_keep_an_unordered_single_day_sheet_on_that_day():
+    starts, ends = LICOR.flux_epochs(fluxes(("20:00:00", "20:03:00"), ("08:00:00", "08:03:00")), MIDNIGHT, MIDNIGHT + 21 * 3600)
+    assert starts.tolist() == [MIDNIGHT + 20 * 3600, MIDNIGHT + 8 * 3600]
+    assert (ends - starts).tolist() == [180, 180]
+
+
+def test_flux_epochs_roll_over_when_the_data_crosses_midnight():
+    times = fluxes(("20:00:00", "20:03:00"), ("23:59:00", "00:02:00"), ("08:00:00", "08:03:00"), ("09:00:00", "09:03:00"))
+    starts, ends = LICOR.flux_epochs(times, MIDNIGHT, MIDNIGHT + 86400 + 10 * 3600)
+    assert (starts - MIDNIGHT).tolist() == [20 * 3600, 86340, 86400 + 8 * 3600, 86400 + 9 * 3600]
+    assert (ends - starts).tolist() == [180, 180, 180, 180]
+
+
+def test_flux_epochs_never_roll_past_the_data():
+    times = fluxes(("20:00:00", "20:03:00"), ("07:00:00", "07:03:00"), ("23:00:00", "23:03:00"), ("10:00:00", "10:03:00"))
+    starts, ends = LICOR.flux_epochs(times, MIDNIGHT, MIDNIGHT + 86400 + 23.5 * 3600)
+    assert (starts - MIDNIGHT).tolist() == [20 * 3600, 86400 + 7 * 3600, 86400 + 23 * 3600, 86400 + 10 * 3600]
+
+
+def test_session_validates_the_gas():
+    session = LICOR.Session('CO2', all_gases=True)
+    assert session.gas == 'co2' and session.all_gases
+    with pytest.raises(Exception, match="Unknown gas"):
+        LICOR.Session('O3')
+
+
+def test_watch_matches_the_batch_results_while_the_data_is_logged(tmp_path, monkeypatch):
+    # the sample data is logged into a folder in chunks that end mid-line, rolling over to a new daily file half way
+    content = open(LICOR_DATA, "rb").read()
+    lines = content.split(b"\n")
+    top = next(k for k, line in enumerate(lines) if line.startswith(b"DATAH")) + 2     # header and units lines
+    middle = top + (len(lines) - top) // 2
+    days = [b"\n".join(lines[:middle]) + b"\n", b"\n".join(lines[:top] + lines[middle:])]
+    folder = tmp_path / "live"
+    folder.mkdir()
+    rng = np.random.default_rng(5)
+    writes = [(folder / name, chunk) for name, day in zip(["TG10-2021-08-11T000000.data", "TG10-2021-08-12T000000.data"], days)
+              for chunk in np.split(np.frombuffer(day, np.uint8), np.sort(rng.choice(np.arange(1, len(day)), 200, replace=False)))]
+
+    def log(seconds):
+        # each wait for the LICOR logs the next chunk, until the LICOR stops
+        if not writes:
+            raise KeyboardInterrupt
+        path, chunk = writes.pop(0)
+        with open(path, "ab") as f:
+            f.write(chunk.tobytes())
+    monkeypatch.setattr(LICOR, "time", SimpleNamespace(sleep=log))
+
+    watched = LICOR.watch(FIELD_DATA, str(folder), 'co2', all_gases=True, on_flux=lambda flux: None)
+    batch = LICOR.input_data(FIELD_DATA, LICOR_DATA, LICOR.Session('co2', all_gases=True))
+    LICOR.flux_calculation(batch)
+    assert [flux.name for flux in watched] == [flux.name for flux in batch]
+    for live, flux in zip(watched, batch):
+        assert np.array_equal(live.times, flux.times) and list(live.gases) == list(flux.gases)
+        assert all(np.array_equal(live.gases[gas], flux.gases[gas], equal_nan=True) for gas in flux.gases)
+        assert live.flux == pytest.approx(flux.flux)
+
+
+def processed(monkeypatch, *args, **kwargs):
+    # the fluxes process() writes to its report
+    fluxes = []
+    output = LICOR.outputData
+    with monkeypatch.context() as patch:
+        patch.setattr(LICOR, "outputData", lambda written, *rest: fluxes.extend(written) or output(written, *rest))
+        LICOR.process(*args, **kwargs)
+    return fluxes
+
+
+def sample_cuts(tmp_path):
+    # a cut inside the first flux, and leading and trailing cuts of the third, as seconds on their original time axes
+    fluxes = LICOR.input_data(FIELD_DATA, LICOR_DATA, LICOR.Session('co2'))
+    names = LICOR.unique_names([flux.name for flux in fluxes])
+    first, third = fluxes[0].times, fluxes[2].times
+    cuts = {names[0]: [[first[10], first[20]]], names[2]: [[third[0], third[29]], [third[-10], third[-1]]]}
+    path = tmp_path / "cuts.json"
+    path.write_text(json.dumps({name: [[float(start), float(end)] for start, end in intervals] for name, intervals in cuts.items()}))
+    return str(path), fluxes
+
+
+def test_process_applies_a_cuts_file(tmp_path, monkeypatch):
+    cuts, uncut = sample_cuts(tmp_path)
+    out = tmp_path / "report.xlsx"
+    fluxes = processed(monkeypatch, FIELD_DATA, LICOR_DATA, 'co2', str(out), cuts=cuts)
+    assert out.exists() and len(fluxes) == len(uncut)
+    removed = {0: 11, 2: 40}
+    for k, flux in enumerate(fluxes):
+        assert len(flux.times) == len(uncut[k].times)
+        assert len(flux.pruned_times) == len(flux.times) - removed.get(k, 0)
+        # the rate of change is the slope of the pruned (and shifted, for the cut inside the first flux) series
+        slope = np.polyfit(flux.pruned_times, flux.cuts.prune(flux.gases['co2']), 1)[0]
+        assert flux.RoC['co2'] == pytest.approx(slope * 60)
+    assert fluxes[2].pruned_times[0] == uncut[2].times[30] and fluxes[2].pruned_times[-1] == uncut[2].times[-11]
+    # uncut fluxes are calculated as if no cuts file was given
+    LICOR.flux_calculation(uncut)
+    assert [flux.flux['co2'] for flux in fluxes[3:]] == pytest.approx([flux.flux['co2'] for flux in uncut[3:]])
+    assert fluxes[0].flux['co2'] != pytest.approx(uncut[0].flux['co2'])
+
+
+def test_every_gas_shares_the_cuts_and_missing_gases_are_skipped(tmp_path, monkeypatch):
+    cuts, uncut = sample_cuts(tmp_path)
+    fluxes = processed(monkeypatch, FIELD_DATA, LICOR_DATA, 'co2', str(tmp_path / "all.xlsx"), cuts=cuts, all_gases=True)
+    methane = processed(monkeypatch, FIELD_DATA, LICOR_DATA, 'ch4', str(tmp_path / "ch4.xlsx"), cuts=cuts)
+    # the sample data has no N2O column
+    assert all(list(flux.gases) == ['co2', 'ch4'] and list(flux.flux) == ['co2', 'ch4'] for flux in fluxes)
+    for flux, alone in zip(fluxes, methane):
+        assert len(flux.cuts) == len(alone.cuts) and len(flux.cuts.prune(flux.gases['ch4'])) == len(flux.pruned_times)
+        # CH4 cut with the CO2 plot's cuts is the same as CH4 analyzed and cut on its own
+        assert flux.flux['ch4'] == pytest.approx(alone.flux['ch4']) and flux.RSQ['ch4'] == pytest.approx(alone.RSQ['ch4'])
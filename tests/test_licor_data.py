@@ -0,0 +1,140 @@
+import os
+
+import numpy as np
+
+import licor_data
+from licor_data import LicorReader, LicorTail, open_licor, parse, epoch_ns, NS
+
+HEADER = ["DATAH", "SECONDS", "NANOSECONDS", "NDX", "DATE", "TIME", "H2O", "CO2", "CH4"]
+START = 1668056400      # local midnight
+
+
+def row(second):
+    # one logged row, the concentrations follow from the time so rows logged twice are identical
+    t = second - START
+    return {"SECONDS": second, "NANOSECONDS": (second * 7919) % NS, "NDX": t, "DATE": "2022-11-10",
+            "TIME": "%02i:%02i:%02i" %(t // 3600 % 24, t // 60 % 60, t % 60),
+            "H2O": 10000 + t % 97, "CO2": 400 + (t % 13) / 10, "CH4": 2000 + t % 29}
+
+
+def write_licor(path, seconds, header=HEADER):
+    with open(path, "w") as f:
+        f.write("Model:\tLI-7810\nSN:\tTG10-00000\nTimezone:\tAmerica/Toronto\n")
+        f.write("\t".join(header) + "\nDATAU\t" + "\t".join("" for _ in header[1:]) + "\n")
+        for second in seconds:
+            values = row(second)
+            f.write("DATA\t" + "\t".join(str(values[column]) for column in header[1:]) + "\n")
+    return str(path)
+
+
+def expected(seconds, ranges, header=HEADER):
+    # every distinct row within any of the ranges, in time order
+    seconds = sorted(set(s for s in seconds if any(start <= s <= end for start, end in ranges)))
+    data = np.array([[np.nan] + [row(s)[column] if column != "DATE" else np.nan for column in header[1:]] for s in seconds], dtype=object)
+    data[:, header.index("TIME")] = [s - START for s in seconds]
+    return data.astype(float)
+
+
+def test_epoch_ns_keeps_nanoseconds():
+    assert epoch_ns(np.array([1628692016.0]), np.array([203144073.0]))[0] == 1628692016203144073
+    assert epoch_ns(np.array([1628692016.0]), np.array([np.nan]))[0] == 1628692016 * NS
+
+
+def test_reader_windows_match_the_parsed_file(tmp_path):
+    seconds = list(range(START, START + 3000, 2))
+    path = write_licor(tmp_path / "day.data", seconds)
+    ranges = [(START + 100, START + 160), (START + 1001, START + 1001), (START + 2900, START + 9000), (START - 50, START + 3)]
+    with LicorReader(path, block_rows=16) as reader:
+        assert len(reader) == len(seconds) + 1    # the DATAU line
+        assert reader.first_row()[1] == START and reader.last_epoch() == seconds[-1]
+        data = reader.windows(ranges)
+    assert np.array_equal(data, expected(seconds, ranges), equal_nan=True)
+    header, parsed = parse(path)
+    assert header == HEADER and np.array_equal(parsed, expected(seconds, [(START, START + 3000)]), equal_nan=True)
+
+
+def test_archive_merges_files_without_duplicates(tmp_path):
+    # overlapping daily files, listed out of order, the last with its columns in another order
+    days = [range(START + 1500, START + 4000), range(START, START + 2000, 3), range(START + 3900, START + 5000, 2)]
+    shuffled = HEADER[:1] + HEADER[5:] + HEADER[1:5]
+    paths = [write_licor(tmp_path / "a.data", days[0]), write_licor(tmp_path / "b.data", days[1]),
+             write_licor(tmp_path / "c.data", days[2], shuffled)]
+    every = [s for day in days for s in day]
+    ranges = [(START + 1400, START + 1600), (START + 3950, START + 3960), (START + 4990, START + 6000)]
+    with open_licor(";".join(paths)) as archive:
+        assert archive.header == HEADER
+        assert archive.first_row()[1] == START and archive.last_epoch() == max(every)
+        data = archive.windows(ranges)
+        assert np.array_equal(data, expected(every, ranges), equal_nan=True)
+        merged = archive.windows([(-np.inf, np.inf)])
+    assert np.array_equal(merged, expected(every, [(START, START + 5000)]), equal_nan=True)
+    assert len(np.unique(epoch_ns(merged[:, 1], merged[:, 2]))) == len(merged)
+
+
+def test_read_licor_caches_the_parsed_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(licor_data, 'CACHE_DIR', str(tmp_path / "cache"))
+    path = write_licor(tmp_path / "day.data", range(START, START + 500))
+    header, data = licor_data.read_licor(path)
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+    cached_header, cached = licor_data.read_licor(path)
+    assert cached_header == header and np.array_equal(cached, data, equal_nan=True)
+
+
+def test_tail_keeps_every_row_across_partial_lines_and_rollover(tmp_path):
+    # two daily files logged into a folder in chunks that end mid-line, the second with its columns in another order
+    days = [range(START, START + 600), range(START + 600, START + 1200)]
+    shuffled = HEADER[:1] + HEADER[5:] + HEADER[1:5]
+    sources = [write_licor(tmp_path / "a.txt", days[0]), write_licor(tmp_path / "b.txt", days[1], shuffled)]
+    folder = tmp_path / "live"
+    folder.mkdir()
+    targets = [folder / "TG10-2022-11-10T000000.data", folder / "TG10-2022-11-11T000000.data"]
+    rng = np.random.default_rng(3)
+    writes = []
+    for source, target in zip(sources, targets):
+        content = open(source, "rb").read()
+        cuts = np.sort(rng.choice(np.arange(1, len(content)), 150, replace=False))
+        writes += [(target, chunk, k == len(cuts)) for k, chunk in enumerate(np.split(np.frombuffer(content, np.uint8), cuts))]
+
+    tail = LicorTail(str(folder))
+    assert len(tail.poll()) == 0        # nothing logged yet
+    polled = []
+    for target, chunk, last in writes:
+        with open(target, "ab") as f:
+            f.write(chunk.tobytes())
+        # the end of the first file and the start of the second are read in the same poll
+        if not (last and target == targets[0]):
+            polled.append(tail.poll())
+    assert tail.header == HEADER
+    polled = [rows for rows in polled if len(rows)]     # polls before the header was logged have no columns
+    assert np.array_equal(np.concatenate(polled), expected([s for day in days for s in day], [(START, START + 1200)]), equal_nan=True)
+
+
+def test_touching_a_file_invalidates_its_cached_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(licor_data, 'CACHE_DIR', str(tmp_path / "cache"))
+    parsed = []
+    parse = licor_data.parse
+    monkeypatch.setattr(licor_data, 'parse', lambda path: parsed.append(path) or parse(path))
+    path = write_licor(tmp_path / "day.data", range(START, START + 500))
+    key = licor_data._cache_key(path)
+    licor_data.read_licor(path)
+    licor_data.read_licor(path)
+    assert len(parsed) == 1
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert licor_data._cache_key(path) != key
+    header, data = licor_data.read_licor(path)
+    assert len(parsed) == 2 and np.array_equal(data, parse(path)[1], equal_nan=True)
+
+
+def test_cache_evicts_the_least_recently_used_files(tmp_path, monkeypatch):
+    cache = tmp_path / "cache"
+    monkeypatch.setattr(licor_data, 'CACHE_DIR', str(cache))
+    paths = [write_licor(tmp_path / f"day{k}.data", range(START + k, START + k + 500)) for k in range(4)]
+    for k, path in enumerate(paths[:3]):
+        licor_data.read_licor(path)
+        os.utime(cache / licor_data._cache_key(path), (1000 * (k + 1), 1000 * (k + 1)))
+    size = max(entry.stat().st_size for entry in cache.iterdir())
+    monkeypatch.setattr(licor_data, 'CACHE_SIZE', 3 * size + size // 2)   # room for three files
+    licor_data.read_licor(paths[0])     # now the most recently used
+    licor_data.read_licor(paths[3])
+    assert sorted(entry.name for entry in cache.iterdir()) == sorted(licor_data._cache_key(paths[k]) for k in (0, 2, 3))
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("PySimpleGUI")
+pytest.importorskip("statsmodels")
+
+import LICOR_Samples
+
+
+def licor_rows(seed):
+    rng = np.random.default_rng(seed)
+    times = np.sort(rng.choice(np.arange(0, 2000, 0.5), 600, replace=False))
+    return np.column_stack((times, rng.normal(2, 0.1, len(times)), rng.normal(400, 5, len(times))))
+
+
+def test_sample_window_matches_a_scan():
+    LICOR = licor_rows(0)
+    for start, end in [(100.2, 280.0), (0, 15), (-5, 3), (1990.5, 2100), (500, 500), (2100, 2200)]:
+        rows = [j for j in range(len(LICOR)) if start <= LICOR[j, 0] < end]
+        first, last = LICOR_Samples.sample_window(LICOR, start, end)
+        assert list(range(first, last)) == rows
+
+
+def test_closest_index_matches_a_scan_with_earliest_ties():
+    times = licor_rows(1)[:, 0].tolist()
+    for t in np.concatenate((np.linspace(-10, 2010, 301), np.array(times[:20]) + 0.25)):
+        distances = [abs(t - time) for time in times]
+        assert LICOR_Samples.closest_index(times, t) == distances.index(min(distances))
+
+
+def test_session_validates_the_gas():
+    assert LICOR_Samples.Session('co2/ch4').gas == "CO2/CH4"
+    with pytest.raises(Exception, match="Unknown gas"):
+        LICOR_Samples.Session('CH4')
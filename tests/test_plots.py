@@ -0,0 +1,50 @@
+import matplotlib.pyplot as plt
+import numpy as np
+
+from utils import decimate, review_plot, PLOT_POINTS
+
+
+def test_decimate_keeps_the_extremes_within_its_budget():
+    rng = np.random.default_rng(11)
+    x = np.arange(100003, dtype=float)
+    y = rng.normal(size=len(x))
+    y[[17, 5000, 77777]] = [50, -40, 60]    # spikes
+    y[200:300] = np.nan
+    budget = 500
+    decimated_x, decimated_y = decimate(x, y, budget)
+    assert len(decimated_x) <= budget + 2   # the first and last points are always kept
+    assert np.all(np.diff(decimated_x) > 0) and np.array_equal(decimated_y, y[decimated_x.astype(int)], equal_nan=True)
+    assert decimated_x[0] == 0 and decimated_x[-1] == len(x) - 1
+    assert {17, 5000, 77777} <= set(decimated_x.astype(int))
+    # the minimum and maximum of every stretch of a bucket's length are kept
+    size = -(-len(y) // (budget // 2))
+    for first in range(0, len(y), size):
+        kept = decimated_y[(decimated_x >= first) & (decimated_x < first + size)]
+        assert np.nanmin(kept) == np.nanmin(y[first: first + size]) and np.nanmax(kept) == np.nanmax(y[first: first + size])
+    # a series within the budget is drawn as it is
+    short_x, short_y = decimate(x[:400], y[:400], budget)
+    assert np.array_equal(short_x, x[:400]) and np.array_equal(short_y, y[:400], equal_nan=True)
+
+
+def test_review_plot_reuses_its_artists():
+    fig, ax = plt.subplots()
+    plot = review_plot(fig)
+    assert review_plot(fig) is plot
+    for k, scale in enumerate([1, 100, 0.01]):
+        x = np.linspace(0, 300, 50000)
+        y = scale * np.sin(x)
+        plot.plot(ax, x, y)
+        plot.text(ax, "R^2 = %i" %(k))
+        plot.shade(ax, [(10, 20), (40 + k, 50)], color='orange')
+        left, right = plot.cursors(ax, x[0], x[-1], (x[0], x[-1]))
+        plot.draw()
+        if k == 0:
+            line, text, cursors = ax.lines[0], plot.texts[ax], (left, right)
+        # the same line, text box and cursors show the new data, shaded spans are replaced
+        assert ax.lines[0] is line and len(ax.lines) == 3 and plot.texts[ax] is text and (left, right) == cursors
+        assert len(ax.patches) == 2 and text.txt.get_text() == "R^2 = %i" %(k)
+        assert len(line.get_xdata()) <= PLOT_POINTS + 2 and np.max(line.get_ydata()) == np.max(y)
+        # the axes are rescaled to the series on show
+        bottom, top = ax.get_ylim()
+        assert -1.1 * scale <= bottom <= -0.99 * scale and 0.99 * scale <= top <= 1.1 * scale
+    plt.close(fig)
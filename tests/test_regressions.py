@@ -0,0 +1,78 @@
+import numpy as np
+
+from utils import linear_regressions, fit_models, EXPONENTIAL_RATES
+
+
+def ragged_series(seed, count=6):
+    rng = np.random.default_rng(seed)
+    X, Y = [], []
+    for k in range(count):
+        x = np.sort(rng.uniform(0, 300, rng.integers(8, 40)))
+        X.append(x)
+        Y.append(2000 + rng.normal(0.5, 0.2) * x - 0.001 * k * x ** 2 + rng.normal(0, 2, len(x)))
+    return X, Y
+
+
+def r_squared(y, fitted):
+    return 1 - np.sum((y - fitted) ** 2) / np.sum((y - y.mean()) ** 2)
+
+
+def test_linear_regressions_match_polyfit():
+    X, Y = ragged_series(0)
+    m, b, R2, stderr, RMSE = linear_regressions(X, Y)
+    for k in range(len(X)):
+        slope, intercept = np.polyfit(X[k], Y[k], 1)
+        fitted = slope * X[k] + intercept
+        assert np.isclose(m[k], slope) and np.isclose(b[k], intercept)
+        assert np.isclose(R2[k], r_squared(Y[k], fitted))
+        assert np.isclose(RMSE[k], np.sqrt(np.mean((Y[k] - fitted) ** 2)))
+
+
+def test_linear_regressions_offsets_match_lists():
+    X, Y = ragged_series(1)
+    offsets = np.concatenate(([0], np.cumsum([len(x) for x in X])))
+    for listed, concatenated in zip(linear_regressions(X, Y), linear_regressions(np.concatenate(X), np.concatenate(Y), offsets)):
+        assert np.allclose(listed, concatenated, equal_nan=True)
+
+
+def test_fit_models_match_polyfit():
+    X, Y = ragged_series(2)
+    fits = fit_models(X, Y)
+    for k in range(len(X)):
+        slope, intercept = np.polyfit(X[k], Y[k], 1)
+        assert np.isclose(fits['linear'][0][k], slope)
+        assert np.isclose(fits['linear'][1][k], r_squared(Y[k], slope * X[k] + intercept))
+
+        # the quadratic's initial rate of change is its derivative at the first datapoint
+        c2, c1, c0 = np.polyfit(X[k], Y[k], 2)
+        assert np.isclose(fits['quadratic'][0][k], 2 * c2 * X[k][0] + c1)
+        assert np.isclose(fits['quadratic'][1][k], r_squared(Y[k], np.polyval((c2, c1, c0), X[k])))
+
+
+def test_fit_models_exponential_matches_grid_search():
+    X, Y = ragged_series(3)
+    fits = fit_models(X, Y, ['exponential'])
+    for k in range(len(X)):
+        duration = X[k][-1] - X[k][0]
+        u = (X[k] - X[k][0]) / duration
+        best = (np.inf, np.nan)
+        for rate in EXPONENTIAL_RATES:
+            A = np.stack([np.ones(len(u)), np.exp(-rate * u)], axis=-1)
+            a, beta = np.linalg.lstsq(A, Y[k], rcond=None)[0]
+            SS_res = np.sum((Y[k] - A @ (a, beta)) ** 2)
+            if SS_res < best[0]:
+                best = (SS_res, -beta * rate / duration)
+        assert np.isclose(fits['exponential'][0][k], best[1])
+        assert np.isclose(fits['exponential'][1][k], 1 - best[0] / np.sum((Y[k] - Y[k].mean()) ** 2))
+
+
+def test_fit_models_empty_series_are_nan():
+    X, Y = ragged_series(4, 2)
+    for order in ([X[0], [], X[1], []], [[], X[0], [], []]):
+        ys = [Y[0] if x is X[0] else Y[1] if x is X[1] else [] for x in order]
+        fits = fit_models(order, ys)
+        for model, (slope, R2, AIC) in fits.items():
+            assert len(slope) == len(order)
+            for k in range(len(order)):
+                assert np.isnan(slope[k]) == (len(order[k]) == 0), model
+    assert all(len(slope) == 0 for slope, R2, AIC in fit_models([], []).values())
@@ -0,0 +1,86 @@
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import xlsxwriter
+
+import utils
+from utils import charted, long_sheets, report_workbook, write_columns, report_column
+
+NAMESPACE = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+HEADER = ['flux_id', 't', 'value', 'pruned_value']
+
+
+def block(title, n, RSQ):
+    t = np.arange(n, dtype=float)
+    return (title, "CH4 concentration (ppb)", [[title] * n, t, 2000 + t, np.where(t % 5 == 0, np.nan, 2000 + t)], RSQ)
+
+
+def charted_ranges(workbook):
+    # the cut values range of every chart, in the order they were added
+    return [chart.series[0]['values'] for chart in workbook.charts]
+
+
+def read_cells(path, sheet=1):
+    # {cell reference: value} of a worksheet, resolving shared and inline strings
+    with zipfile.ZipFile(path) as z:
+        shared = []
+        if 'xl/sharedStrings.xml' in z.namelist():
+            shared = [item.findtext('.//x:t', namespaces=NAMESPACE) for item in ET.fromstring(z.read('xl/sharedStrings.xml'))]
+        root = ET.fromstring(z.read('xl/worksheets/sheet%i.xml' %(sheet)))
+    cells = {}
+    for cell in root.iter('{%s}c' %(NAMESPACE['x'])):
+        if cell.get('t') == 's':
+            cells[cell.get('r')] = shared[int(cell.findtext('x:v', namespaces=NAMESPACE))]
+        elif cell.get('t') == 'inlineStr':
+            cells[cell.get('r')] = cell.findtext('.//x:t', namespaces=NAMESPACE)
+        elif cell.find('x:v', NAMESPACE) is not None:
+            cells[cell.get('r')] = float(cell.findtext('x:v', namespaces=NAMESPACE))
+    return cells
+
+
+def test_write_columns_in_a_constant_memory_workbook(tmp_path):
+    path = tmp_path / "report.xlsx"
+    workbook = report_workbook(path)
+    worksheet = workbook.add_worksheet("Flux")
+    worksheet.write_row(0, 0, ["Name", "C1"])
+    pruned = np.array([1.5, np.nan, 3.5])
+    write_columns(worksheet, 2, 0, [["t", 0, 1, 2], None, ["CH4", 1.5, 2.5, 3.5], ["Pruned CH4"] + report_column(pruned), ["Note"]])
+    workbook.close()
+    cells = read_cells(path)
+    assert cells == {'A1': "Name", 'B1': "C1", 'A3': "t", 'A4': 0, 'A5': 1, 'A6': 2, 'C3': "CH4", 'C4': 1.5, 'C5': 2.5, 'C6': 3.5,
+                     'D3': "Pruned CH4", 'D4': 1.5, 'D6': 3.5, 'E3': "Note"}
+
+
+def test_charted_threshold():
+    assert charted([0.5], True) and not charted([0.5], False)
+    assert charted([0.85], 0.9) and not charted([0.95], 0.9) and not charted([0.9], 0.9)
+    # a flux is charted when any of its gases is below the threshold, or has no R^2
+    assert charted([0.95, 0.8], 0.9) and charted([np.nan], 0.9)
+
+
+def test_long_sheets_charts_only_fluxes_below_the_threshold(tmp_path):
+    workbook = xlsxwriter.Workbook(tmp_path / "report.xlsx")
+    RSQs = [0.95, 0.5, 0.99, np.nan, 0.89]
+    long_sheets(workbook, HEADER, [block(f"F{k}", 4, RSQ) for k, RSQ in enumerate(RSQs)], 0.9)
+    assert charted_ranges(workbook) == ["='Data'!C6:C9", "='Data'!C14:C17", "='Data'!C18:C21"]
+    workbook.close()
+
+
+def test_long_sheets_split_series_past_the_row_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'XLSX_ROWS', 10)     # 9 rows of data below the header of each worksheet
+    workbook = xlsxwriter.Workbook(tmp_path / "report.xlsx")
+    long_sheets(workbook, HEADER, [block("A", 4, 0.5), block("B", 6, 0.5), block("C", 20, 0.5), block("D", 2, 0.5)])
+    sheets = workbook.worksheets()
+    assert [sheet.name for sheet in sheets] == ["Data", "Data (2)", "Data (3)", "Data (4)", "Data (5)", "Charts"]
+    # every row of data is written once, in order, and never past the last row of a worksheet
+    written = [(sheet.table[row][0].string, sheet.table[row][1].number) for sheet in sheets[:-1] for row in range(1, sheet.dim_rowmax + 1)]
+    assert all(sheet.dim_rowmax < 10 for sheet in sheets[:-1])
+    assert len(written) == 32
+    assert [number for string, number in written] == list(range(4)) + list(range(6)) + list(range(20)) + list(range(2))
+    # B and C don't fit below the series before them so they start the next worksheet, C is longer than a
+    # worksheet so it's split and charted once per worksheet, D fits below the rest of C
+    assert charted_ranges(workbook) == ["='Data'!C2:C5", "='Data (2)'!C2:C7", "='Data (3)'!C2:C10",
+                                        "='Data (4)'!C2:C10", "='Data (5)'!C2:C3", "='Data (5)'!C4:C5"]
+    workbook.close()
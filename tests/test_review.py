@@ -0,0 +1,82 @@
+import threading
+import time
+
+import numpy as np
+import matplotlib.pyplot as plt
+import pytest
+
+pytest.importorskip("PySimpleGUI")
+
+from utils import review_plot, Cuts
+
+
+# reads of a flux's pruned times on the main thread while the same flux is prepared in the background
+def watch_preparation(monkeypatch, module, Flux):
+    preparing = set()
+    races = []
+    prepare = module.prepare_plot
+    pruned_times = Flux.pruned_times
+
+    def slow_prepare(flux):
+        if threading.current_thread() is threading.main_thread():
+            return prepare(flux)
+        preparing.add(id(flux))
+        try:
+            time.sleep(0.2)
+            return prepare(flux)
+        finally:
+            preparing.discard(id(flux))
+
+    def watched_pruned_times(flux):
+        if threading.current_thread() is threading.main_thread() and id(flux) in preparing:
+            races.append(flux.name)
+        return pruned_times.fget(flux)
+
+    monkeypatch.setattr(module, 'prepare_plot', slow_prepare)
+    monkeypatch.setattr(Flux, 'pruned_times', property(watched_pruned_times))
+    return races
+
+
+# fills in a two minute flux of noisy humidity, returning a rising noisy gas series to go with it
+def flux_data(flux, seed):
+    rng = np.random.default_rng(seed)
+    flux.times = np.arange(120, dtype=float)
+    flux.H2O = 10000 + rng.normal(0, 5, 120)
+    flux.cuts = Cuts(120)
+    return 2000 + 0.5 * flux.times + rng.normal(0, 1, 120)
+
+
+def step_through(draw, fluxes, fig):
+    # the right arrow key, pressed as fast as the plots are drawn
+    for i in range(len(fluxes)):
+        draw(i)
+    review_plot(fig).close()
+    plt.close(fig)
+
+
+def test_licor_draw_plot_waits_for_background_preparation(monkeypatch):
+    import LICOR
+    races = watch_preparation(monkeypatch, LICOR, LICOR.Flux)
+    fluxes = []
+    for i in range(4):
+        flux = LICOR.Flux(f"flux {i}", 'light', 0, 120, 20, 20, 0.3, 0.1)
+        flux.samples = flux_data(flux, i)
+        flux.gases = {'ch4': flux.samples}
+        fluxes.append(flux)
+    session = LICOR.Session('ch4')
+    fig, (ax1, ax2) = plt.subplots(2, 1)
+    step_through(lambda i: LICOR.draw_plot(i, fluxes, fig, ax1, ax2, None, '', session), fluxes, fig)
+    assert races == []
+
+
+def test_lgr_draw_plot_waits_for_background_preparation(monkeypatch):
+    import LGR
+    races = watch_preparation(monkeypatch, LGR, LGR.Flux)
+    fluxes = []
+    for i in range(4):
+        flux = LGR.Flux(f"flux {i}", 'dark', 0, 120, 0.3, 0.1)
+        flux.CH4 = flux_data(flux, i)
+        fluxes.append(flux)
+    fig, (ax1, ax2) = plt.subplots(2, 1)
+    step_through(lambda i: LGR.draw_plot(i, fluxes, fig, ax1, ax2, '', 'ch4'), fluxes, fig)
+    assert races == []
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from utils import PrefixSums
+
+
+def brute_force_window(X, Y, min_length, min_duration, criterion):
+    # every window scored with its own least squares fit, the first best one in (start, end) order wins
+    best, best_score = None, -np.inf
+    for start in range(len(X)):
+        for end in range(start + max(min_length, 3), len(X) + 1):
+            if X[end - 1] - X[start] < min_duration:
+                continue
+            x, y = X[start:end], Y[start:end]
+            fitted = np.polyval(np.polyfit(x, y, 1), x)
+            SS_res = np.sum((y - fitted) ** 2)
+            score = 1 - SS_res / np.sum((y - y.mean()) ** 2) if criterion == 'r2' else -np.sqrt(SS_res / len(x))
+            if score > best_score + 1e-12:
+                best, best_score = (start, end), score
+    return best, best_score
+
+
+def window_score(X, Y, window, criterion):
+    x, y = X[window[0]:window[1]], Y[window[0]:window[1]]
+    SS_res = np.sum((y - np.polyval(np.polyfit(x, y, 1), x)) ** 2)
+    return 1 - SS_res / np.sum((y - y.mean()) ** 2) if criterion == 'r2' else -np.sqrt(SS_res / len(x))
+
+
+@pytest.mark.parametrize('criterion', ['r2', 'rmse'])
+def test_best_window_matches_brute_force(criterion):
+    rng = np.random.default_rng(0)
+    for seed in range(8):
+        X = np.cumsum(rng.uniform(0.5, 1.5, 60))
+        Y = 400 + 0.8 * X + rng.normal(0, 1, 60)
+        Y[rng.integers(0, 60):] += rng.uniform(-20, 20)     # a jump the best window avoids
+        min_length, min_duration = int(rng.integers(3, 20)), float(rng.uniform(0, 30))
+        window = PrefixSums(X, Y).best_window(X, min_length, min_duration, criterion)
+        expected, score = brute_force_window(X, Y, min_length, min_duration, criterion)
+        assert window[1] - window[0] >= min_length and X[window[1] - 1] - X[window[0]] >= min_duration
+        # windows scoring the same up to rounding are equally good
+        assert window == expected or np.isclose(window_score(X, Y, window, criterion), score)
+
+
+def test_best_window_none_when_nothing_fits():
+    X = np.arange(10, dtype=float)
+    Y = 2 * X
+    assert PrefixSums(X, Y).best_window(X, 11) is None
+    assert PrefixSums(X, Y).best_window(X, 3, min_duration=20) is None
+    assert PrefixSums(X, Y).best_window(X, 10) == (0, 10)
@@ -1,76 +1,1069 @@
 import matplotlib.pyplot as plt
 import matplotlib.lines as lines
+from matplotlib.offsetbox import AnchoredText
+import numpy as np
+import weakref
+import xlsxwriter
+from xlsxwriter.utility import xl_col_to_name
+import json
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+
+try:    # optional, only needed to export Parquet and Feather tables
+    import pyarrow
+    import pyarrow.parquet
+    import pyarrow.feather
+except ImportError:
+    pyarrow = None
+
+# series longer than this many points are decimated for plotting, about two points per pixel of a review plot
+PLOT_POINTS = 4000
+# ebullition suggestions flag rates of change more than this many robust standard deviations from the median
+EBULLITION_THRESHOLD = 6
+# flux models offered by fit_models, and the rates k * duration of the exponential model's grid search
+FLUX_MODELS = ('linear', 'quadratic', 'exponential')
+EXPONENTIAL_RATES = np.geomspace(0.01, 10, 60)
+# resamples drawn for each flux's bootstrap confidence interval
+BOOTSTRAP_RESAMPLES = 2000
+# confidence level of the bootstrap confidence intervals
+CONFIDENCE_LEVEL = 0.95
+# formats export_tables can write, Parquet and Feather need pyarrow
+EXPORT_FORMATS = ('parquet', 'feather', 'csv')
+# report layouts: a worksheet per flux, or every flux's series in one long table
+REPORT_LAYOUTS = ('sheets', 'long')
+# columns of the exported flux summary, one row per flux and gas, and of the long-format series, see flux_tables
+SUMMARY_COLUMNS = ['flux_id', 'name', 'gas', 'model', 'RSQ', 'rate_of_change', 'm', 'flux', 'CI_low', 'CI_high', 'chamber_volume', 'air_temp', 'data_loss']
+SERIES_COLUMNS = ['flux_id', 'gas', 't', 'pruned_t', 'time_offset', 'value', 'pruned_value', 'offset', 'H2O', 'pruned_H2O', 'cut']
+# rows of an Excel worksheet
+XLSX_ROWS = 1048576
 
 class draggable_lines:
+    """
+    Vertical cursor that can be dragged between x_bounds. While dragging, only the cursor is redrawn
+    (blitted over a saved background of the axes), the rest of the figure is drawn once on release.
+    """
     def __init__(self, ax, start_coordinate, x_bounds, y_bounds):
         self.ax = ax
         self.c = ax.get_figure().canvas
         self.x_bounds = x_bounds
         self.y_bounds = y_bounds
         self.press = None
+        self.background = None  # the axes without this cursor, saved when a drag starts
 
         self.line = lines.Line2D([start_coordinate, start_coordinate], y_bounds, color='r', picker=5)
 
         self.ax.add_line(self.line)
         self.c.draw_idle()
-        self.sid = self.c.mpl_connect('button_press_event', self.on_press)
-        self.sid = self.c.mpl_connect('motion_notify_event', self.on_motion)
-        self.sid = self.c.mpl_connect('button_release_event', self.on_release)
+        self.cids = [self.c.mpl_connect('button_press_event', self.on_press),
+                     self.c.mpl_connect('motion_notify_event', self.on_motion),
+                     self.c.mpl_connect('button_release_event', self.on_release)]
 
+    def move(self, coordinate, x_bounds, y_bounds):
+        # reuse the cursor for new data instead of creating another one
+        self.x_bounds = x_bounds
+        self.y_bounds = y_bounds
+        self.press = None
+        self.line.set_data([coordinate, coordinate], y_bounds)
+
+    def remove(self):
+        for cid in self.cids:
+            self.c.mpl_disconnect(cid)
+        self.line.remove()
 
     def on_press(self, event):
+        if event.inaxes is not self.ax or event.xdata is None:
+            return
         if abs(event.xdata - self.line.get_xdata()[0]) < 3:
             self.press = (self.line.get_xdata()[0], event.xdata)
+            if getattr(self.c, 'supports_blit', False):
+                self.line.set_animated(True)
+                self.c.draw()
+                self.background = self.c.copy_from_bbox(self.ax.bbox)
+                self._blit()
         return
     
     def on_motion(self, event):
-        if self.press == None:
+        if self.press == None or event.xdata is None:
             return 
-        try: 
-            x0, xpress = self.press
-            dx = event.xdata - xpress
-            if self.x_bounds[0] >= (x0 + dx):
-                self.line.set_xdata([self.x_bounds[0],self.x_bounds[0]])
-            elif (x0 + dx) >= self.x_bounds[1]:
-                self.line.set_xdata([self.x_bounds[1], self.x_bounds[1]])
-            else:
-                self.line.set_xdata([x0+dx, x0+dx])
-        except:
-            pass
+        x0, xpress = self.press
+        dx = event.xdata - xpress
+        if self.x_bounds[0] >= (x0 + dx):
+            self.line.set_xdata([self.x_bounds[0],self.x_bounds[0]])
+        elif (x0 + dx) >= self.x_bounds[1]:
+            self.line.set_xdata([self.x_bounds[1], self.x_bounds[1]])
+        else:
+            self.line.set_xdata([x0+dx, x0+dx])
+        self._blit()
+
+    def _blit(self):
+        # redraws only the cursor over the saved background, or the whole figure when the backend can't blit
+        if self.background is None:
+            self.c.draw_idle()
+            return
+        self.c.restore_region(self.background)
+        self.ax.draw_artist(self.line)
+        self.c.blit(self.ax.bbox)
     
     def on_release(self, event):
+        if self.press is None:
+            return
         self.press = None
+        self.background = None
+        self.line.set_animated(False)
         self.c.draw_idle()
 
 
+def decimate(x, y, budget=PLOT_POINTS):
+    """
+    Reduces a series to at most about budget points for plotting, keeping the minimum and maximum of
+    each bucket of consecutive points (in their original order) so spikes and cuts stay visible.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    if len(y) <= budget or budget < 2:
+        return x, y
+    size = -(-len(y) // (budget // 2))     # points per bucket
+    buckets = -(-len(y) // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:len(y)] = y
+    padded = padded.reshape(buckets, size)
+    firsts = np.arange(buckets) * size
+    lows = firsts + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    highs = firsts + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    keep = np.unique(np.concatenate(([0], lows, highs, [len(y) - 1])))
+    keep = keep[keep < len(y)]
+    return x[keep], y[keep]
+
+
+class ReviewPlot:
+    """
+    Persistent artists of a review figure: one line and one text box per axes and a pair of cursors, created
+    on the first draw and updated in place afterwards. Series are decimated to PLOT_POINTS for drawing.
+    Use review_plot(fig) to get the figure's ReviewPlot.
+    """
+    def __init__(self, fig):
+        self.fig = fig
+        self.lines = {}     # plotted series, keyed by axes
+        self.texts = {}     # text boxes, keyed by axes
+        self.spans = []     # shaded x spans, replaced on every draw
+        self.line_L = None  # draggable cursors, on one axes
+        self.line_R = None
+        self.prefetcher = None  # prepares the items next to the one shown, see prepared
+
+    def plot(self, ax, x, y):
+        # shows the series on ax and rescales ax to it, ignoring every other artist
+        x, y = decimate(x, y)
+        if ax in self.lines:
+            self.lines[ax].set_data(x, y)
+        else:
+            self.lines[ax] = ax.plot(x, y, linewidth = 2.0)[0]
+            ax.grid(True)
+        ax.ignore_existing_data_limits = True
+        finite = np.isfinite(x) & np.isfinite(y)
+        if finite.any():
+            ax.update_datalim(np.column_stack((x[finite], y[finite])))
+        ax.autoscale_view()
+
+    def text(self, ax, text, loc='upper center', size=12):
+        if ax not in self.texts:
+            at = AnchoredText(text, prop=dict(size=size), frameon=True, loc=loc)
+            at.patch.set_boxstyle("round,pad=0.,rounding_size=0.2")
+            at.patch.set_alpha(0.5)
+            ax.add_artist(at)
+            self.texts[ax] = at
+        else:
+            self.texts[ax].txt.set_text(text)
+
+    def shade(self, ax, spans, **kwargs):
+        for span in self.spans:
+            span.remove()
+        self.spans = [ax.axvspan(time_L, time_R, **kwargs) for time_L, time_R in spans]
+
+    def cursors(self, ax, left, right, x_bounds):
+        # left and right draggable boundary lines spanning the current y limits of ax
+        y_bounds = ax.get_ylim()
+        if self.line_L is None:
+            self.line_L = draggable_lines(ax, left, x_bounds, y_bounds)
+            self.line_R = draggable_lines(ax, right, x_bounds, y_bounds)
+        else:
+            self.line_L.move(left, x_bounds, y_bounds)
+            self.line_R.move(right, x_bounds, y_bounds)
+        return self.line_L, self.line_R
+
+    def prepared(self, items, i, prepare, state):
+        # prepare(items[i]), while the items next to it are prepared in the background for the next draw
+        if self.prefetcher is None or self.prefetcher.items is not items:
+            self.close()
+            self.prefetcher = Prefetcher(items, prepare, state)
+        result = self.prefetcher.get(i)
+        self.prefetcher.prefetch(i + 1, i - 1)
+        return result
+
+    def draw(self):
+        self.fig.canvas.draw_idle()
+
+    def close(self):
+        # stops preparing items in the background, call once the figure is closed
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+
+
+class Prefetcher:
+    """
+    Prepares items (e.g. fluxes for review) in a background thread ahead of their use. prepare(item) may only
+    fill in derived data of the item, and an item mustn't be changed while it's prepared in the background.
+    A result is kept with state(item) as it was after preparing, and is prepared again once that state changes.
+    """
+    def __init__(self, items, prepare, state):
+        self.items = items
+        self.prepare = prepare
+        self.state = state
+        self.futures = {}   # index: future of (result, state)
+        self.pool = ThreadPoolExecutor(max_workers=1)
+
+    def _prepare(self, item):
+        result = self.prepare(item)
+        return result, self.state(item)
+
+    def get(self, i):
+        # waits for a background result, or prepares the item now if there is none or it's out of date
+        if i in self.futures:
+            result, state = self.futures[i].result()
+            if state == self.state(self.items[i]):
+                return result
+        future = Future()
+        future.set_result(self._prepare(self.items[i]))
+        self.futures[i] = future
+        return future.result()[0]
+
+    def prefetch(self, *indices):
+        # starts preparing the items at indices in the background, unless they're already prepared and up to date
+        for i in indices:
+            if not 0 <= i < len(self.items):
+                continue
+            if i in self.futures:
+                if not self.futures[i].done() or self.futures[i].result()[1] == self.state(self.items[i]):
+                    continue
+            self.futures[i] = self.pool.submit(self._prepare, self.items[i])
+
+    def close(self):
+        # waits for a preparation that's running, so nothing still reads a flux once review is over
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def review_state(flux):
+    # what a flux's prepared review plot depends on besides its data
+    return flux.cuts.changes, flux.suggestions
+
+
+_review_plots = weakref.WeakKeyDictionary()
+
+
+def review_plot(fig):
+    # the ReviewPlot of a figure, created on first use
+    if fig not in _review_plots:
+        _review_plots[fig] = ReviewPlot(fig)
+    return _review_plots[fig]
 
 
 def linear_regression(X, Y):
     # simple linear regression
-    sumX = sum(X)
-    sumY = sum(Y)
-    meanX = sumX/len(X)
-    meanY = sumY/len(Y)
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if len(X) == 0:
+        raise ZeroDivisionError("Can't fit a line to an empty data set")
+    meanX = X.mean()
+    meanY = Y.mean()
 
-    SSx = 0 # sum of squares
-    SP = 0  # sum of products
-
-    for i in range(len(X)):
-        SSx = SSx + (X[i] - meanX) ** 2
-        SP = SP + (X[i] - meanX)*(Y[i] - meanY)
+    SSx = np.sum((X - meanX) ** 2)          # sum of squares
+    SP = np.sum((X - meanX) * (Y - meanY))  # sum of products
+    if SSx == 0:
+        raise ZeroDivisionError("Can't fit a line when every X value is the same")
 
     # generates slope and intercept based on standards and baseline samples
     m = SP/SSx
     b = meanY - m * meanX
 
-    SS_res = 0
-    SS_t = 0
+    SS_res = np.sum((Y - X*m - b) ** 2)
+    SS_t = np.sum((Y - meanY) ** 2)
+    if SS_t == 0:
+        raise ZeroDivisionError("Can't calculate R^2 when every Y value is the same")
 
-    for i in range(len(X)):
-        SS_res = SS_res + (Y[i] - X[i]*m - b) ** 2
-        SS_t = SS_t + (Y[i] - meanY) ** 2
-    
     R2 = 1 - SS_res/SS_t    # coefficient of determination
 
-    return m, b, R2
+    return float(m), float(b), float(R2)
+
+
+def linear_regressions(X, Y, offsets=None):
+    """
+    Simple linear regressions of many series in one vectorized pass. X and Y are either lists of
+    series, or every series concatenated end to end with offsets holding the start index of each
+    series followed by the total length. Returns arrays of the slope, intercept, R^2, standard error
+    of the slope and RMSE of every series, with nan wherever a series can't be fit.
+    """
+    if offsets is None:
+        lengths = np.array([len(series) for series in X], dtype=int)
+        X = np.concatenate([np.asarray(series, dtype=float) for series in X] + [np.empty(0)])
+        Y = np.concatenate([np.asarray(series, dtype=float) for series in Y] + [np.empty(0)])
+    else:
+        lengths = np.diff(np.asarray(offsets, dtype=int))
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+
+    count = len(lengths)
+    series = np.repeat(np.arange(count), lengths)
+
+    def sums(values):
+        return np.bincount(series, weights=values, minlength=count)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = lengths.astype(float)
+        meanX = sums(X) / n
+        meanY = sums(Y) / n
+        dX = X - meanX[series]
+        dY = Y - meanY[series]
+
+        SSx = sums(dX * dX)     # sum of squares
+        SP = sums(dX * dY)      # sum of products
+        SS_t = sums(dY * dY)
+
+        m = np.where(SSx > 0, SP / SSx, np.nan)
+        b = meanY - m * meanX
+        SS_res = sums((dY - m[series] * dX) ** 2)
+
+        R2 = np.where(SS_t > 0, 1 - SS_res / SS_t, np.nan)
+        stderr = np.where(n > 2, np.sqrt(SS_res / (n - 2) / SSx), np.nan)
+        RMSE = np.sqrt(SS_res / n)
+
+    return m, b, R2, stderr, RMSE
+
+
+def _series_index(X, Y):
+    # concatenates ragged series end to end, with the series number of every datapoint
+    lengths = np.array([len(series) for series in X], dtype=int)
+    X = np.concatenate([np.asarray(series, dtype=float) for series in X] + [np.empty(0)])
+    Y = np.concatenate([np.asarray(series, dtype=float) for series in Y] + [np.empty(0)])
+    return X, Y, lengths, np.repeat(np.arange(len(lengths)), lengths)
+
+
+def fit_models(X, Y, models=FLUX_MODELS):
+    """
+    Fit each flux model to many series in one vectorized pass. Returns {model: (slope, R2, AIC)}, arrays
+    of the initial rate of change (dY/dX at the first datapoint), R^2 and Akaike information criterion of
+    every series, with nan wherever a series can't be fit.
+        linear:      Y = a + m*X
+        quadratic:   Y = a + b*X + c*X^2, the initial slope is b
+        exponential: Y = Cs + (C0 - Cs)*exp(-k*X), HMR style saturation towards Cs, the initial slope is k*(Cs - C0)
+    X is measured from the first datapoint and scaled by the duration of each series, the exponential
+    rate k is searched on a fixed grid (the other parameters are linear given k).
+    """
+    X, Y, lengths, series = _series_index(X, Y)
+    count = len(lengths)
+    n = lengths.astype(float)
+    starts = np.cumsum(lengths) - lengths
+    ends = starts + lengths - 1
+
+    def sums(values):
+        return np.bincount(series, weights=values, minlength=count)
+
+    fits = {}
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # empty series have no first or last datapoint, their starts may be past the end of X
+        nonempty = lengths > 0
+        first = np.full(count, np.nan)
+        first[nonempty] = X[starts[nonempty]]
+        duration = np.full(count, np.nan)
+        duration[nonempty] = X[ends[nonempty]] - first[nonempty]
+        u = (X - first[series]) / duration[series]     # 0 to 1 across each series
+        dY = Y - (sums(Y) / n)[series]
+        SS_t = sums(dY * dY)
+
+        def aic(SS_res, k):
+            # too few datapoints for the number of parameters can't be compared
+            return np.where(n > k + 1, n * np.log(SS_res / n) + 2 * k, np.nan)
+
+        def r2(SS_res):
+            return np.where(SS_t > 0, 1 - SS_res / SS_t, np.nan)
+
+        if 'linear' in models:
+            m, _, R2, _, _ = linear_regressions(X, Y, np.concatenate((starts, [len(X)])))
+            SS_res = np.maximum((1 - R2) * SS_t, 0)
+            fits['linear'] = (m, R2, aic(SS_res, 2))
+
+        if 'quadratic' in models:
+            # normal equations of [1, u, u^2] for every series at once
+            powers = [sums(u ** k) for k in range(5)]
+            A = np.stack([np.stack(powers[r: r + 3], axis=-1) for r in range(3)], axis=-2)
+            rhs = np.stack([sums(dY * u ** k) for k in range(3)], axis=-1)
+            solvable = np.abs(np.linalg.det(A)) > 1e-12
+            A[~solvable] = np.eye(3)
+            a, b, c = np.linalg.solve(A, rhs[..., None])[..., 0].T
+            SS_res = sums((dY - a[series] - b[series] * u - c[series] * u * u) ** 2)
+            fits['quadratic'] = (np.where(solvable & (n > 3), b / duration, np.nan), r2(SS_res), aic(SS_res, 3))
+
+        if 'exponential' in models:
+            best_SS_res = np.full(count, np.inf)
+            slope = np.full(count, np.nan)
+            for k in EXPONENTIAL_RATES:
+                Z = np.exp(-k * u)
+                dZ = Z - (sums(Z) / n)[series]
+                SSz = sums(dZ * dZ)
+                SP = sums(dZ * dY)
+                beta = SP / SSz
+                SS_res = np.maximum(SS_t - beta * SP, 0)
+                better = (SSz > 0) & (SS_res < best_SS_res)
+                best_SS_res[better] = SS_res[better]
+                slope[better] = (-beta * k / duration)[better]     # dY/dX at u = 0
+            best_SS_res[np.isinf(best_SS_res)] = np.nan
+            fits['exponential'] = (np.where(n > 3, slope, np.nan), r2(best_SS_res), aic(best_SS_res, 3))
+    return fits
+
+
+def select_models(X, Y, model='linear'):
+    """
+    Initial rate of change, R^2 and model name of every series for one of FLUX_MODELS, or 'aic'
+    to pick the model with the lowest AIC for each series separately.
+    """
+    if model != 'aic' and model not in FLUX_MODELS:
+        raise Exception("Error: Unknown flux model %s, expected one of %s or aic" %(model, ", ".join(FLUX_MODELS)))
+    fits = fit_models(X, Y, FLUX_MODELS if model == 'aic' else (model,))
+    names = list(fits)
+    slopes, R2s, AICs = [np.stack([fits[name][i] for name in names]) for i in range(3)]
+    chosen = np.zeros(len(X), dtype=int)
+    if model == 'aic' and len(X):
+        # models that can't be fit never win, the linear model is the fallback
+        chosen = np.argmin(np.where(np.isnan(AICs) | np.isnan(slopes), np.inf, AICs), axis=0)
+    columns = np.arange(len(X))
+    return slopes[chosen, columns], R2s[chosen, columns], [names[i] for i in chosen]
+
+
+def _design(X, Y, model):
+    # design matrix of the model (linear in its parameters once the exponential rate is chosen),
+    # and the weights giving the initial slope from the fitted parameters
+    duration = X[-1] - X[0]
+    u = (X - X[0]) / duration
+    if model == 'linear':
+        return np.column_stack((np.ones_like(X), X)), np.array([0, 1])
+    if model == 'quadratic':
+        return np.column_stack((np.ones_like(u), u, u * u)), np.array([0, 1 / duration, 0])
+    # exponential, the rate with the least squared residuals over the same grid as fit_models
+    Z = np.exp(-EXPONENTIAL_RATES[:, None] * u)
+    dZ = Z - Z.mean(axis=1, keepdims=True)
+    dY = Y - Y.mean()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        SS_res = np.sum(dY * dY) - (dZ @ dY) ** 2 / np.sum(dZ * dZ, axis=1)
+    k = np.nanargmin(SS_res)
+    return np.column_stack((np.ones_like(u), Z[k])), np.array([0, -EXPONENTIAL_RATES[k] / duration])
+
+
+def bootstrap_ci(X, Y, model='linear', resamples=BOOTSTRAP_RESAMPLES, block=None, level=CONFIDENCE_LEVEL, seed=None):
+    """
+    Confidence interval (low, high) of the initial slope of one series by a circular block bootstrap of
+    the model's residuals. The slope is a fixed linear combination w of the data, so every resample's
+    slope is the fitted slope plus w applied to its resampled residuals, one matrix product for all of them.
+    Blocks of about n^(1/3) datapoints keep the residuals' autocorrelation, block=1 is the ordinary bootstrap.
+    """
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    n = len(X)
+    if n < 4:
+        return np.nan, np.nan
+    design, slope_weights = _design(X, Y, model)
+    pinv = np.linalg.pinv(design)
+    w = slope_weights @ pinv
+    residuals = Y - design @ (pinv @ Y)
+    residuals = residuals - residuals.mean()
+
+    rng = np.random.default_rng(seed)
+    block = block or max(1, int(round(n ** (1 / 3))))
+    starts = rng.integers(0, n, size=(resamples, -(-n // block)))
+    index = ((starts[:, :, None] + np.arange(block)) % n).reshape(resamples, -1)[:, :n]
+    slopes = w @ Y + residuals[index] @ w
+    low, high = np.percentile(slopes, [50 * (1 - level), 50 * (1 + level)])
+    return float(low), float(high)
+
+
+def _bootstrap_ci(args):
+    # one flux's bootstrap_ci for ProcessPoolExecutor.map
+    return bootstrap_ci(*args)
+
+
+def bootstrap_cis(X, Y, models, resamples=BOOTSTRAP_RESAMPLES, block=None, level=CONFIDENCE_LEVEL, seed=None, processes=1):
+    """
+    Bootstrap confidence intervals of the initial slope of every series, see bootstrap_ci. Each series
+    gets its own random stream spawned from seed, so the results don't depend on how many processes run them.
+    processes > 1 spreads the series across a process pool, which needs the calling script to be import safe.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(X))
+    jobs = [(x, y, model, resamples, block, level, s) for x, y, model, s in zip(X, Y, models, seeds)]
+    if processes == 1 or len(jobs) < 2:
+        return [_bootstrap_ci(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_bootstrap_ci, jobs, chunksize=max(1, len(jobs) // (4 * (processes or 4)))))
+
+
+class RegressionSums:
+    """
+    Running sums (n, Sx, Sy, Sxy, Sxx, Syy) for a simple linear regression. Points or whole intervals
+    can be added and removed without revisiting the rest of the data. The sums are kept relative to a
+    fixed centre (cx, cy) to avoid losing precision on large concentrations.
+    """
+    def __init__(self, cx=0, cy=0, sums=(0, 0, 0, 0, 0, 0)):
+        self.cx = cx
+        self.cy = cy
+        self.n, self.Sx, self.Sy, self.Sxy, self.Sxx, self.Syy = sums
+
+    def _update(self, X, Y, sign):
+        X = np.asarray(X, dtype=float) - self.cx
+        Y = np.asarray(Y, dtype=float) - self.cy
+        self.n += sign * X.size
+        self.Sx += sign * np.sum(X)
+        self.Sy += sign * np.sum(Y)
+        self.Sxy += sign * np.sum(X * Y)
+        self.Sxx += sign * np.sum(X * X)
+        self.Syy += sign * np.sum(Y * Y)
+
+    def add(self, X, Y):
+        self._update(X, Y, 1)
+
+    def remove(self, X, Y):
+        # removes a cut interval in O(cut length)
+        self._update(X, Y, -1)
+
+    def shifted(self, dx, dy):
+        # sums of the same points with dx added to every X and dy added to every Y
+        n, Sx, Sy = self.n, self.Sx, self.Sy
+        return RegressionSums(self.cx, self.cy, (n, Sx + n*dx, Sy + n*dy, self.Sxy + dy*Sx + dx*Sy + n*dx*dy,
+                                                 self.Sxx + 2*dx*Sx + n*dx*dx, self.Syy + 2*dy*Sy + n*dy*dy))
+
+    def __add__(self, other):
+        return RegressionSums(self.cx, self.cy, (self.n + other.n, self.Sx + other.Sx, self.Sy + other.Sy,
+                                                 self.Sxy + other.Sxy, self.Sxx + other.Sxx, self.Syy + other.Syy))
+
+    def regression(self):
+        # same results as linear_regression, from the sums alone
+        if self.n == 0:
+            raise ZeroDivisionError("Can't fit a line to an empty data set")
+        SSx = self.Sxx - self.Sx * self.Sx / self.n     # sum of squares
+        SP = self.Sxy - self.Sx * self.Sy / self.n      # sum of products
+        SS_t = self.Syy - self.Sy * self.Sy / self.n
+        # the sums can leave a tiny rounding error where the exact answer is zero
+        if SSx <= 1e-12 * (self.Sxx + 1):
+            raise ZeroDivisionError("Can't fit a line when every X value is the same")
+        if SS_t <= 1e-12 * (self.Syy + 1):
+            raise ZeroDivisionError("Can't calculate R^2 when every Y value is the same")
+
+        m = SP/SSx
+        b = self.cy + self.Sy / self.n - m * (self.cx + self.Sx / self.n)
+        R2 = m * SP / SS_t      # coefficient of determination, 1 - SS_res/SS_t
+        return float(m), float(b), float(R2)
+
+
+class PrefixSums:
+    """
+    Prefix sums of X, Y, XY, X^2 and Y^2 so the regression sums of any window of the data
+    (optionally shifted by a constant) are available in O(1).
+    """
+    def __init__(self, X, Y):
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        self.cx = X.mean() if len(X) else 0
+        self.cy = Y.mean() if len(Y) else 0
+        X = X - self.cx
+        Y = Y - self.cy
+        self.sums = [np.concatenate(([0], np.cumsum(series))) for series in (X, Y, X * Y, X * X, Y * Y)]
+
+    def window(self, start, end, dx=0, dy=0):
+        # regression sums of the points in [start, end), with dx added to every X and dy added to every Y
+        sums = [series[end] - series[start] for series in self.sums]
+        return RegressionSums(self.cx, self.cy, [end - start] + sums).shifted(dx, dy)
+
+    def regression(self, X, Y, cuts, x_interior_only=True, y_interior_only=True):
+        # linear regression of the pruned data, O(k) in the number of cuts
+        total = RegressionSums(self.cx, self.cy)
+        for (start, end, dx), (_, _, dy) in zip(cuts.segments(X, x_interior_only), cuts.segments(Y, y_interior_only)):
+            total = total + self.window(start, end, dx, dy)
+        return total.regression()
+
+    def best_window(self, X, min_length, min_duration=0, criterion='r2'):
+        """
+        Search every window [start, end) of at least min_length datapoints spanning at least min_duration
+        for the best linear fit, the highest R^2 or lowest RMSE. Each window's sums are O(1), with every
+        end of one start evaluated in a single vectorized step. Returns (start, end), or None if no window fits.
+        """
+        if criterion not in ('r2', 'rmse'):
+            raise Exception("Error: Unknown window criterion %s, expected r2 or rmse" %(criterion))
+        X = np.asarray(X, dtype=float)
+        Sx, Sy, Sxy, Sxx, Syy = self.sums
+        min_length = max(min_length, 3)
+        best, best_score = None, -np.inf
+
+        for start in range(len(X) - min_length + 1):
+            # the shortest end meeting both minimums, every later end is a candidate too
+            first_end = max(start + min_length, np.searchsorted(X, X[start] + min_duration, 'left') + 1)
+            if first_end > len(X):
+                break
+            end = np.arange(first_end, len(X) + 1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                n = end - start
+                sx = Sx[end] - Sx[start]
+                sy = Sy[end] - Sy[start]
+                SSx = Sxx[end] - Sxx[start] - sx * sx / n
+                SP = Sxy[end] - Sxy[start] - sx * sy / n
+                SS_t = Syy[end] - Syy[start] - sy * sy / n
+                SS_res = np.maximum(SS_t - SP * SP / SSx, 0)
+                if criterion == 'r2':
+                    score = np.where(SS_t > 0, 1 - SS_res / SS_t, np.nan)
+                else:
+                    score = -np.sqrt(SS_res / n)
+            score[~(SSx > 0)] = np.nan
+            if np.isnan(score).all():
+                continue
+            i = np.nanargmax(score)
+            if score[i] > best_score:
+                best, best_score = (start, int(end[i])), score[i]
+        return best
+
+
+def cut_deltas(data, cuts, interior_only=True):
+    """
+    Calculate the continuity offset (delta) of each cut [first, last, interior] (original indices, in
+    the order they were made). A cut in the middle of the data shifts all datapoints after it by a delta
+    equal to the gap between the first and last datapoints of the cut, as they were when the cut was made.
+    If the cut is at the start of the data (i.e. the cut isn't in the middle of the data), the
+    offset (delta) will be zero unless interior_only is False.
+    """
+    deltas = []
+    for i in range(len(cuts)):
+        first, last, interior = cuts[i]
+        delta = 0
+        if interior or not interior_only:
+            # earlier cuts ending inside this one had already shifted its last datapoint
+            delta = data[first] - data[last] - sum(deltas[j] for j in range(i) if first <= cuts[j][1] < last)
+        deltas.append(delta)
+    return deltas
+
+
+def prune_data(data, keep, cuts, interior_only=True):
+    # return the values of data kept by the boolean keep mask, shifted by the cut deltas to keep the data continuous
+    data = np.asarray(data, dtype=float)
+    shift = np.zeros(len(data) + 1)
+    for cut, delta in zip(cuts, cut_deltas(data, cuts, interior_only)):
+        shift[cut[1] + 1] += delta
+    return (data + np.cumsum(shift)[:-1])[keep]
+
+
+class Cuts:
+    """
+    Records every user cut as an interval of original data indices, in the order the cuts were made.
+    The keep mask and pruned data sets are derived lazily from the cuts and cached until they change,
+    so cutting, undoing and redoing only cost O(k) in the number of cuts.
+    """
+    def __init__(self, length):
+        self.length = length    # length of the original data
+        self.cuts = []          # every cut, [first, last, interior] in original indices
+        self.undone = []        # cuts removed by undo or reset, most recent last
+        self._intervals = None  # sorted, merged [first, last] intervals of cut indices
+        self._keep = None       # mask of the datapoints kept after pruning
+        self._pruned = {}       # pruned data sets, keyed by the id of the original data
+        self.changes = 0        # number of times the cuts changed, for anything derived from them
+
+    def __len__(self):
+        return len(self.cuts)
+
+    def __iter__(self):
+        return iter(self.cuts)
+
+    def _changed(self):
+        self.changes += 1
+        self._intervals = None
+        self._keep = None
+        self._pruned = {}
+
+    @property
+    def intervals(self):
+        # only cached once complete, so a background preparation never reads it half built
+        if self._intervals is None:
+            intervals = []
+            for first, last, interior in sorted(self.cuts):
+                if intervals and first <= intervals[-1][1] + 1:
+                    intervals[-1][1] = max(intervals[-1][1], last)
+                else:
+                    intervals.append([first, last])
+            self._intervals = intervals
+        return self._intervals
+
+    @property
+    def keep(self):
+        # likewise only cached once complete
+        if self._keep is None:
+            keep = np.ones(self.length, dtype=bool)
+            for first, last in self.intervals:
+                keep[first: last + 1] = False
+            self._keep = keep
+        return self._keep
+
+    @property
+    def kept(self):
+        # number of datapoints left after pruning
+        return self.length - sum(last - first + 1 for first, last in self.intervals)
+
+    def prune(self, data, interior_only=True):
+        # pruned (continuous) version of data, see prune_data
+        key = (id(data), interior_only)
+        if key not in self._pruned or self._pruned[key][0] is not data:
+            self._pruned[key] = (data, prune_data(data, self.keep, self.cuts, interior_only))
+        return self._pruned[key][1]
+
+    def segments(self, data, interior_only=True):
+        # kept [start, end) ranges of the original data, each with the continuity shift applied to it
+        deltas = cut_deltas(data, self.cuts, interior_only)
+        segments = []
+        start = 0
+        for first, last in self.intervals + [[self.length, self.length]]:
+            if first > start:
+                shift = sum(deltas[i] for i in range(len(self.cuts)) if self.cuts[i][1] < start)
+                segments.append((start, first, shift))
+            start = last + 1
+        return segments
+
+    def original_index(self, index):
+        # maps an index in the pruned data to the original data by skipping over every cut interval before it
+        for first, last in self.intervals:
+            if first > index:
+                break
+            index += last - first + 1
+        return index
+
+    def cut(self, pruned_times, time_L, time_R):
+        """
+        Cut the data between the two cursor times (given on the pruned time axis).
+        Returns False if the cut would remove the entire data set.
+        """
+        time_L, time_R = min(time_L, time_R), max(time_L, time_R)
+        time_L_index = max(np.searchsorted(pruned_times, time_L, 'right') - 1, 0)
+        time_R_index = max(np.searchsorted(pruned_times, time_R, 'right') - 1, 0)
+
+        if (time_R_index - time_L_index + 1) >= self.kept:
+            return False
+        self.cuts.append([self.original_index(time_L_index), self.original_index(time_R_index), time_L_index > 0])
+        self.undone = []
+        self._changed()
+        return True
+
+    def cut_original(self, times, time_L, time_R):
+        # cut between two times given on the original time axis, as written in the reports
+        # the kept original times index the same points as the pruned times
+        return self.cut(np.asarray(times)[self.keep], time_L, time_R)
+
+    def trim(self, times, start, end):
+        # cut everything outside the window [start, end) of original indices, returns False if nothing was cut
+        trimmed = False
+        if start > 0:
+            trimmed = self.cut_original(times, times[0], times[start - 1])
+        if end < self.length:
+            trimmed = self.cut_original(times, times[end], times[-1]) or trimmed
+        return trimmed
+
+    def cut_suggestions(self, times, suggestions):
+        """
+        Cut every suggested [first, last] interval of original indices, e.g. from ebullition().
+        Suggestions overlapping data that's already cut are skipped. Returns the number of cuts made.
+        """
+        made = 0
+        for first, last in suggestions:
+            if self.keep[first: last + 1].all() and self.cut_original(times, times[first], times[last]):
+                made += 1
+        return made
+
+    def pruned_spans(self, pruned_times, suggestions):
+        # (time_L, time_R) of each suggested interval still fully kept, on the pruned time axis for plotting
+        pruned_index = np.cumsum(self.keep) - 1
+        return [(pruned_times[pruned_index[first]], pruned_times[pruned_index[last]])
+                for first, last in suggestions if self.keep[first: last + 1].all()]
+
+    def undo(self):
+        # removes the most recent cut, returns False if there was nothing to undo
+        if not self.cuts:
+            return False
+        self.undone.append(self.cuts.pop())
+        self._changed()
+        return True
+
+    def redo(self):
+        # restores the most recently undone cut, returns False if there was nothing to redo
+        if not self.undone:
+            return False
+        self.cuts.append(self.undone.pop())
+        self._changed()
+        return True
+
+    def reset(self):
+        # removes every cut, they can still be restored one at a time with redo
+        if not self.cuts:
+            return False
+        self.undone = self.undone + self.cuts[::-1]
+        self.cuts = []
+        self._changed()
+        return True
+
+
+def ebullition(times, samples, threshold=EBULLITION_THRESHOLD, pad=1):
+    """
+    Suggested cut intervals for ebullition, i.e. sudden jumps in concentration that a steady flux can't explain.
+    The rate of change between consecutive datapoints is compared to its median, in units of the median absolute
+    deviation, and each run of outlying rates is suggested as one [first, last] interval of original indices,
+    widened by pad datapoints on each side. Cutting an interval removes its jump from the pruned data.
+    """
+    times = np.asarray(times, dtype=float)
+    samples = np.asarray(samples, dtype=float)
+    if len(samples) < 3:
+        return []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.diff(samples) / np.diff(times)
+    rates[~np.isfinite(rates)] = np.nan
+    if np.isnan(rates).all():
+        return []
+
+    deviation = np.abs(rates - np.nanmedian(rates))
+    scale = 1.4826 * np.nanmedian(deviation)    # MAD scaled to a standard deviation
+    if not scale > 0:
+        scale = np.nanmean(deviation)           # quantized data can leave most rates equal
+        if not scale > 0:
+            return []
+    outliers = np.nan_to_num(deviation, nan=0) > threshold * scale
+
+    # rate i lies between datapoints i and i + 1, so a run of outlying rates [i, j) spans datapoints i to j
+    edges = np.diff(np.concatenate(([0], outliers.astype(np.int8), [0])))
+    firsts = np.maximum(np.flatnonzero(edges == 1) - pad, 0)
+    lasts = np.minimum(np.flatnonzero(edges == -1) + pad, len(samples) - 1)
+
+    suggestions = []
+    for first, last in zip(firsts.tolist(), lasts.tolist()):
+        if suggestions and first <= suggestions[-1][1] + 1:
+            suggestions[-1][1] = last
+        else:
+            suggestions.append([first, last])
+    return suggestions
+
+
+def cut_offsets(data, cuts, interior_only=True):
+    """
+    Calculate the pruned data and offsets of one series for every flux at once, for the sake of reporting.
+    data and cuts hold the original data and the Cuts of each flux. Returns, for each flux, the pruned
+    data aligned with the original data (nan at cut indices) and the offset of each index (zero at cut indices).
+    """
+    if len(data) == 0:
+        return [], []
+    lengths = [len(series) for series in data]
+    bounds = np.cumsum(lengths)[:-1]
+    original = np.concatenate(data).astype(float)
+    keep = np.concatenate([flux_cuts.keep for flux_cuts in cuts])
+
+    # each cut shifts the rest of its own flux, and the total shift is removed again at the start of the next flux
+    shift = np.zeros(len(original) + 1)
+    start = 0
+    for series, flux_cuts in zip(data, cuts):
+        deltas = cut_deltas(series, flux_cuts.cuts, interior_only)
+        for cut, delta in zip(flux_cuts.cuts, deltas):
+            shift[start + cut[1] + 1] += delta
+        start += len(series)
+        shift[start] -= sum(deltas)
+
+    pruned = np.where(keep, original + np.cumsum(shift)[:-1], np.nan)
+    offsets = np.where(keep, original - pruned, 0)
+    return np.split(pruned, bounds), np.split(offsets, bounds)
+
+
+def data_loss(cuts):
+    # total percent of each flux's data set that has been pruned
+    lengths = np.array([flux_cuts.length for flux_cuts in cuts])
+    kept = np.array([flux_cuts.kept for flux_cuts in cuts])
+    return 100 - np.round(kept / lengths * 100, 2)
+
+
+def report_column(column):
+    # converts an aligned pruned column for output, with '' in place of each cut value
+    return ['' if value != value else value for value in column.tolist()]
+
+
+def report_workbook(out):
+    """
+    Opens an xlsxwriter workbook for a report in constant_memory mode: every row is written to a temporary file
+    as soon as a later row is written, so memory doesn't grow with the size of the report. Worksheets must be
+    written strictly row by row, e.g. with write_columns.
+    """
+    return xlsxwriter.Workbook(out, {'constant_memory': True})
+
+
+def write_columns(worksheet, row, col, columns):
+    # writes the columns side by side from (row, col) one row at a time, None columns are left empty
+    columns = [[] if column is None else column for column in columns]
+    for offset, values in enumerate(itertools.zip_longest(*columns)):
+        worksheet.write_row(row + offset, col, values)
+
+
+def charted(RSQs, charts):
+    """
+    Whether a flux with these R^2 gets charts in its report. charts is True (every flux), False (none)
+    or an R^2 threshold, charting only fluxes with an R^2 below it (or without one).
+    """
+    if isinstance(charts, bool):
+        return charts
+    return bool(np.any(~(np.asarray(RSQs, dtype=float) >= charts)))
+
+
+def long_sheets(workbook, header, blocks, charts=True):
+    """
+    Writes the series of every flux below each other as one long table with the given header, on a "Data"
+    worksheet continued on "Data (2)", ... past Excel's row limit, instead of one worksheet per flux.
+    blocks gives the (title, y axis name, columns in the order of header, R^2) of each series. A series starts
+    on the next worksheet when it doesn't fit below the previous one, and only a series longer than a whole
+    worksheet is split across worksheets. Series chosen by charts (see charted) get a chart of their cut and
+    kept values over time, one per worksheet they're on, on a "Charts" worksheet.
+    """
+    t, value, pruned_value = (xl_col_to_name(header.index(name)) for name in ('t', 'value', 'pruned_value'))
+    sheets = []
+    plots = []  # (title, y axis name, worksheet, first row, last row) of each chart, rows as numbered in excel
+
+    def next_sheet():
+        sheet_name = "Data" if not sheets else "Data (%i)" %(len(sheets) + 1)
+        sheets.append(sheet_name)
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, header)
+        return worksheet, 1
+
+    worksheet, row = next_sheet()
+    for title, y_axis, columns, RSQ in blocks:
+        columns = [report_column(np.asarray(column)) for column in columns]
+        n = len(columns[0])
+        if row + n > XLSX_ROWS and row > 1:
+            worksheet, row = next_sheet()
+        start = 0
+        while start < n:
+            if row == XLSX_ROWS:
+                worksheet, row = next_sheet()
+            stop = min(n, start + XLSX_ROWS - row)
+            write_columns(worksheet, row, 0, [column[start:stop] for column in columns])
+            if charted([RSQ], charts):
+                plots.append((title if start == 0 else "%s (continued)" %(title), y_axis, sheets[-1], row + 1, row + stop - start))
+            row += stop - start
+            start = stop
+
+    if plots:
+        worksheet = workbook.add_worksheet("Charts")
+        for k in range(len(plots)):
+            title, y_axis, sheet_name, first, last = plots[k]
+            chart = workbook.add_chart({'type': 'line'})
+            chart.add_series({'values': '=\'%s\'!%s%i:%s%i'%(sheet_name, value, first, value, last), 'categories': '=\'%s\'!%s%i:%s%i'%(sheet_name, t, first, t, last), 'name': 'Cut values', 'line': {'color': 'red'}})
+            chart.add_series({'values': '=\'%s\'!%s%i:%s%i'%(sheet_name, pruned_value, first, pruned_value, last), 'categories': '=\'%s\'!%s%i:%s%i'%(sheet_name, t, first, t, last), 'name': 'Kept values', 'line': {'color': 'green'}})
+            chart.set_y_axis({'interval_unit': 10, 'interval_tick': 2, 'name': y_axis})
+            chart.set_x_axis({'name': 'Time (s)'})
+            chart.set_title({'name': title})
+            chart.set_size({'width': 800, 'height': 600})
+            worksheet.insert_chart('A%i' %(1 + 32*k), chart)
+
+
+def export_tables(out, tables, format='parquet'):
+    """
+    Writes each table (a dictionary of equally long columns, keyed by column name) next to the report out, as
+    <out>_<table name>.<format>, so downstream pipelines can read the columns without parsing the Excel report.
+    Parquet and Feather fall back to CSV when pyarrow isn't installed. Returns the paths written.
+    """
+    if format not in EXPORT_FORMATS:
+        raise Exception("Error: Unknown export format {}, expected one of {}".format(format, ", ".join(EXPORT_FORMATS)))
+    if format != 'csv' and pyarrow is None:
+        print("pyarrow isn't installed, exporting CSV instead of {}".format(format))
+        format = 'csv'
+    base = os.path.splitext(out)[0]
+    paths = []
+    for name, columns in tables.items():
+        path = "{}_{}.{}".format(base, name, format)
+        if format == 'csv':
+            # missing values are left empty
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(list(columns))
+                writer.writerows(zip(*[report_column(np.asarray(column)) for column in columns.values()]))
+        else:
+            table = pyarrow.table({key: np.asarray(column) for key, column in columns.items()})
+            if format == 'parquet':
+                pyarrow.parquet.write_table(table, path)
+            else:
+                pyarrow.feather.write_feather(table, path)
+        paths.append(path)
+    return paths
+
+
+# the original and pruned series of one gas of a flux in long format, one column per SERIES_COLUMNS
+# values is the gas's (original, pruned, offset) series, the flux has times, H2O, time_offsets, pruned_columns and cuts
+def flux_series(flux, flux_id, gas, values):
+    n = len(flux.times)
+    original, pruned, offsets = values
+    return [[flux_id] * n, [gas] * n, flux.times, flux.pruned_columns['times'], flux.time_offsets, original,
+            pruned, offsets, flux.H2O, flux.pruned_columns['H2O'], ~flux.cuts.keep]
+
+
+def flux_tables(fluxes, results):
+    """
+    The summary and the long-format original and pruned series of every flux, as columns for export_tables.
+    results gives each flux's (gas, model, R^2, rate of change, flux, confidence interval or None, values for
+    flux_series) of every gas it was calculated for, in the order of fluxes.
+    """
+    summary = {key: [] for key in SUMMARY_COLUMNS}
+    series = {key: [] for key in SERIES_COLUMNS}
+    for flux, flux_id, gases in zip(fluxes, unique_names([flux.name for flux in fluxes]), results):
+        vol = flux.surface_area * flux.chamber_height * 1000
+        for gas, model, RSQ, RoC, value, CI, values in gases:
+            CI_low, CI_high = CI if CI else (np.nan, np.nan)
+            row = [flux_id, flux.name, gas, model, RSQ, RoC, RoC/60, value, CI_low, CI_high, vol, flux.temp, flux.data_loss]
+            for key, cell in zip(summary, row):
+                summary[key].append(cell)
+            for key, column in zip(series, flux_series(flux, flux_id, gas, values)):
+                series[key].append(column)
+    series = {key: np.concatenate(columns) if columns else [] for key, columns in series.items()}
+    return {'summary': summary, 'series': series}
+
+
+def time_to_seconds(time):
+    # converts a 24h HH:MM:SS time into seconds since midnight
+    hours, minutes, seconds = time.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def unique_names(names):
+    # worksheet style names, repeated names get a running count e.g. "C1", "C1 (2)", "C1 (3)"
+    counts = {}
+    unique = []
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+        unique.append(name if counts[name] == 1 else name + " (%s)" %(str(counts[name])))
+    return unique
+
 
+def read_cuts(cuts_file):
+    """
+    Reads per-flux cut intervals from a JSON or CSV file, keyed by worksheet style flux names.
+    JSON: {"C1 light": [[10, 20], [150, 160]], ...}, CSV: one "name,start,end" row per cut.
+    Times are in seconds on the original time axis, cuts are applied in the order they are listed.
+    """
+    cuts = {}
+    with open(cuts_file, "r", newline='') as f:
+        if cuts_file.lower().endswith(".json"):
+            for name, intervals in json.load(f).items():
+                cuts[name] = [(float(start), float(end)) for start, end in intervals]
+        else:
+            for row in csv.reader(f):
+                if not row or not row[0].strip():
+                    continue
+                try:
+                    start, end = float(row[1]), float(row[2])
+                except (ValueError, IndexError):
+                    if not cuts:    # header row
+                        continue
+                    raise Exception("Error: Invalid cut %s in %s, expected name,start,end" %(row, cuts_file))
+                cuts.setdefault(row[0].strip(), []).append((start, end))
+    return cuts